@@ -3,9 +3,26 @@ import google.generativeai as genai
 import pandas as pd
 import numpy as np
 import os
-from haversine import haversine, Unit
+import time
 from io import BytesIO
 from datetime import datetime
+from cache_analises import SEM_RESULTADO, CacheAnalises
+from cubo import construir_cubo, contagem_top, opcoes_dimensao
+from custos import detectar_duplicidades, formatar_reais, normalizar_numeros_pagamento
+from devolucao import IndiceVencidas, nome_arquivo_cliente
+from esquema import resolver_esquema
+from ingestao import COLUNA_ARQUIVO_ORIGEM, CacheColunar, CacheIngestao, carregar_com_cache, combinar_arquivos, impressao_combinada, listar_abas
+from llm import CamadaRequisicoes, ErroCotaModelo, formatar_latencia
+from mapa import ZOOM_MAXIMO, ZOOM_MINIMO, pontos_do_mapa, preparar_coordenadas_mapa, zoom_do_recorte
+from otimizador import IndiceRepresentantes, otimizar_em_lote, pontos_atendimento_por_cidade
+from perfil import perfil_dataset
+from roteador import RoteadorPerguntas
+from sandbox import ErroSandbox, SandboxPandas
+from sessao import BASES_SESSAO, ativar_copy_on_write, relatorio_memoria_sessao, visao_base
+from tabela import tabela_paginada
+
+# Seções recebem visões das bases da sessão em vez de cópias completas.
+ativar_copy_on_write()
 
 # ------------------------------------------------------------
 # CONFIGURAÇÃO DA PÁGINA
@@ -57,30 +74,135 @@ if "chat_history" not in st.session_state:
     st.session_state.chat_history = []
 if "display_history" not in st.session_state:
     st.session_state.display_history = []
+if "metricas_llm" not in st.session_state:
+    st.session_state.metricas_llm = []
 
 # DataFrames
-for df_key in ['df_dados', 'df_mapeamento', 'df_devolucao', 'df_pagamento']:
+for df_key in BASES_SESSAO:
     if df_key not in st.session_state:
         st.session_state[df_key] = None
 
+# Controle dos uploads: arquivos atuais de cada base (já lidos, por arquivo) e se vieram do cache de ingestão
+if 'arquivos_carregados' not in st.session_state:
+    st.session_state.arquivos_carregados = {}
+    st.session_state.partes_carregadas = {}
+    st.session_state.origem_carga = {}
+    st.session_state.impressoes = {}
+    st.session_state.esquemas = {}
+    st.session_state.perfis = {}
+    st.session_state.estatisticas_analise = {'chamadas_modelo': 0, 'sucesso_primeira': 0}
+    st.session_state.falhas_numericas = {}
+    st.session_state.cubo_dashboard = None
+    st.session_state.memoria_bases = {}
+
+# Índice espacial dos RTs (construído uma vez por upload do mapeamento)
+if 'indice_rt' not in st.session_state:
+    st.session_state.indice_rt = None
+
 # ------------------------------------------------------------
 # FUNÇÕES AUXILIARES
 # ------------------------------------------------------------
+LIMITE_CACHE_INGESTAO_MB = int(os.environ.get("MERCURIO_CACHE_INGESTAO_MB", "1024"))
+CAMINHO_CACHE_ANALISES = os.environ.get("MERCURIO_CACHE_ANALISES", os.path.join(".mercurio_cache", "analises.sqlite"))
+LIMITE_CACHE_ANALISES_MB = int(os.environ.get("MERCURIO_CACHE_ANALISES_MB", "256"))
+
+@st.cache_resource
+def obter_cache_ingestao():
+    return CacheIngestao(limite_bytes=LIMITE_CACHE_INGESTAO_MB * 1024 * 1024)
+
+PASTA_CACHE_PLANILHAS = os.environ.get("MERCURIO_CACHE_PLANILHAS", os.path.join(".mercurio_cache", "planilhas"))
+LIMITE_CACHE_PLANILHAS_MB = int(os.environ.get("MERCURIO_CACHE_PLANILHAS_MB", "2048"))
+
+@st.cache_resource
+def obter_cache_planilhas():
+    return CacheColunar(PASTA_CACHE_PLANILHAS, limite_bytes=LIMITE_CACHE_PLANILHAS_MB * 1024 * 1024)
+
+LLM_REQUISICOES_POR_MINUTO = int(os.environ.get("MERCURIO_LLM_RPM", "60"))
+LLM_MAX_CONCORRENTES = int(os.environ.get("MERCURIO_LLM_CONCORRENCIA", "4"))
+MENSAGEM_COTA_ESGOTADA = "O serviço de IA está com muitas requisições no momento. Aguarde alguns segundos e tente novamente."
+
+@st.cache_resource
+def obter_camada_requisicoes():
+    # Compartilhada entre todas as sessões do processo: o limite de taxa vale para a chave de API inteira.
+    return CamadaRequisicoes(por_minuto=LLM_REQUISICOES_POR_MINUTO, max_concorrentes=LLM_MAX_CONCORRENTES)
+
+SANDBOX_TRABALHADORES = int(os.environ.get("MERCURIO_SANDBOX_TRABALHADORES", "2"))
+SANDBOX_TEMPO_LIMITE_S = float(os.environ.get("MERCURIO_SANDBOX_TEMPO_S", "20"))
+SANDBOX_MEMORIA_MB = int(os.environ.get("MERCURIO_SANDBOX_MEMORIA_MB", "2048"))
+
+@st.cache_resource
+def obter_sandbox():
+    return SandboxPandas(trabalhadores=SANDBOX_TRABALHADORES, tempo_limite_s=SANDBOX_TEMPO_LIMITE_S, limite_memoria_mb=SANDBOX_MEMORIA_MB)
+
+@st.cache_resource
+def obter_roteador():
+    return RoteadorPerguntas()
+
+def bases_para_roteador():
+    return {df_key: (st.session_state[df_key], st.session_state.esquemas.get(df_key, {}), st.session_state.impressoes.get(df_key))
+            for df_key in ['df_dados', 'df_pagamento'] if st.session_state[df_key] is not None}
+
+@st.cache_resource
+def obter_cache_analises():
+    return CacheAnalises(CAMINHO_CACHE_ANALISES, limite_bytes=LIMITE_CACHE_ANALISES_MB * 1024 * 1024)
+
 @st.cache_data
 def convert_df_to_csv(df):
     return df.to_csv(index=False, sep=';').encode('utf-8-sig')
 
-def safe_to_numeric(series):
-    if series.dtype == 'object':
-        series = series.astype(str).str.replace('R$', '', regex=False).str.replace('.', '', regex=False).str.replace(',', '.', regex=False).str.strip()
-    return pd.to_numeric(series, errors='coerce').fillna(0)
-
-@st.cache_data(ttl=3600)
-def executar_analise_pandas(_df_hash, pergunta, df_type):
+@st.cache_data
+def convert_df_to_excel(df):
+    buffer = BytesIO()
+    df.to_excel(buffer, index=False, engine='openpyxl')
+    return buffer.getvalue()
+
+def identificar_arquivo(arquivo):
+    return getattr(arquivo, 'file_id', None) or (arquivo.name, arquivo.size)
+
+@st.cache_data(max_entries=32)
+def abas_da_planilha(identificacao, _arquivo):
+    # Só os nomes das abas (nenhuma planilha é carregada), uma vez por arquivo anexado.
+    return listar_abas(_arquivo)
+
+@st.cache_data(max_entries=32)
+def perfil_em_cache(impressao, _df):
+    # Uma vez por conteúdo de arquivo, mesmo entre sessões e reenvios do mesmo arquivo.
+    return perfil_dataset(_df)
+
+def preparar_base(df_key, df, impressao):
+    # Etapas executadas uma única vez por upload, antes de a base ir para a sessão.
+    esquema = resolver_esquema(df.columns, df_key)
+    st.session_state.esquemas[df_key] = esquema
+    if df_key == 'df_dados':
+        st.session_state.cubo_dashboard = construir_cubo(df, esquema)
+    if df_key == 'df_mapeamento' and esquema.get('lat_atendimento') and esquema.get('lon_atendimento'):
+        df = preparar_coordenadas_mapa(df, esquema['lat_atendimento'], esquema['lon_atendimento'])
+    if df_key in ('df_dados', 'df_mapeamento'):
+        st.session_state.perfis[df_key] = perfil_em_cache(impressao, df)
+    if df_key == 'df_pagamento':
+        df, st.session_state.falhas_numericas = normalizar_numeros_pagamento(df, esquema)
+    return df
+
+def executar_analise_pandas(impressao, pergunta, df_type):
+    # A impressão vem do hash do arquivo calculado no upload: perguntas repetidas sobre a mesma base
+    # são respondidas pelo cache em disco, sem chamar o modelo nem varrer o DataFrame.
     df = st.session_state.df_dados if df_type == 'dados' else st.session_state.df_mapeamento
+    cache_analises = obter_cache_analises()
+    em_cache = cache_analises.obter(impressao, pergunta)
+    if em_cache is not None:
+        expressao, resultado = em_cache
+        if expressao == "PERGUNTA_INVALIDA":
+            return None, "PERGUNTA_INVALIDA"
+        if resultado is not SEM_RESULTADO:
+            return resultado, None
+        try:
+            return obter_sandbox().executar(impressao, df, expressao), None
+        except Exception as e:
+            return None, f"Ocorreu um erro ao executar a análise: {e}"
     prompt_engenharia = f"""
     Você é um assistente especialista em Python e Pandas. Sua tarefa é analisar a pergunta do usuário.
-    As colunas disponíveis no dataframe `df` são: {', '.join(df.columns)}.
+    Perfil do dataframe `df` (use exatamente estes nomes de coluna, tipos e grafias de valores):
+{st.session_state.perfis.get(f"df_{df_type}") or ', '.join(df.columns)}
 
     INSTRUÇÕES:
     1. Determine se a pergunta do usuário PODE ser respondida usando os dados.
@@ -90,36 +212,28 @@ def executar_analise_pandas(_df_hash, pergunta, df_type):
     Pergunta: "{pergunta}"
     Sua resposta:
     """
+    estatisticas = st.session_state.estatisticas_analise
     try:
-        response = st.session_state.model.generate_content(prompt_engenharia)
+        response = obter_camada_requisicoes().executar(api_key, st.session_state.model.generate_content, prompt_engenharia,
+                                                       chave_dedup=(modelo_padrao, prompt_engenharia))
         resposta_ia = response.text.strip().replace('`', '').replace('python', '')
         if resposta_ia == "PERGUNTA_INVALIDA":
+            cache_analises.guardar(impressao, pergunta, resposta_ia)
             return None, "PERGUNTA_INVALIDA"
-        resultado = eval(resposta_ia, {'df': df, 'pd': pd, 'np': np})
+        # Taxa de acerto na primeira chamada: o código gerado rodou sem erro.
+        estatisticas['chamadas_modelo'] += 1
+        # O código gerado roda isolado (tempo, memória e operações limitados), nunca no processo do Streamlit.
+        resultado = obter_sandbox().executar(impressao, df, resposta_ia)
+        estatisticas['sucesso_primeira'] += 1
+        cache_analises.guardar(impressao, pergunta, resposta_ia, resultado)
         return resultado, None
+    except ErroCotaModelo:
+        return None, MENSAGEM_COTA_ESGOTADA
+    except ErroSandbox as e:
+        return None, f"A análise gerada não pôde ser executada com segurança: {e}"
     except Exception as e:
         return None, f"Ocorreu um erro ao executar a análise: {e}"
 
-def carregar_dataframe(arquivo, separador_padrao=','):
-    nome_arquivo = arquivo.name.lower()
-    if nome_arquivo.endswith('.xlsx'):
-        return pd.read_excel(arquivo, engine='openpyxl')
-    elif nome_arquivo.endswith('.xls'):
-        return pd.read_excel(arquivo, engine='xlrd')
-    elif nome_arquivo.endswith('.csv'):
-        try:
-            arquivo.seek(0)
-            df = pd.read_csv(arquivo, encoding='latin-1', sep=separador_padrao, on_bad_lines='skip')
-            if len(df.columns) > 1:
-                return df
-        except Exception:
-            pass
-        arquivo.seek(0)
-        outro_separador = ',' if separador_padrao == ';' else ';'
-        df = pd.read_csv(arquivo, encoding='latin-1', sep=outro_separador, on_bad_lines='skip')
-        return df
-    return None
-
 def detectar_tipo_pergunta(texto):
     if not texto:
         return "geral"
@@ -137,41 +251,89 @@ def detectar_tipo_pergunta(texto):
 with st.sidebar:
     st.header("Base de Conhecimento")
     tipos_permitidos = ["csv", "xlsx", "xls"]
+    leitura_economica = st.checkbox("Leitura econômica (em blocos, só colunas usadas)", help="Ativada automaticamente para arquivos acima de 100 MB.")
 
-    data_file = st.file_uploader("1. 📊 Upload Pesquisa de O.S (OS)", type=tipos_permitidos)
-    if data_file:
-        try:
-            st.session_state.df_dados = carregar_dataframe(data_file, separador_padrao=';')
-            st.success("Agendamentos carregados!")
-        except Exception as e:
-            st.error(f"Erro nos dados: {e}")
-
-    st.markdown("---")
-    map_file = st.file_uploader("2. 🌍 Upload do Mapeamento de RT (Fixo)", type=tipos_permitidos)
-    if map_file:
-        try:
-            st.session_state.df_mapeamento = carregar_dataframe(map_file, separador_padrao=',')
-            st.success("Mapeamento carregado!")
-        except Exception as e:
-            st.error(f"Erro no mapeamento: {e}")
-
-    st.markdown("---")
-    devolucao_file = st.file_uploader("3. 📥 Upload de Itens a Instalar (Devolução)", type=tipos_permitidos)
-    if devolucao_file:
-        try:
-            st.session_state.df_devolucao = carregar_dataframe(devolucao_file, separador_padrao=';')
-            st.success("Base de devolução carregada!")
-        except Exception as e:
-            st.error(f"Erro na base de devolução: {e}")
-
-    st.markdown("---")
-    pagamento_file = st.file_uploader("4. 💵 Upload da Base de Pagamento (Duplicidade)", type=tipos_permitidos)
-    if pagamento_file:
-        try:
-            st.session_state.df_pagamento = carregar_dataframe(pagamento_file, separador_padrao=';')
-            st.success("Base de pagamento carregada!")
-        except Exception as e:
-            st.error(f"Erro na base de pagamento: {e}")
+    bases_upload = [
+        ('df_dados', "1. 📊 Upload Pesquisa de O.S (OS)", ';', "Agendamentos carregados!", "Erro nos dados"),
+        ('df_mapeamento', "2. 🌍 Upload do Mapeamento de RT (Fixo)", ',', "Mapeamento carregado!", "Erro no mapeamento"),
+        ('df_devolucao', "3. 📥 Upload de Itens a Instalar (Devolução)", ';', "Base de devolução carregada!", "Erro na base de devolução"),
+        ('df_pagamento', "4. 💵 Upload da Base de Pagamento (Duplicidade)", ';', "Base de pagamento carregada!", "Erro na base de pagamento"),
+    ]
+    for indice_base, (df_key, rotulo, separador, mensagem_sucesso, mensagem_erro) in enumerate(bases_upload):
+        if indice_base > 0:
+            st.markdown("---")
+        arquivos = st.file_uploader(rotulo, type=tipos_permitidos, accept_multiple_files=True, key=f"upload_{df_key}")
+        if arquivos:
+            try:
+                # Cada arquivo é lido uma única vez; os já lidos (mesmo anexo, modo e aba) são reaproveitados da sessão.
+                partes_anteriores = st.session_state.partes_carregadas.get(df_key, {})
+                partes = {}
+                for arquivo in arquivos:
+                    aba = None
+                    if arquivo.name.lower().endswith(('.xlsx', '.xls')):
+                        abas = abas_da_planilha(identificar_arquivo(arquivo), arquivo)
+                        if len(abas) > 1:
+                            aba = st.selectbox(f"Aba de {arquivo.name}:", abas, key=f"{df_key}_aba_{identificar_arquivo(arquivo)}")
+                        else:
+                            aba = next(iter(abas), None)
+                    chave_parte = (identificar_arquivo(arquivo), leitura_economica, aba)
+                    parte = partes_anteriores.get(chave_parte)
+                    if parte is None:
+                        barra_progresso = st.empty()
+                        df_parte, origem_parte, impressao_parte = carregar_com_cache(
+                            obter_cache_ingestao(), arquivo, separador_padrao=separador, tipo_base=df_key,
+                            em_blocos=True if leitura_economica else None,
+                            ao_progredir=lambda fracao: barra_progresso.progress(fracao, text=f"Lendo {arquivo.name}... {fracao:.0%}"),
+                            aba=aba, cache_disco=obter_cache_planilhas())
+                        barra_progresso.empty()
+                        parte = {'nome': arquivo.name, 'df': df_parte, 'origem': origem_parte,
+                                 'impressao': f"{impressao_parte}:{df_key}:{int(leitura_economica)}" + (f":{aba}" if aba else "")}
+                    partes[chave_parte] = parte
+                # A base só é recombinada quando o conjunto de arquivos (ou suas abas) muda.
+                identificacao = tuple(partes)
+                if st.session_state.arquivos_carregados.get(df_key) != identificacao:
+                    validas = [parte for parte in partes.values() if parte['df'] is not None]
+                    impressao = impressao_combinada([parte['impressao'] for parte in validas]) if validas else None
+                    df_combinado = combinar_arquivos([(parte['nome'], parte['df']) for parte in validas], df_key) if validas else None
+                    st.session_state[df_key] = preparar_base(df_key, df_combinado, impressao) if df_combinado is not None else None
+                    st.session_state.arquivos_carregados[df_key] = identificacao
+                    st.session_state.partes_carregadas[df_key] = partes
+                    st.session_state.origem_carga[df_key] = validas[0]['origem'] if len(validas) == 1 else f"{len(validas)} arquivos"
+                    st.session_state.impressoes[df_key] = impressao
+                    if df_key == 'df_mapeamento':
+                        st.session_state.indice_rt = None
+                st.success(f"{mensagem_sucesso} ({st.session_state.origem_carga[df_key]})")
+                atributos = st.session_state[df_key].attrs if st.session_state[df_key] is not None else {}
+                dialeto = atributos.get('dialeto')
+                if dialeto:
+                    st.caption(f"CSV: separador {dialeto.separador!r}, codificação {dialeto.encoding}, decimal {dialeto.decimal!r}, cabeçalho na linha {dialeto.linha_cabecalho + 1}")
+                memoria = atributos.get('memoria')
+                if memoria and memoria['antes']:
+                    economia_memoria = 1 - memoria['depois'] / memoria['antes']
+                    st.caption(f"Memória: {memoria['antes'] / 1024 ** 2:.1f} MB → {memoria['depois'] / 1024 ** 2:.1f} MB ({economia_memoria:.0%} economizados)")
+                formatos_data = atributos.get('formatos_data')
+                if formatos_data:
+                    st.caption("Datas: " + ", ".join(f"{col} ({formato})" for col, formato in formatos_data.items()))
+                for col, total in (atributos.get('datas_nao_convertidas') or {}).items():
+                    st.warning(f"{total} valor(es) de '{col}' não foram reconhecidos como data e ficaram em branco.")
+                partes_base = st.session_state.partes_carregadas.get(df_key, {})
+                if len(partes_base) > 1:
+                    st.caption("Arquivos: " + "; ".join(f"{parte['nome']} ({len(parte['df']) if parte['df'] is not None else 0} linhas, {parte['origem']})" for parte in partes_base.values()))
+                    if atributos.get('linhas_substituidas'):
+                        st.caption(f"{atributos['linhas_substituidas']} linha(s) substituídas por O.S. repetidas em arquivos enviados depois.")
+            except Exception as e:
+                st.session_state.arquivos_carregados.pop(df_key, None)
+                st.session_state.partes_carregadas.pop(df_key, None)
+                st.error(f"{mensagem_erro}: {e}")
+
+    cache_ingestao = obter_cache_ingestao()
+    st.caption(f"Cache de ingestão: {len(cache_ingestao)} arquivo(s), {cache_ingestao.uso_bytes / 1024 ** 2:.1f} MB de {LIMITE_CACHE_INGESTAO_MB} MB")
+    cache_planilhas = obter_cache_planilhas()
+    st.caption(f"Cache de planilhas em disco: {len(cache_planilhas)} aba(s), {cache_planilhas.uso_bytes / 1024 ** 2:.1f} MB de {LIMITE_CACHE_PLANILHAS_MB} MB")
+    relatorio_memoria = relatorio_memoria_sessao(st.session_state, st.session_state.memoria_bases)
+    if not relatorio_memoria.empty:
+        with st.expander(f"Memória da sessão: {relatorio_memoria['Memória (MB)'].sum():.1f} MB"):
+            st.dataframe(relatorio_memoria, hide_index=True, column_config={'Memória (MB)': st.column_config.NumberColumn(format="%.1f")})
 
     if st.button("Limpar Tudo"):
         st.session_state.clear()
@@ -185,65 +347,60 @@ with st.sidebar:
 if st.session_state.df_dados is not None:
     st.markdown("---")
     st.header("📊 Dashboard de Análise de Ordens de Serviço")
-    df_dados_original = st.session_state.df_dados.copy()
-    df_analise = df_dados_original.copy()
+    df_dados_original = st.session_state.df_dados
+    cubo = st.session_state.cubo_dashboard
 
-    status_col = next((col for col in df_analise.columns if 'status' in col.lower()), None)
-
-    rep_col_dados = next((col for col in df_analise.columns if 'representante técnico' in col.lower() and 'id' not in col.lower()), None)
-    if not rep_col_dados:
-        rep_col_dados = next((col for col in df_analise.columns if 'representante' in col.lower() and 'id' not in col.lower()), None)
-
-    city_col_dados = next((col for col in df_analise.columns if 'cidade agendamento' in col.lower() or 'cidade o.s.' in col.lower()), None)
-    motivo_fechamento_col = next((col for col in df_analise.columns if 'tipo de fechamento' in col.lower()), None)
-    cliente_col = next((col for col in df_analise.columns if 'cliente' in col.lower() and 'id' not in col.lower()), None)
+    esquema_dados = st.session_state.esquemas.get('df_dados', {})
+    status_col = esquema_dados.get('status')
+    rep_col_dados = esquema_dados.get('representante')
+    city_col_dados = esquema_dados.get('cidade')
+    motivo_fechamento_col = esquema_dados.get('tipo_fechamento')
+    cliente_col = esquema_dados.get('cliente')
 
     st.subheader("Filtros de Análise")
     col_filtro1, col_filtro2 = st.columns(2)
 
     status_selecionado = None
     if status_col:
-        opcoes_status = ["Exibir Todos"] + sorted(df_analise[status_col].dropna().unique())
+        opcoes_status = ["Exibir Todos"] + opcoes_dimensao(cubo, status_col)
         status_selecionado = col_filtro1.selectbox("Filtrar por Status:", options=opcoes_status)
 
     fechamento_selecionado = None
     if motivo_fechamento_col:
-        opcoes_fechamento = ["Exibir Todos"] + sorted(df_analise[motivo_fechamento_col].dropna().unique())
+        opcoes_fechamento = ["Exibir Todos"] + opcoes_dimensao(cubo, motivo_fechamento_col)
         fechamento_selecionado = col_filtro2.selectbox("Filtrar por Tipo de Fechamento:", options=opcoes_fechamento)
 
+    filtros_cubo = []
     if status_selecionado and status_selecionado != "Exibir Todos":
-        df_analise = df_analise[df_analise[status_col] == status_selecionado]
+        filtros_cubo.append((status_col, status_selecionado))
     if fechamento_selecionado and fechamento_selecionado != "Exibir Todos":
-        df_analise = df_analise[df_analise[motivo_fechamento_col] == fechamento_selecionado]
+        filtros_cubo.append((motivo_fechamento_col, fechamento_selecionado))
 
     st.subheader("Análises Gráficas")
     col1, col2 = st.columns(2)
     with col1:
         st.write("**Ordens Agendadas por Cidade (Top 10)**")
         if status_col and city_col_dados:
-            agendadas_df = df_analise[df_analise[status_col] == 'Agendada']
-            st.bar_chart(agendadas_df[city_col_dados].value_counts().nlargest(10))
+            st.bar_chart(contagem_top(cubo, city_col_dados, filtros_cubo + [(status_col, 'Agendada')]))
         else:
             st.warning("Colunas 'Status' ou 'Cidade Agendamento' não encontradas.")
 
         st.write("**Ordens Realizadas por RT (Top 10)**")
         if status_col and rep_col_dados:
-            realizadas_df = df_analise[df_analise[status_col] == 'Realizada']
-            st.bar_chart(realizadas_df[rep_col_dados].value_counts().nlargest(10))
+            st.bar_chart(contagem_top(cubo, rep_col_dados, filtros_cubo + [(status_col, 'Realizada')]))
         else:
             st.warning("Colunas 'Status' ou 'Representante Técnico' não encontradas.")
 
     with col2:
         st.write("**Total de Ordens por RT (Top 10)**")
         if rep_col_dados:
-            st.bar_chart(df_analise[rep_col_dados].value_counts().nlargest(10))
+            st.bar_chart(contagem_top(cubo, rep_col_dados, filtros_cubo))
         else:
             st.warning("Coluna 'Representante Técnico' não encontrada.")
 
         st.write("**Indisponibilidades (Visitas Improdutivas) por RT (Top 10)**")
         if motivo_fechamento_col and rep_col_dados:
-            improdutivas_df = df_analise[df_analise[motivo_fechamento_col] == 'Visita Improdutiva']
-            st.bar_chart(improdutivas_df[rep_col_dados].value_counts().nlargest(10))
+            st.bar_chart(contagem_top(cubo, rep_col_dados, filtros_cubo + [(motivo_fechamento_col, 'Visita Improdutiva')]))
         else:
             st.warning("Colunas 'Tipo de Fechamento' ou 'Representante Técnico' não encontradas.")
 
@@ -252,19 +409,18 @@ if st.session_state.df_dados is not None:
     with col3:
         st.write("**Distribuição por Tipo de Fechamento (Top 10)**")
         if motivo_fechamento_col:
-            st.bar_chart(df_analise[motivo_fechamento_col].value_counts().nlargest(10))
+            st.bar_chart(contagem_top(cubo, motivo_fechamento_col, filtros_cubo))
         else:
             st.warning("Coluna 'Tipo de Fechamento' não encontrada.")
     with col4:
         st.write("**Visitas Improdutivas por Cliente (Top 10)**")
         if motivo_fechamento_col and cliente_col:
-            improdutivas_por_cliente_df = df_analise[df_analise[motivo_fechamento_col] == 'Visita Improdutiva']
-            st.bar_chart(improdutivas_por_cliente_df[cliente_col].value_counts().nlargest(10))
+            st.bar_chart(contagem_top(cubo, cliente_col, filtros_cubo + [(motivo_fechamento_col, 'Visita Improdutiva')]))
         else:
             st.warning("Colunas 'Tipo de Fechamento' ou 'Cliente' não encontradas.")
 
     with st.expander("Ver tabela de dados completa (original, sem filtros)"):
-        st.dataframe(df_dados_original)
+        tabela_paginada(df_dados_original, 'tabela_dados', versao=st.session_state.impressoes.get('df_dados'))
 
 # --- ANALISADOR DE CUSTOS E DUPLICIDADE (Usa df_pagamento) ---
 if st.session_state.df_pagamento is not None:
@@ -272,32 +428,37 @@ if st.session_state.df_pagamento is not None:
     st.header("🔎 Analisador de Custos e Duplicidade de Deslocamento")
     with st.expander("Clique aqui para analisar custos e duplicidades da Base de Pagamento", expanded=True):
         try:
-            df_custos = st.session_state.df_pagamento.copy()
-            os_col = next((col for col in df_custos.columns if 'os' in col.lower()), None)
-            data_fech_col = next((col for col in df_custos.columns if 'data de fechamento' in col.lower()), None)
-            cidade_os_col = next((col for col in df_custos.columns if 'cidade o.s.' in col.lower()), None)
-            cidade_rt_col = next((col for col in df_custos.columns if 'cidade rt' in col.lower()), None)
-            rep_col = next((col for col in df_custos.columns if 'representante' in col.lower() and 'nome fantasia' not in col.lower()), None)
-            tec_col = next((col for col in df_custos.columns if 'técnico' in col.lower()), None)
-            valor_desl_col = next((col for col in df_custos.columns if 'valor deslocamento' in col.lower()), None)
-            desloc_km_col = next((col for col in df_custos.columns if col.lower() == 'deslocamento'), None)
-            valor_km_col = next((col for col in df_custos.columns if 'valor km rt' in col.lower()), None)
-            abrang_col = next((col for col in df_custos.columns if 'abrangência rt' in col.lower()), None)
-            valor_extra_col = next((col for col in df_custos.columns if 'valor extra' in col.lower()), None)
-            pedagio_col = next((col for col in df_custos.columns if 'pedágio' in col.lower()), None)
+            esquema_pagamento = st.session_state.esquemas.get('df_pagamento', {})
+            os_col = esquema_pagamento.get('os_id')
+            data_fech_col = esquema_pagamento.get('data_fechamento')
+            cidade_os_col = esquema_pagamento.get('cidade_os')
+            cidade_rt_col = esquema_pagamento.get('cidade_rt')
+            rep_col = esquema_pagamento.get('representante')
+            tec_col = esquema_pagamento.get('tecnico')
+            valor_desl_col = esquema_pagamento.get('valor_deslocamento')
+            desloc_km_col = esquema_pagamento.get('deslocamento_km')
+            valor_km_col = esquema_pagamento.get('valor_km')
+            abrang_col = esquema_pagamento.get('abrangencia')
+            valor_extra_col = esquema_pagamento.get('valor_extra')
+            pedagio_col = esquema_pagamento.get('pedagio')
             required_cols_custos = [os_col, data_fech_col, cidade_os_col, cidade_rt_col, rep_col, tec_col, valor_desl_col, desloc_km_col, valor_km_col, abrang_col, valor_extra_col, pedagio_col]
             if all(required_cols_custos):
-                df_custos['VALOR_DESLOC_ORIGINAL'] = safe_to_numeric(df_custos[valor_desl_col])
-                df_custos['VALOR_EXTRA_NUM'] = safe_to_numeric(df_custos[valor_extra_col])
-                df_custos['PEDAGIO_NUM'] = safe_to_numeric(df_custos[pedagio_col])
+                # Subconjunto estreito: só as colunas do esquema e as numéricas criadas no upload.
+                df_custos = visao_base(st.session_state.df_pagamento, [os_col, data_fech_col, cidade_os_col, cidade_rt_col, rep_col, tec_col,
+                                                                        'VALOR_DESLOC_ORIGINAL', 'VALOR_EXTRA_NUM', 'PEDAGIO_NUM', 'DESLOC_KM_NUM', 'VALOR_KM_NUM', 'ABRANG_NUM', COLUNA_ARQUIVO_ORIGEM])
+                if st.session_state.falhas_numericas:
+                    st.warning("Alguns valores da base de pagamento não são números válidos e foram tratados como 0 nos cálculos: " + ", ".join(f"{col}: {info['quantidade']}" for col, info in st.session_state.falhas_numericas.items()))
+                    with st.expander("Ver exemplos de valores não convertidos"):
+                        for col, info in st.session_state.falhas_numericas.items():
+                            st.write(f"**{col}:** " + " | ".join(info['exemplos']))
                 filtro_custos_positivos_mask = ((df_custos['VALOR_DESLOC_ORIGINAL'] > 0) | (df_custos['VALOR_EXTRA_NUM'] > 0) | (df_custos['PEDAGIO_NUM'] > 0))
-                df_custos = df_custos[filtro_custos_positivos_mask].copy()
+                df_custos = df_custos[filtro_custos_positivos_mask]
                 if df_custos.empty:
                     st.success("✅ Nenhuma ordem com custos de deslocamento, extra ou pedágio foi encontrada para análise.")
                     st.stop()
-                df_custos['DATA_ANALISE'] = pd.to_datetime(df_custos[data_fech_col], dayfirst=True, errors='coerce').dt.date
+                df_custos['DATA_ANALISE'] = df_custos[data_fech_col].dt.date
                 st.subheader("Filtros da Análise")
-                df_filtrado = df_custos.copy()
+                df_filtrado = df_custos
                 col1_filtro, col2_filtro = st.columns(2)
                 datas_disponiveis = df_filtrado['DATA_ANALISE'].dropna()
                 if not datas_disponiveis.empty:
@@ -316,17 +477,14 @@ if st.session_state.df_pagamento is not None:
                     st.warning("Nenhum dado encontrado com os filtros selecionados.")
                     st.stop()
                 for col in [cidade_os_col, rep_col, tec_col, cidade_rt_col]:
-                    if col in df_filtrado.columns and df_filtrado[col].dtype == 'object':
+                    if col in df_filtrado.columns and (df_filtrado[col].dtype == 'object' or isinstance(df_filtrado[col].dtype, pd.CategoricalDtype)):
                         df_filtrado[col] = df_filtrado[col].str.strip()
-                df_filtrado['DESLOC_KM_NUM'] = safe_to_numeric(df_filtrado[desloc_km_col])
-                df_filtrado['VALOR_KM_NUM'] = safe_to_numeric(df_filtrado[valor_km_col])
-                df_filtrado['ABRANG_NUM'] = safe_to_numeric(df_filtrado[abrang_col])
                 mesma_cidade_mask = df_filtrado[cidade_rt_col] == df_filtrado[cidade_os_col]
-                valor_calculado = (df_filtrado['DESLOC_KM_NUM'] * df_filtrado['VALOR_KM_NUM']) - df_filtrado['ABRANG_NUM']
+                valor_calculado = (df_filtrado['DESLOC_KM_NUM'].fillna(0) * df_filtrado['VALOR_KM_NUM'].fillna(0)) - df_filtrado['ABRANG_NUM'].fillna(0)
                 valor_calculado[valor_calculado < 0] = 0
                 df_filtrado['VALOR_CALCULADO'] = np.where(mesma_cidade_mask, 0, valor_calculado)
                 df_filtrado['OBSERVACAO'] = np.where(mesma_cidade_mask, "Custo Zerado (Mesma Cidade)", "")
-                df_filtrado[data_fech_col] = pd.to_datetime(df_filtrado[data_fech_col], errors='coerce').dt.strftime('%d/%m/%Y')
+                df_filtrado[data_fech_col] = df_filtrado[data_fech_col].dt.strftime('%d/%m/%Y')
                 st.subheader("Resultados da Análise")
                 st.write("Ordens com Deslocamento Zerado (Cidade RT = Cidade O.S.)")
                 df_custo_zero = df_filtrado[mesma_cidade_mask]
@@ -336,18 +494,20 @@ if st.session_state.df_pagamento is not None:
                     st.info("Nenhuma ordem com Cidade RT = Cidade O.S. nos filtros selecionados.")
                 st.write("Análise de Duplicidade de Deslocamento")
                 group_keys = ['DATA_ANALISE', cidade_os_col, rep_col, tec_col]
-                df_filtrado['is_first'] = ~df_filtrado.duplicated(subset=group_keys, keep='first')
-                grupos_com_duplicatas = df_filtrado.groupby(group_keys).filter(lambda x: len(x) > 1)
-                if grupos_com_duplicatas.empty:
+                df_resultado_final, resumo_duplicidades = detectar_duplicidades(df_filtrado, group_keys, os_col)
+                if df_resultado_final.empty:
                     st.success("✅ Nenhuma duplicidade de deslocamento encontrada nos filtros selecionados.")
                 else:
-                    grupos_com_duplicatas['VALOR_CALCULADO_AJUSTADO'] = np.where(grupos_com_duplicatas['is_first'], grupos_com_duplicatas['VALOR_CALCULADO'], 0)
-                    grupos_com_duplicatas['OBSERVACAO'] = np.where(grupos_com_duplicatas['is_first'], grupos_com_duplicatas['OBSERVACAO'], "Duplicidade (Custo Zerado)")
-                    df_resultado_final = grupos_com_duplicatas.sort_values(by=group_keys + [os_col])
-                    cols_to_show = [os_col, data_fech_col, cidade_os_col, rep_col, tec_col, 'VALOR_DESLOC_ORIGINAL', 'VALOR_CALCULADO_AJUSTADO', 'OBSERVACAO']
+                    col_dup1, col_dup2, col_dup3 = st.columns(3)
+                    col_dup1.metric("Grupos com duplicidade", len(resumo_duplicidades))
+                    col_dup2.metric("Ordens duplicadas (custo zerado)", int(resumo_duplicidades['Duplicidades'].sum()))
+                    col_dup3.metric("Valor zerado", formatar_reais(resumo_duplicidades['Valor Zerado'].sum()))
+                    cols_to_show = [os_col, data_fech_col, cidade_os_col, rep_col, tec_col, 'VALOR_DESLOC_ORIGINAL', 'VALOR_CALCULADO_AJUSTADO', 'OBSERVACAO', COLUNA_ARQUIVO_ORIGEM]
                     st.dataframe(df_resultado_final[cols_to_show])
                     csv_duplicatas = convert_df_to_csv(df_resultado_final[cols_to_show])
                     st.download_button(label="📥 Exportar Resultado da Duplicidade (.csv)", data=csv_duplicatas, file_name="analise_duplicidade_deslocamento.csv", mime='text/csv')
+                    with st.expander("Totais por grupo de duplicidade"):
+                        st.dataframe(resumo_duplicidades, hide_index=True)
             else:
                 st.error("ERRO: Para usar esta análise, a planilha de pagamento precisa conter todas as seguintes colunas: 'OS', 'Data de Fechamento', 'Cidade O.S.', 'Cidade RT', 'Representante', 'Técnico', 'Valor Deslocamento', 'Deslocamento', 'Valor KM RT', 'AC Abrangência RT', 'Valor Extra', e 'Pedágio'.")
         except Exception as e:
@@ -357,26 +517,47 @@ if st.session_state.df_pagamento is not None:
 if st.session_state.df_devolucao is not None:
     st.markdown("---")
     st.header("📦 Ferramenta de Devolução de Ordens Vencidas")
-    df_devolucao = st.session_state.df_devolucao.copy()
-    date_col_devolucao = next((col for col in df_devolucao.columns if 'prazoinstalacao' in col.lower().replace(' ', '')), None)
-    cliente_col_devolucao = next((col for col in df_devolucao.columns if 'clientenome' in col.lower().replace(' ', '')), None)
-    if date_col_devolucao and cliente_col_devolucao:
-        df_devolucao[date_col_devolucao] = pd.to_datetime(df_devolucao[date_col_devolucao], dayfirst=True, errors='coerce')
-        df_devolucao.dropna(subset=[date_col_devolucao], inplace=True)
+    df_devolucao = st.session_state.df_devolucao
+    esquema_devolucao = st.session_state.esquemas.get('df_devolucao', {})
+    date_col_devolucao = esquema_devolucao.get('prazo_instalacao')
+    cliente_col_devolucao = esquema_devolucao.get('cliente')
+    if date_col_devolucao and cliente_col_devolucao and pd.api.types.is_datetime64_any_dtype(df_devolucao[date_col_devolucao].dtype):
+        # Índice de vencidas por cliente: refeito só quando a base ou o dia mudam.
         hoje = pd.Timestamp.now().normalize()
-        df_vencidas = df_devolucao[df_devolucao[date_col_devolucao] < hoje].copy()
-        if df_vencidas.empty:
+        chave_indice = (st.session_state.impressoes.get('df_devolucao'), hoje)
+        if st.session_state.get('indice_vencidas', (None, None))[0] != chave_indice:
+            st.session_state.indice_vencidas = (chave_indice, IndiceVencidas(df_devolucao, date_col_devolucao, cliente_col_devolucao, hoje))
+            st.session_state.pop('zip_devolucao', None)
+        indice_vencidas = st.session_state.indice_vencidas[1]
+        colunas_exportacao = list(df_devolucao.columns)
+        if indice_vencidas.total == 0:
             st.info("Nenhuma ordem de serviço vencida encontrada na base de dados carregada.")
         else:
-            st.warning(f"Foram encontradas {len(df_vencidas)} ordens vencidas no total.")
-            clientes_vencidos = sorted(df_vencidas[cliente_col_devolucao].dropna().unique())
-            cliente_selecionado = st.selectbox("Pesquise ou selecione um cliente para filtrar as devoluções:", options=clientes_vencidos, index=None, placeholder="Selecione um cliente...")
+            st.warning(f"Foram encontradas {indice_vencidas.total} ordens vencidas no total.")
+            with st.expander("Envelhecimento das ordens vencidas (dias de atraso)"):
+                st.bar_chart(indice_vencidas.envelhecimento().set_index('Atraso'))
+                if indice_vencidas.sem_cliente:
+                    st.caption(f"{indice_vencidas.sem_cliente} ordem(ns) vencida(s) sem cliente informado ficam fora das devolutivas.")
+
+            st.subheader("Devolutivas de todos os clientes")
+            col_formato, col_gerar = st.columns([1, 2])
+            formato_zip = col_formato.radio("Formato dos arquivos:", options=['csv', 'xlsx'], horizontal=True, key='formato_zip_devolucao')
+            if col_gerar.button(f"Gerar ZIP com {len(indice_vencidas.clientes)} devolutivas"):
+                with st.spinner("Gerando arquivos..."):
+                    st.session_state.zip_devolucao = (formato_zip, indice_vencidas.exportar_zip(colunas_exportacao, formato=formato_zip))
+            zip_gerado = st.session_state.get('zip_devolucao')
+            if zip_gerado is not None:
+                st.download_button(label=f"📥 Baixar devolutivas ({zip_gerado[0].upper()}, .zip)", data=zip_gerado[1],
+                                   file_name=f"devolutivas_{hoje:%Y%m%d}_{zip_gerado[0]}.zip", mime='application/zip')
+
+            cliente_selecionado = st.selectbox("Pesquise ou selecione um cliente para filtrar as devoluções:", options=indice_vencidas.clientes, index=None, placeholder="Selecione um cliente...")
             if cliente_selecionado:
-                df_filtrado_cliente = df_vencidas[df_vencidas[cliente_col_devolucao] == cliente_selecionado]
+                df_filtrado_cliente = indice_vencidas.ordens_do_cliente(cliente_selecionado, colunas_exportacao)
                 st.metric(label=f"Total de Ordens Vencidas para", value=cliente_selecionado, delta=f"{len(df_filtrado_cliente)} ordens", delta_color="inverse")
-                st.dataframe(df_filtrado_cliente)
+                st.dataframe(indice_vencidas.envelhecimento(cliente_selecionado), hide_index=True)
+                tabela_paginada(df_filtrado_cliente, 'tabela_devolucao', versao=(chave_indice, cliente_selecionado))
                 csv = convert_df_to_csv(df_filtrado_cliente)
-                st.download_button(label="📥 Exportar Devolutiva (.csv)", data=csv, file_name=f"devolutiva_{cliente_selecionado.replace(' ', '_').lower()}.csv", mime='text/csv')
+                st.download_button(label="📥 Exportar Devolutiva (.csv)", data=csv, file_name=f"devolutiva_{nome_arquivo_cliente(cliente_selecionado)}.csv", mime='text/csv')
     else:
         st.error("ERRO: Verifique se a planilha de devolução contém as colunas 'PrazoInstalacao' e 'ClienteNome'.")
 
@@ -384,9 +565,10 @@ if st.session_state.df_devolucao is not None:
 if st.session_state.df_mapeamento is not None:
     st.markdown("---")
     st.header("🗺️ Ferramenta de Mapeamento e Consulta de RT")
-    df_map = st.session_state.df_mapeamento.copy()
-    city_col_map, rep_col_map, lat_col, lon_col, km_col = 'nm_cidade_atendimento', 'nm_representante', 'cd_latitude_atendimento', 'cd_longitude_atendimento', 'qt_distancia_atendimento_km'
-    if all(col in df_map.columns for col in [city_col_map, rep_col_map, lat_col, lon_col, km_col]):
+    df_map = st.session_state.df_mapeamento
+    esquema_map = st.session_state.esquemas.get('df_mapeamento', {})
+    city_col_map, rep_col_map, lat_col, lon_col, km_col = (esquema_map.get(papel) for papel in ['cidade', 'representante', 'lat_atendimento', 'lon_atendimento', 'distancia_km'])
+    if all([city_col_map, rep_col_map, lat_col, lon_col, km_col]):
         col1, col2 = st.columns(2)
         cidade_selecionada_map = col1.selectbox("Filtrar Mapeamento por Cidade:", options=sorted(df_map[city_col_map].dropna().unique()), index=None, placeholder="Selecione uma cidade")
         rep_selecionado_map = col2.selectbox("Filtrar Mapeamento por Representante:", options=sorted(df_map[rep_col_map].dropna().unique()), index=None, placeholder="Selecione um representante")
@@ -399,15 +581,16 @@ if st.session_state.df_mapeamento is not None:
         ordem_colunas = [rep_col_map, city_col_map, km_col]
         outras_colunas = [col for col in filtered_df_map.columns if col not in ordem_colunas]
         nova_ordem = ordem_colunas + outras_colunas
-        st.dataframe(filtered_df_map[nova_ordem])
+        tabela_paginada(filtered_df_map, 'tabela_mapeamento', versao=(st.session_state.impressoes.get('df_mapeamento'), cidade_selecionada_map, rep_selecionado_map), colunas_iniciais=nova_ordem)
         st.write("Visualização no Mapa:")
-        map_data = filtered_df_map.rename(columns={lat_col: 'lat', lon_col: 'lon'})
-        map_data['lat'] = pd.to_numeric(map_data['lat'], errors='coerce')
-        map_data['lon'] = pd.to_numeric(map_data['lon'], errors='coerce')
-        map_data.dropna(subset=['lat', 'lon'], inplace=True)
-        map_data['size'] = 1000 if cidade_selecionada_map or rep_selecionado_map else 100
+        # Coordenadas já convertidas no upload; pontos repetidos/próximos são agregados conforme o zoom.
+        zoom_mapa = st.slider("Nível de detalhe do mapa (zoom):", min_value=ZOOM_MINIMO, max_value=ZOOM_MAXIMO, value=zoom_do_recorte(filtered_df_map),
+                              key=f"zoom_mapa_{cidade_selecionada_map}_{rep_selecionado_map}",
+                              help="Registros próximos são agrupados em um único ponto, maior quanto mais registros ele representa.")
+        map_data, _, registros_com_coordenadas = pontos_do_mapa(filtered_df_map, zoom=zoom_mapa)
         if not map_data.empty:
-            st.map(map_data, color='#FF4B4B', size='size')
+            st.caption(f"{registros_com_coordenadas} registros com coordenadas em {len(map_data)} ponto(s) no mapa.")
+            st.map(map_data, latitude='lat', longitude='lon', color='#FF4B4B', size='size', zoom=zoom_mapa)
         else:
             st.warning("Nenhum resultado com coordenadas para exibir no mapa.")
 
@@ -418,23 +601,26 @@ if st.session_state.df_dados is not None and st.session_state.df_mapeamento is n
         try:
             df_dados_otim = st.session_state.df_dados
             df_map_otim = st.session_state.df_mapeamento
-            os_id_col = next((col for col in df_dados_otim.columns if 'número da o.s' in col.lower() or 'numeropedido' in col.lower() or 'os' in col.lower()), None)
-            os_cliente_col = next((col for col in df_dados_otim.columns if 'cliente' in col.lower() and 'id' not in col.lower()), None)
-            os_date_col = next((col for col in df_dados_otim.columns if 'data agendamento' in col.lower()), None)
-            os_city_col = next((col for col in df_dados_otim.columns if 'cidade agendamento' in col.lower() or 'cidade o.s.' in col.lower()), None)
-            os_rep_col = next((col for col in df_dados_otim.columns if 'representante técnico' in col.lower() and 'id' not in col.lower()), None)
-            if not os_rep_col:
-                os_rep_col = next((col for col in df_dados_otim.columns if 'representante' in col.lower() and 'id' not in col.lower()), None)
-            os_status_col = next((col for col in df_dados_otim.columns if 'status' in col.lower()), None)
-            map_city_col = 'nm_cidade_atendimento'
-            map_lat_atendimento_col = 'cd_latitude_atendimento'
-            map_lon_atendimento_col = 'cd_longitude_atendimento'
-            map_rep_col = 'nm_representante'
-            map_rep_lat_col = 'cd_latitude_representante'
-            map_rep_lon_col = 'cd_longitude_representante'
+            esquema_dados = st.session_state.esquemas.get('df_dados', {})
+            esquema_map = st.session_state.esquemas.get('df_mapeamento', {})
+            os_id_col = esquema_dados.get('os_id')
+            os_cliente_col = esquema_dados.get('cliente')
+            os_date_col = esquema_dados.get('data_agendamento')
+            os_city_col = esquema_dados.get('cidade')
+            os_rep_col = esquema_dados.get('representante')
+            os_status_col = esquema_dados.get('status')
+            map_city_col = esquema_map.get('cidade')
+            map_lat_atendimento_col = esquema_map.get('lat_atendimento')
+            map_lon_atendimento_col = esquema_map.get('lon_atendimento')
+            map_rep_col = esquema_map.get('representante')
+            map_rep_lat_col = esquema_map.get('lat_representante')
+            map_rep_lon_col = esquema_map.get('lon_representante')
             required_cols = [os_id_col, os_cliente_col, os_date_col, os_city_col, os_rep_col, os_status_col]
+            required_map_cols = [map_city_col, map_lat_atendimento_col, map_lon_atendimento_col, map_rep_col, map_rep_lat_col, map_rep_lon_col]
             if not all(required_cols):
                 st.warning("Para usar o otimizador, a planilha de agendamentos precisa conter colunas com os nomes corretos (incluindo Status e Representante sem ID).")
+            elif not all(required_map_cols):
+                st.warning("Para usar o otimizador, o Mapeamento precisa conter as colunas 'nm_cidade_atendimento', 'nm_representante' e as coordenadas de atendimento e do representante.")
             else:
                 st.subheader("Filtro de Status")
                 all_statuses = df_dados_otim[os_status_col].dropna().unique().tolist()
@@ -443,78 +629,109 @@ if st.session_state.df_dados is not None and st.session_state.df_mapeamento is n
                 if not status_selecionados:
                     st.warning("Por favor, selecione ao menos um status para continuar.")
                     st.stop()
-                df_otimizacao_filtrado = df_dados_otim[df_dados_otim[os_status_col].isin(status_selecionados)].copy()
+                col_k, col_raio = st.columns(2)
+                k_sugestoes = col_k.number_input("Quantidade de RTs sugeridos (ranking):", min_value=1, max_value=20, value=5)
+                raio_max_km = col_raio.number_input("Raio máximo de busca (km):", min_value=1, value=300, step=50)
+                df_otimizacao_filtrado = visao_base(df_dados_otim, required_cols)[df_dados_otim[os_status_col].isin(status_selecionados)]
                 if df_otimizacao_filtrado.empty:
                     st.info(f"Nenhuma ordem com os status selecionados ('{', '.join(status_selecionados)}') foi encontrada.")
                 else:
-                    st.subheader("Buscar Ordem de Serviço Específica (dentro do filtro)")
-                    os_pesquisada_num = st.text_input("Digite o Número da O.S. para análise direta:")
-                    cidade_selecionada_otim = None
-                    ordens_na_cidade = None
-                    if os_pesquisada_num:
-                        df_otimizacao_filtrado[os_id_col] = df_otimizacao_filtrado[os_id_col].astype(str)
-                        resultado_busca = df_otimizacao_filtrado[df_otimizacao_filtrado[os_id_col].str.strip() == os_pesquisada_num.strip()]
-                        if not resultado_busca.empty:
-                            ordens_na_cidade = resultado_busca
-                            cidade_selecionada_otim = ordens_na_cidade.iloc[0][os_city_col]
-                            st.success(f"O.S. '{os_pesquisada_num}' encontrada! Analisando cidade: {cidade_selecionada_otim}")
-                        else:
-                            st.warning(f"O.S. '{os_pesquisada_num}' não encontrada nos status selecionados.")
+                    if st.session_state.indice_rt is None:
+                        st.session_state.indice_rt = IndiceRepresentantes.construir(df_map_otim, map_rep_col, map_rep_lat_col, map_rep_lon_col)
+                    indice_rt = st.session_state.indice_rt
+                    modo_otimizacao = st.radio("Modo de análise:", options=["Ordem ou cidade específica", "Lote (todas as cidades)"], horizontal=True)
+                    if modo_otimizacao == "Lote (todas as cidades)":
+                        pontos_cidade = pontos_atendimento_por_cidade(df_map_otim, map_city_col, map_lat_atendimento_col, map_lon_atendimento_col)
+                        df_lote = otimizar_em_lote(df_otimizacao_filtrado, indice_rt, pontos_cidade, os_id_col, os_cliente_col, os_date_col, os_city_col, os_rep_col, raio_km=raio_max_km)
+                        com_economia = df_lote['Economia (km)'] > 0
+                        col_m1, col_m2, col_m3 = st.columns(3)
+                        col_m1.metric("Ordens analisadas", len(df_lote))
+                        col_m2.metric("Ordens com RT mais próximo", int(com_economia.sum()))
+                        col_m3.metric("Economia potencial total", f"{df_lote.loc[com_economia, 'Economia (km)'].sum():.1f} km")
+                        st.dataframe(df_lote, hide_index=True, column_config={col: st.column_config.NumberColumn(format="%.1f") for col in ['Distância RT Agendado (km)', 'Distância RT Sugerido (km)', 'Economia (km)']})
+                        col_exp1, col_exp2 = st.columns(2)
+                        col_exp1.download_button(label="📥 Exportar Otimização em Lote (.csv)", data=convert_df_to_csv(df_lote), file_name="otimizacao_lote_rt.csv", mime='text/csv')
+                        col_exp2.download_button(label="📥 Exportar Otimização em Lote (.xlsx)", data=convert_df_to_excel(df_lote), file_name="otimizacao_lote_rt.xlsx", mime='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
                     else:
-                        st.subheader("Ou Selecione uma Cidade para Otimizar em Lote")
-                        lista_cidades = sorted(df_otimizacao_filtrado[os_city_col].dropna().unique())
-                        cidade_selecionada_otim = st.selectbox("Selecione uma cidade:", options=lista_cidades, index=None, placeholder="Selecione...")
-                        if cidade_selecionada_otim:
-                            ordens_na_cidade = df_otimizacao_filtrado[df_otimizacao_filtrado[os_city_col] == cidade_selecionada_otim]
-                    if ordens_na_cidade is not None and not ordens_na_cidade.empty:
-                        st.subheader(f"Ordens em {cidade_selecionada_otim} (Status: {', '.join(status_selecionados)})")
-                        st.dataframe(ordens_na_cidade[[os_id_col, os_cliente_col, os_date_col, os_rep_col]])
-                        st.subheader(f"Análise de Proximidade para cada Ordem:")
-                        cidade_info = df_map_otim[df_map_otim[map_city_col] == cidade_selecionada_otim]
-                        if cidade_info.empty:
-                            st.error(f"Coordenadas para '{cidade_selecionada_otim}' não encontradas no Mapeamento.")
+                        st.subheader("Buscar Ordem de Serviço Específica (dentro do filtro)")
+                        os_pesquisada_num = st.text_input("Digite o Número da O.S. para análise direta:")
+                        cidade_selecionada_otim = None
+                        ordens_na_cidade = None
+                        if os_pesquisada_num:
+                            resultado_busca = df_otimizacao_filtrado[df_otimizacao_filtrado[os_id_col].astype(str).str.strip() == os_pesquisada_num.strip()]
+                            if not resultado_busca.empty:
+                                ordens_na_cidade = resultado_busca
+                                cidade_selecionada_otim = ordens_na_cidade.iloc[0][os_city_col]
+                                st.success(f"O.S. '{os_pesquisada_num}' encontrada! Analisando cidade: {cidade_selecionada_otim}")
+                            else:
+                                st.warning(f"O.S. '{os_pesquisada_num}' não encontrada nos status selecionados.")
                         else:
-                            ponto_atendimento = (cidade_info.iloc[0][map_lat_atendimento_col], cidade_info.iloc[0][map_lon_atendimento_col])
-                            distancias = [
-                                {
-                                    'Representante': str(rt_map[map_rep_col]),
-                                    'Distancia (km)': haversine((rt_map[map_rep_lat_col], rt_map[map_rep_lon_col]), ponto_atendimento, unit=Unit.KILOMETERS)
-                                }
-                                for _, rt_map in df_map_otim.iterrows()
-                            ]
-                            df_distancias = pd.DataFrame(distancias).drop_duplicates(subset=['Representante']).reset_index(drop=True)
-                            termos_excluidos_otimizador = ['stellantis', 'ceabs', 'fca chrysler']
-                            mascara_otimizador = ~df_distancias['Representante'].str.contains('|'.join(termos_excluidos_otimizador), case=False, na=False)
-                            df_distancias_filtrado = df_distancias[mascara_otimizador]
-                            rt_sugerido = None
-                            if not df_distancias_filtrado.empty:
-                                rt_sugerido = df_distancias_filtrado.loc[df_distancias_filtrado['Distancia (km)'].idxmin()]
-                            for index, ordem in ordens_na_cidade.iterrows():
-                                rt_atual = ordem[os_rep_col]
-                                with st.expander(f"OS: {ordem[os_id_col]} | Cliente: {ordem[os_cliente_col]}", expanded=False):
-                                    col1, col2 = st.columns(2)
-                                    with col1:
-                                        st.info(f"**RT Agendado:** {rt_atual}")
-                                        dist_atual_df = df_distancias[df_distancias['Representante'] == rt_atual]
-                                        if not dist_atual_df.empty:
-                                            dist_atual = dist_atual_df['Distancia (km)'].values[0]
-                                            st.metric("Distância do RT Agendado", f"{dist_atual:.1f} km")
-                                        else:
-                                            st.warning(f"O RT '{rt_atual}' não foi encontrado no Mapeamento.")
-                                            dist_atual = float('inf')
-                                    with col2:
-                                        if rt_sugerido is not None:
-                                            st.success(f"**Sugestão (Mais Próximo):** {rt_sugerido['Representante']}")
-                                            economia = dist_atual - rt_sugerido['Distancia (km)']
-                                            st.metric("Distância do RT Sugerido", f"{rt_sugerido['Distancia (km)']:.1f} km", delta=f"{economia:.1f} km de economia" if economia > 0 and economia != float('inf') else None)
-                                        else:
-                                            st.warning("Nenhum RT disponível para sugestão após a filtragem.")
+                            st.subheader("Ou Selecione uma Cidade para Otimizar")
+                            lista_cidades = sorted(df_otimizacao_filtrado[os_city_col].dropna().unique())
+                            cidade_selecionada_otim = st.selectbox("Selecione uma cidade:", options=lista_cidades, index=None, placeholder="Selecione...")
+                            if cidade_selecionada_otim:
+                                ordens_na_cidade = df_otimizacao_filtrado[df_otimizacao_filtrado[os_city_col] == cidade_selecionada_otim]
+                        if ordens_na_cidade is not None and not ordens_na_cidade.empty:
+                            st.subheader(f"Ordens em {cidade_selecionada_otim} (Status: {', '.join(status_selecionados)})")
+                            st.dataframe(ordens_na_cidade[[os_id_col, os_cliente_col, os_date_col, os_rep_col]])
+                            st.subheader(f"Análise de Proximidade para cada Ordem:")
+                            cidade_info = df_map_otim[df_map_otim[map_city_col] == cidade_selecionada_otim]
+                            if cidade_info.empty:
+                                st.error(f"Coordenadas para '{cidade_selecionada_otim}' não encontradas no Mapeamento.")
+                            else:
+                                ponto_atendimento = (cidade_info.iloc[0][map_lat_atendimento_col], cidade_info.iloc[0][map_lon_atendimento_col])
+                                ranking_rts = indice_rt.vizinhos(ponto_atendimento[0], ponto_atendimento[1], k=k_sugestoes, raio_km=raio_max_km)
+                                st.write(f"**Ranking dos {k_sugestoes} RTs mais próximos (até {raio_max_km} km):**")
+                                if not ranking_rts.empty:
+                                    st.dataframe(ranking_rts, hide_index=True, column_config={'Distancia (km)': st.column_config.NumberColumn(format="%.1f")})
+                                rt_sugerido = ranking_rts.iloc[0] if not ranking_rts.empty else None
+                                for index, ordem in ordens_na_cidade.iterrows():
+                                    rt_atual = ordem[os_rep_col]
+                                    with st.expander(f"OS: {ordem[os_id_col]} | Cliente: {ordem[os_cliente_col]}", expanded=False):
+                                        col1, col2 = st.columns(2)
+                                        with col1:
+                                            st.info(f"**RT Agendado:** {rt_atual}")
+                                            dist_atual = indice_rt.distancia(rt_atual, *ponto_atendimento)
+                                            if dist_atual is not None:
+                                                st.metric("Distância do RT Agendado", f"{dist_atual:.1f} km")
+                                            else:
+                                                st.warning(f"O RT '{rt_atual}' não foi encontrado no Mapeamento.")
+                                                dist_atual = float('inf')
+                                        with col2:
+                                            if rt_sugerido is not None:
+                                                st.success(f"**Sugestão (Mais Próximo):** {rt_sugerido['Representante']}")
+                                                economia = dist_atual - rt_sugerido['Distancia (km)']
+                                                st.metric("Distância do RT Sugerido", f"{rt_sugerido['Distancia (km)']:.1f} km", delta=f"{economia:.1f} km de economia" if economia > 0 and economia != float('inf') else None)
+                                            else:
+                                                st.warning(f"Nenhum RT disponível em até {raio_max_km} km após a filtragem.")
         except Exception as e:
             st.error(f"Ocorreu um erro inesperado no Otimizador. Verifique os nomes das colunas. Detalhe: {e}")
 
 # --- SEÇÃO DO CHAT DE IA (Mercúrio) – unificação com análise de dados ---
 st.markdown("---")
 st.header("💬 Converse com a IA (Mercúrio)")
+respostas_em_streaming = st.checkbox("Exibir respostas em tempo real (streaming)", value=True)
+
+# Resposta interrompida no rerun anterior (botão de parar ou outra interação): guarda o que já chegou.
+resposta_interrompida = st.session_state.pop('resposta_em_andamento', None)
+if resposta_interrompida is not None:
+    total_s = time.perf_counter() - resposta_interrompida['inicio']
+    st.session_state.metricas_llm.append({'primeiro_token_s': resposta_interrompida['primeiro_token_s'], 'total_s': total_s, 'cancelada': True})
+    conteudo = (resposta_interrompida['texto'] or "") + "\n\n_(resposta interrompida)_"
+    st.session_state.display_history.append({"role": "assistant", "content": conteudo})
+    st.session_state.chat_history.append({"role": "assistant", "content": resposta_interrompida['texto']})
+
+if st.session_state.metricas_llm:
+    ultimas = st.session_state.metricas_llm[-20:]
+    primeiros = [m['primeiro_token_s'] for m in ultimas if m['primeiro_token_s'] is not None]
+    st.caption(f"Latência média (últimas {len(ultimas)} respostas): 1º token {np.mean(primeiros) if primeiros else float('nan'):.2f} s · total {np.mean([m['total_s'] for m in ultimas]):.2f} s")
+
+roteador = obter_roteador()
+if roteador.estatisticas['perguntas']:
+    st.caption(f"Respostas diretas (sem IA): {roteador.taxa_acerto:.0%} de {roteador.estatisticas['perguntas']} perguntas")
+estatisticas_analise = st.session_state.get('estatisticas_analise', {})
+if estatisticas_analise.get('chamadas_modelo'):
+    st.caption(f"Análises da IA que funcionaram na primeira chamada: {estatisticas_analise['sucesso_primeira'] / estatisticas_analise['chamadas_modelo']:.0%} de {estatisticas_analise['chamadas_modelo']}")
 
 # Exibe histórico do chat
 for message in st.session_state.display_history:
@@ -529,10 +746,14 @@ if prompt := st.chat_input("Envie uma pergunta ou mensagem..."):
     with st.chat_message("user"):
         st.markdown(prompt)
 
+    resposta_exibida = False
     # --- DETECÇÃO DE PERGUNTA SOBRE O DESENVOLVEDOR ---
     prompt_lower = prompt.lower()
     if any(p in prompt_lower for p in ["quem criou você", "Quem desenvolveu você?", "quem te desenvolveu", "quem te fez", "quem é seu criador"]):
         resposta_final = "Fui desenvolvido pelo Felipe Castro.🚀"
+    elif (resposta_roteada := obter_roteador().responder(prompt, bases_para_roteador())) is not None:
+        # Contagens, somas, médias e rankings frequentes saem direto das bases, sem chamar o modelo.
+        resposta_final = resposta_roteada.texto
     else:
         tipo = detectar_tipo_pergunta(prompt)
         if tipo == "dados":
@@ -545,9 +766,9 @@ if prompt := st.chat_input("Envie uma pergunta ou mensagem..."):
                 df = None
 
             if df is not None:
-                df_hash = pd.util.hash_pandas_object(df).sum()
                 df_type = 'mapeamento' if df is st.session_state.df_mapeamento else 'dados'
-                resultado_analise, erro = executar_analise_pandas(df_hash, prompt, df_type)
+                impressao = st.session_state.impressoes.get(f"df_{df_type}")
+                resultado_analise, erro = executar_analise_pandas(impressao, prompt, df_type)
 
                 if erro == "PERGUNTA_INVALIDA":
                     resposta_final = "Desculpe, só posso responder a perguntas relacionadas aos dados carregados."
@@ -555,6 +776,8 @@ if prompt := st.chat_input("Envie uma pergunta ou mensagem..."):
                     resposta_final = f"Ocorreu um erro na análise: {erro}"
                 else:
                     resposta_final = str(resultado_analise)
+            else:
+                resposta_final = "Carregue a Pesquisa de O.S. ou o Mapeamento para fazer perguntas sobre os dados."
         else:
             # --- Perguntas gerais enviadas ao Gemini (Mercúrio) ---
             system_prompt = """
@@ -564,14 +787,55 @@ Responda perguntas sobre dados usando pandas, Excel, análises financeiras e oti
 Nunca diga que é um modelo de linguagem genérico. Mantenha a personalidade de Mercúrio.
 """
             full_prompt = system_prompt + "\n\nPergunta do usuário: " + prompt
-            try:
-                response = st.session_state.model.generate_content(full_prompt)
-                resposta_final = response.text.strip()
-            except Exception as e:
-                resposta_final = f"Erro ao gerar resposta: {e}"
-
-    with st.chat_message("assistant"):
-        st.markdown(resposta_final)
+            if respostas_em_streaming:
+                with st.chat_message("assistant"):
+                    # O clique interrompe esta execução pelo rerun do Streamlit: a exceção de controle (BaseException)
+                    # sai do laço de streaming na próxima atualização de area_resposta e o parcial é recuperado
+                    # no início do rerun. Por isso `cancelado` não é passado aqui: o estado do botão só muda no rerun.
+                    st.button("⏹️ Parar resposta", key="parar_resposta")
+                    area_resposta = st.empty()
+                    # Parcial guardada na sessão: se o usuário parar (rerun), o texto recebido não se perde.
+                    st.session_state.resposta_em_andamento = {'texto': '', 'primeiro_token_s': None, 'inicio': time.perf_counter()}
+
+                    def ao_receber(texto):
+                        andamento = st.session_state.resposta_em_andamento
+                        if andamento['primeiro_token_s'] is None:
+                            andamento['primeiro_token_s'] = time.perf_counter() - andamento['inicio']
+                        andamento['texto'] = texto
+                        area_resposta.markdown(texto + "▌")
+
+                    try:
+                        transmitida = obter_camada_requisicoes().transmitir(api_key, st.session_state.model, full_prompt, ao_receber=ao_receber)
+                        resposta_final = transmitida.texto.strip()
+                        st.session_state.metricas_llm.append({'primeiro_token_s': transmitida.primeiro_token_s, 'total_s': transmitida.total_s, 'cancelada': transmitida.cancelada})
+                        area_resposta.markdown(resposta_final)
+                        st.caption(formatar_latencia(transmitida.primeiro_token_s, transmitida.total_s))
+                    except ErroCotaModelo:
+                        resposta_final = MENSAGEM_COTA_ESGOTADA
+                        area_resposta.markdown(resposta_final)
+                    except Exception as e:
+                        resposta_final = f"Erro ao gerar resposta: {e}"
+                        area_resposta.markdown(resposta_final)
+                    del st.session_state.resposta_em_andamento
+                resposta_exibida = True
+            else:
+                inicio = time.perf_counter()
+                try:
+                    response = obter_camada_requisicoes().executar(api_key, st.session_state.model.generate_content, full_prompt,
+                                                                   chave_dedup=(modelo_padrao, full_prompt))
+                    resposta_final = response.text.strip()
+                    total_s = time.perf_counter() - inicio
+                    st.session_state.metricas_llm.append({'primeiro_token_s': total_s, 'total_s': total_s, 'cancelada': False})
+                except ErroCotaModelo:
+                    resposta_final = MENSAGEM_COTA_ESGOTADA
+                except Exception as e:
+                    resposta_final = f"Erro ao gerar resposta: {e}"
+
+    if not resposta_exibida:
+        with st.chat_message("assistant"):
+            st.markdown(resposta_final)
+    st.session_state.display_history.append({"role": "assistant", "content": resposta_final})
+    st.session_state.chat_history.append({"role": "assistant", "content": resposta_final})
 
    # --- RODAPÉ FIXO ESTILOSO ---
 st.markdown(
@@ -0,0 +1,160 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from custos import formatar_reais
+
+# ------------------------------------------------------------
+# BASES SINTÉTICAS PARA OS BENCHMARKS
+# ------------------------------------------------------------
+# Geram as quatro bases com os mesmos nomes de coluna e formatos das exportações reais (datas
+# dd/mm/aaaa, valores "R$ 1.234,56", coordenadas com alguns valores inválidos), de forma
+# determinística pela semente. Cidades, RTs e clientes são pools compartilhados entre as bases,
+# para o otimizador e o analisador de duplicidade encontrarem correspondências como nos dados reais.
+TOTAL_CIDADES = 800
+TOTAL_REPRESENTANTES = 600
+TOTAL_TECNICOS = 1500
+TOTAL_CLIENTES = 120
+TOTAL_VALORES = 20_000
+DIAS_NO_PERIODO = 730
+INICIO_PERIODO = pd.Timestamp('2023-01-01')
+FRACAO_INVALIDOS = 0.01
+
+STATUS_OS = ['Agendada', 'Serviços realizados', 'Parcialmente realizado', 'Cancelada', 'Pendente', 'Reagendada']
+TIPOS_FECHAMENTO = ['Instalação', 'Manutenção', 'Retirada', 'Troca', 'Visita improdutiva']
+PRODUTOS = ['Rastreador', 'Bloqueador', 'Câmera', 'Sensor de porta', 'Telemetria']
+
+# Separador e tipo de base de cada arquivo, como no upload da barra lateral.
+BASES = {
+    'os': ('df_dados', ';'),
+    'mapeamento': ('df_mapeamento', ','),
+    'devolucao': ('df_devolucao', ';'),
+    'pagamento': ('df_pagamento', ';'),
+}
+
+
+def _pools(semente):
+    rng = np.random.default_rng(semente)
+    cidades = np.array([f"Cidade {i:03d}" for i in range(TOTAL_CIDADES)], dtype=object)
+    representantes = np.array([f"RT {i:04d} Serviços Técnicos" for i in range(TOTAL_REPRESENTANTES)], dtype=object)
+    # Alguns RTs com termos que o otimizador exclui.
+    representantes[::97] = [f"CEABS Parceiro {i}" for i in range(len(representantes[::97]))]
+    return {
+        'cidades': cidades,
+        'lat_cidade': rng.uniform(-33.0, 4.0, TOTAL_CIDADES),
+        'lon_cidade': rng.uniform(-72.0, -35.0, TOTAL_CIDADES),
+        'representantes': representantes,
+        'lat_rt': rng.uniform(-33.0, 4.0, TOTAL_REPRESENTANTES),
+        'lon_rt': rng.uniform(-72.0, -35.0, TOTAL_REPRESENTANTES),
+        'tecnicos': np.array([f"Técnico {i:04d}" for i in range(TOTAL_TECNICOS)], dtype=object),
+        'clientes': np.array([f"Cliente {i:03d} Ltda" for i in range(TOTAL_CLIENTES)], dtype=object),
+        'datas': (INICIO_PERIODO + pd.to_timedelta(np.arange(DIAS_NO_PERIODO), unit='D')).strftime('%d/%m/%Y').to_numpy(dtype=object),
+    }
+
+
+def _escolher(rng, pool, linhas, concentracao=1.2):
+    # Distribuição de cauda longa (poucas cidades/RTs concentram muitas ordens), como nas bases reais.
+    pesos = 1.0 / np.arange(1, len(pool) + 1) ** concentracao
+    return pool[rng.choice(len(pool), size=linhas, p=pesos / pesos.sum())]
+
+
+def _valores_reais(rng, linhas, escala):
+    pool = np.array([formatar_reais(v) for v in np.round(rng.gamma(2.0, escala, TOTAL_VALORES), 2)], dtype=object)
+    valores = pool[rng.integers(0, TOTAL_VALORES, linhas)]
+    invalidos = rng.random(linhas) < FRACAO_INVALIDOS
+    valores[invalidos] = rng.choice(np.array(['', '-', 'N/A'], dtype=object), size=int(invalidos.sum()))
+    return valores
+
+
+def gerar_os(linhas, semente=0):
+    rng = np.random.default_rng(semente + 1)
+    pools = _pools(semente)
+    return pd.DataFrame({
+        'Número da O.S': rng.permutation(linhas) + 1_000_000,
+        'Status': _escolher(rng, np.array(STATUS_OS, dtype=object), linhas, 0.8),
+        'Tipo de Fechamento': _escolher(rng, np.array(TIPOS_FECHAMENTO, dtype=object), linhas, 0.8),
+        'Cidade Agendamento': _escolher(rng, pools['cidades'], linhas),
+        'Representante Técnico': _escolher(rng, pools['representantes'], linhas),
+        'Cliente': _escolher(rng, pools['clientes'], linhas),
+        'Data Agendamento': pools['datas'][rng.integers(0, DIAS_NO_PERIODO, linhas)],
+        'Observação': np.where(rng.random(linhas) < 0.3, 'Cliente ausente na primeira visita', ''),
+    })
+
+
+def gerar_mapeamento(linhas, semente=0):
+    rng = np.random.default_rng(semente + 2)
+    pools = _pools(semente)
+    cidade = rng.integers(0, TOTAL_CIDADES, linhas)
+    rt = rng.integers(0, TOTAL_REPRESENTANTES, linhas)
+    lat = pools['lat_cidade'][cidade] + rng.normal(0, 0.05, linhas)
+    lon = pools['lon_cidade'][cidade] + rng.normal(0, 0.05, linhas)
+    invalidos = rng.random(linhas) < FRACAO_INVALIDOS
+    lat[invalidos], lon[invalidos] = 999.0, 0.0
+    return pd.DataFrame({
+        'nm_cidade_atendimento': pools['cidades'][cidade],
+        'nm_representante': pools['representantes'][rt],
+        'cd_latitude_atendimento': lat.round(6),
+        'cd_longitude_atendimento': lon.round(6),
+        'qt_distancia_atendimento_km': rng.gamma(2.0, 40.0, linhas).round(1),
+        'cd_latitude_representante': pools['lat_rt'][rt].round(6),
+        'cd_longitude_representante': pools['lon_rt'][rt].round(6),
+    })
+
+
+def gerar_devolucao(linhas, semente=0):
+    rng = np.random.default_rng(semente + 3)
+    pools = _pools(semente)
+    prazos = pools['datas'][rng.integers(0, DIAS_NO_PERIODO, linhas)]
+    prazos[rng.random(linhas) < FRACAO_INVALIDOS] = ''
+    clientes = _escolher(rng, pools['clientes'], linhas)
+    clientes[rng.random(linhas) < FRACAO_INVALIDOS] = ''
+    return pd.DataFrame({
+        'Número da O.S': rng.permutation(linhas) + 5_000_000,
+        'Cliente Nome': clientes,
+        'Prazo Instalação': prazos,
+        'Produto': _escolher(rng, np.array(PRODUTOS, dtype=object), linhas, 0.8),
+        'Cidade': _escolher(rng, pools['cidades'], linhas),
+        'Representante': _escolher(rng, pools['representantes'], linhas),
+    })
+
+
+def gerar_pagamento(linhas, semente=0):
+    rng = np.random.default_rng(semente + 4)
+    pools = _pools(semente)
+    cidade_os = _escolher(rng, pools['cidades'], linhas)
+    # Parte dos atendimentos é feita por RT da própria cidade (custo zerado no analisador).
+    cidade_rt = np.where(rng.random(linhas) < 0.2, cidade_os, _escolher(rng, pools['cidades'], linhas))
+    return pd.DataFrame({
+        'OS': rng.permutation(linhas) + 9_000_000,
+        'Data de Fechamento': pools['datas'][rng.integers(0, DIAS_NO_PERIODO, linhas)],
+        'Cidade O.S.': cidade_os,
+        'Cidade RT': cidade_rt,
+        'Representante': _escolher(rng, pools['representantes'], linhas),
+        'Técnico': _escolher(rng, pools['tecnicos'], linhas),
+        'Valor Deslocamento': _valores_reais(rng, linhas, 60.0),
+        'Deslocamento': rng.gamma(2.0, 30.0, linhas).round(1),
+        'Valor KM RT': _valores_reais(rng, linhas, 0.6),
+        'Abrangência RT': rng.choice([0, 20, 30, 50], size=linhas),
+        'Valor Extra': _valores_reais(rng, linhas, 15.0),
+        'Pedágio': _valores_reais(rng, linhas, 8.0),
+    })
+
+
+GERADORES = {
+    'os': gerar_os,
+    'mapeamento': gerar_mapeamento,
+    'devolucao': gerar_devolucao,
+    'pagamento': gerar_pagamento,
+}
+
+
+def arquivo_csv(base, linhas, pasta, semente=0):
+    # Gera o CSV uma vez por (base, linhas, semente) e reaproveita nas execuções seguintes.
+    os.makedirs(pasta, exist_ok=True)
+    caminho = os.path.join(pasta, f"{base}_{linhas}_{semente}.csv")
+    if not os.path.exists(caminho):
+        temporario = f"{caminho}.{os.getpid()}.tmp"
+        GERADORES[base](linhas, semente).to_csv(temporario, index=False, sep=BASES[base][1])
+        os.replace(temporario, caminho)
+    return caminho
@@ -0,0 +1,320 @@
+import argparse
+import gc
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+from functools import cached_property
+
+import numpy as np
+import pandas as pd
+
+# Permite rodar tanto `python -m benchmarks.executar` quanto `python benchmarks/executar.py` da raiz do repositório.
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if RAIZ not in sys.path:
+    sys.path.insert(0, RAIZ)
+
+from benchmarks.dados_sinteticos import BASES, arquivo_csv
+from cubo import construir_cubo
+from custos import detectar_duplicidades, normalizar_numeros_pagamento
+from datas import normalizar_datas
+from devolucao import IndiceVencidas
+from esquema import resolver_esquema
+from ingestao import carregar_dataframe, combinar_arquivos, compactar_tipos
+from mapa import pontos_do_mapa, preparar_coordenadas_mapa
+from otimizador import IndiceRepresentantes, otimizar_em_lote, pontos_atendimento_por_cidade
+from perfil import perfil_dataset
+
+# ------------------------------------------------------------
+# BENCHMARK DAS ETAPAS DO PIPELINE (SEM STREAMLIT)
+# ------------------------------------------------------------
+# Cada etapa é medida isoladamente: o que ela consome (arquivo lido, base carregada, índice de RTs...)
+# é preparado antes e fica fora da medição. O tempo é o mínimo e a mediana de N repetições; o pico de
+# memória vem de uma execução extra sob tracemalloc (alocações do Python e do NumPy; buffers do
+# Arrow não aparecem). Os resultados vão para um JSON por execução e são comparados com o anterior.
+#
+#   python -m benchmarks.executar --linhas 10000 100000 1000000
+#   python -m benchmarks.executar --linhas 5000000 --etapas ingestao_pagamento numeros_pagamento --repeticoes 1
+PASTA_BENCHMARKS = os.path.dirname(os.path.abspath(__file__))
+PASTA_DADOS = os.path.join(PASTA_BENCHMARKS, 'dados')
+PASTA_RESULTADOS = os.path.join(PASTA_BENCHMARKS, 'resultados')
+LINHAS_PADRAO = [10_000, 100_000]
+HOJE_DEVOLUCAO = pd.Timestamp('2024-07-01')
+
+
+class ArquivoEmMemoria(io.BytesIO):
+    # Imita o UploadedFile do Streamlit (name, size, getvalue) para chamar a ingestão fora do app.
+
+    def __init__(self, conteudo, nome):
+        super().__init__(conteudo)
+        self.name = nome
+        self.size = len(conteudo)
+
+
+class Contexto:
+    # Entradas das etapas para um tamanho de base, calculadas sob demanda e reaproveitadas entre etapas.
+
+    def __init__(self, linhas, pasta_dados, semente, leitura_economica):
+        self.linhas = linhas
+        self.pasta_dados = pasta_dados
+        self.semente = semente
+        self.leitura_economica = leitura_economica
+        self._conteudos = {}
+        self._bases = {}
+
+    def conteudo(self, base):
+        if base not in self._conteudos:
+            with open(arquivo_csv(base, self.linhas, self.pasta_dados, self.semente), 'rb') as arquivo:
+                self._conteudos[base] = arquivo.read()
+        return self._conteudos[base]
+
+    def carregar(self, base):
+        tipo_base, separador = BASES[base]
+        return carregar_dataframe(ArquivoEmMemoria(self.conteudo(base), f"{base}.csv"), separador_padrao=separador,
+                                  tipo_base=tipo_base, em_blocos=True if self.leitura_economica else None)
+
+    def base(self, base):
+        if base not in self._bases:
+            self._bases[base] = self.carregar(base)
+        return self._bases[base]
+
+    def esquema(self, base):
+        return resolver_esquema(self.base(base).columns, BASES[base][0])
+
+    @cached_property
+    def pagamento_numerico(self):
+        return normalizar_numeros_pagamento(self.base('pagamento'), self.esquema('pagamento'))[0]
+
+    @cached_property
+    def custos(self):
+        # Mesmo preparo do analisador de custos do app, sem os filtros de data e representante.
+        esquema = self.esquema('pagamento')
+        df = self.pagamento_numerico.copy()
+        for papel in ['cidade_os', 'representante', 'tecnico', 'cidade_rt']:
+            df[esquema[papel]] = df[esquema[papel]].astype(str).str.strip()
+        df['DATA_ANALISE'] = df[esquema['data_fechamento']].dt.date
+        mesma_cidade = df[esquema['cidade_rt']] == df[esquema['cidade_os']]
+        valor_calculado = (df['DESLOC_KM_NUM'].fillna(0) * df['VALOR_KM_NUM'].fillna(0) - df['ABRANG_NUM'].fillna(0)).clip(lower=0)
+        df['VALOR_CALCULADO'] = np.where(mesma_cidade, 0, valor_calculado)
+        df['OBSERVACAO'] = np.where(mesma_cidade, "Custo Zerado (Mesma Cidade)", "")
+        return df
+
+    @cached_property
+    def mapeamento_com_coordenadas(self):
+        esquema = self.esquema('mapeamento')
+        return preparar_coordenadas_mapa(self.base('mapeamento'), esquema['lat_atendimento'], esquema['lon_atendimento'])
+
+    @cached_property
+    def indice_rt(self):
+        esquema = self.esquema('mapeamento')
+        return IndiceRepresentantes.construir(self.base('mapeamento'), esquema['representante'], esquema['lat_representante'], esquema['lon_representante'])
+
+# ------------------------------------------------------------
+# ETAPAS (cada uma recebe o contexto e devolve a função a medir)
+# ------------------------------------------------------------
+def _etapa_ingestao(base):
+    def preparar(contexto):
+        contexto.conteudo(base)
+        return lambda: contexto.carregar(base)
+    return preparar
+
+
+def _etapa_datas_pagamento(contexto):
+    bruto = compactar_tipos(pd.read_csv(io.BytesIO(contexto.conteudo('pagamento')), sep=';'))
+    return lambda: normalizar_datas(bruto, 'df_pagamento')
+
+
+def _etapa_numeros_pagamento(contexto):
+    df, esquema = contexto.base('pagamento'), contexto.esquema('pagamento')
+    return lambda: normalizar_numeros_pagamento(df, esquema)
+
+
+def _etapa_duplicidades(contexto):
+    esquema = contexto.esquema('pagamento')
+    df = contexto.custos
+    chaves = ['DATA_ANALISE', esquema['cidade_os'], esquema['representante'], esquema['tecnico']]
+    return lambda: detectar_duplicidades(df, chaves, esquema['os_id'])
+
+
+def _etapa_cubo_os(contexto):
+    df, esquema = contexto.base('os'), contexto.esquema('os')
+    return lambda: construir_cubo(df, esquema)
+
+
+def _etapa_perfil_os(contexto):
+    df = contexto.base('os')
+    return lambda: perfil_dataset(df)
+
+
+def _etapa_combinar_os(contexto):
+    # Três "exportações mensais" com um terço das O.S. repetido entre arquivos vizinhos.
+    df = contexto.base('os')
+    terco = len(df) // 3
+    partes = [(f"os_{i}.csv", df.iloc[max(i * terco - terco // 3, 0):(i + 1) * terco]) for i in range(3)]
+    return lambda: combinar_arquivos(partes, 'df_dados')
+
+
+def _etapa_indice_rt(contexto):
+    df, esquema = contexto.base('mapeamento'), contexto.esquema('mapeamento')
+    return lambda: IndiceRepresentantes.construir(df, esquema['representante'], esquema['lat_representante'], esquema['lon_representante'])
+
+
+def _etapa_otimizador_lote(contexto):
+    esquema_os, esquema_map = contexto.esquema('os'), contexto.esquema('mapeamento')
+    df_os, indice = contexto.base('os'), contexto.indice_rt
+    pontos_cidade = pontos_atendimento_por_cidade(contexto.base('mapeamento'), esquema_map['cidade'], esquema_map['lat_atendimento'], esquema_map['lon_atendimento'])
+    colunas = [esquema_os[papel] for papel in ['os_id', 'cliente', 'data_agendamento', 'cidade', 'representante']]
+    return lambda: otimizar_em_lote(df_os, indice, pontos_cidade, *colunas, raio_km=300)
+
+
+def _etapa_coordenadas_mapa(contexto):
+    df, esquema = contexto.base('mapeamento'), contexto.esquema('mapeamento')
+    return lambda: preparar_coordenadas_mapa(df, esquema['lat_atendimento'], esquema['lon_atendimento'])
+
+
+def _etapa_pontos_mapa(contexto):
+    df = contexto.mapeamento_com_coordenadas
+    return lambda: pontos_do_mapa(df)
+
+
+def _etapa_indice_vencidas(contexto):
+    df, esquema = contexto.base('devolucao'), contexto.esquema('devolucao')
+    return lambda: IndiceVencidas(df, esquema['prazo_instalacao'], esquema['cliente'], HOJE_DEVOLUCAO)
+
+
+ETAPAS = {
+    'ingestao_os': _etapa_ingestao('os'),
+    'ingestao_mapeamento': _etapa_ingestao('mapeamento'),
+    'ingestao_devolucao': _etapa_ingestao('devolucao'),
+    'ingestao_pagamento': _etapa_ingestao('pagamento'),
+    'datas_pagamento': _etapa_datas_pagamento,
+    'numeros_pagamento': _etapa_numeros_pagamento,
+    'duplicidades': _etapa_duplicidades,
+    'cubo_os': _etapa_cubo_os,
+    'perfil_os': _etapa_perfil_os,
+    'combinar_os': _etapa_combinar_os,
+    'indice_rt': _etapa_indice_rt,
+    'otimizador_lote': _etapa_otimizador_lote,
+    'coordenadas_mapa': _etapa_coordenadas_mapa,
+    'pontos_mapa': _etapa_pontos_mapa,
+    'indice_vencidas': _etapa_indice_vencidas,
+}
+
+# ------------------------------------------------------------
+# MEDIÇÃO, REGISTRO E COMPARAÇÃO
+# ------------------------------------------------------------
+def medir(funcao, repeticoes, medir_memoria=True):
+    tempos = []
+    for _ in range(repeticoes):
+        gc.collect()
+        inicio = time.perf_counter()
+        funcao()
+        tempos.append(time.perf_counter() - inicio)
+    pico_mb = None
+    if medir_memoria:
+        gc.collect()
+        tracemalloc.start()
+        try:
+            funcao()
+            pico_mb = tracemalloc.get_traced_memory()[1] / 1024 ** 2
+        finally:
+            tracemalloc.stop()
+    return {'tempo_min_s': min(tempos), 'tempo_mediana_s': statistics.median(tempos), 'pico_memoria_mb': pico_mb}
+
+
+def _commit_atual():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=RAIZ, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def metadados_execucao(argumentos):
+    return {
+        'data': datetime.now().isoformat(timespec='seconds'),
+        'commit': _commit_atual(),
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'numpy': np.__version__,
+        'plataforma': platform.platform(),
+        'processadores': os.cpu_count(),
+        'repeticoes': argumentos.repeticoes,
+        'semente': argumentos.semente,
+        'leitura_economica': argumentos.leitura_economica,
+    }
+
+
+def executar(argumentos):
+    resultados = []
+    for linhas in argumentos.linhas:
+        contexto = Contexto(linhas, argumentos.pasta_dados, argumentos.semente, argumentos.leitura_economica)
+        for nome in argumentos.etapas:
+            funcao = ETAPAS[nome](contexto)
+            medida = medir(funcao, argumentos.repeticoes, medir_memoria=not argumentos.sem_memoria)
+            medida.update({'etapa': nome, 'linhas': linhas, 'linhas_por_s': linhas / medida['tempo_min_s'] if medida['tempo_min_s'] else None})
+            resultados.append(medida)
+            memoria = f", pico {medida['pico_memoria_mb']:.1f} MB" if medida['pico_memoria_mb'] is not None else ""
+            print(f"{nome:<22} {linhas:>10,} linhas: {medida['tempo_min_s']:.3f} s (mediana {medida['tempo_mediana_s']:.3f} s){memoria}", flush=True)
+    return resultados
+
+
+def salvar_resultados(pasta, metadados, resultados):
+    os.makedirs(pasta, exist_ok=True)
+    caminho = os.path.join(pasta, f"{datetime.now():%Y%m%d-%H%M%S}.json")
+    with open(caminho, 'w', encoding='utf-8') as arquivo:
+        json.dump({'metadados': metadados, 'resultados': resultados}, arquivo, ensure_ascii=False, indent=2)
+    return caminho
+
+
+def resultado_anterior(pasta, atual):
+    anteriores = sorted(nome for nome in os.listdir(pasta) if nome.endswith('.json') and os.path.join(pasta, nome) != atual)
+    return os.path.join(pasta, anteriores[-1]) if anteriores else None
+
+
+def comparar(caminho_base, resultados):
+    # Razão atual/base por (etapa, linhas): abaixo de 1 é mais rápido (ou usa menos memória) que a base.
+    with open(caminho_base, encoding='utf-8') as arquivo:
+        base = pd.DataFrame(json.load(arquivo)['resultados'])
+    atual = pd.DataFrame(resultados)
+    if base.empty or atual.empty:
+        return None
+    juntos = atual.merge(base, on=['etapa', 'linhas'], suffixes=('', '_base'))
+    if juntos.empty:
+        return None
+    juntos['tempo_razao'] = juntos['tempo_min_s'] / juntos['tempo_min_s_base']
+    juntos['memoria_razao'] = juntos['pico_memoria_mb'].astype(float) / juntos['pico_memoria_mb_base'].astype(float)
+    return juntos[['etapa', 'linhas', 'tempo_min_s_base', 'tempo_min_s', 'tempo_razao', 'pico_memoria_mb_base', 'pico_memoria_mb', 'memoria_razao']]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark das etapas do pipeline com bases sintéticas.")
+    parser.add_argument('--linhas', type=int, nargs='+', default=LINHAS_PADRAO, help="Tamanhos das bases (ex.: 10000 100000 5000000).")
+    parser.add_argument('--etapas', nargs='+', choices=list(ETAPAS), default=list(ETAPAS))
+    parser.add_argument('--repeticoes', type=int, default=3)
+    parser.add_argument('--semente', type=int, default=0)
+    parser.add_argument('--leitura-economica', action='store_true', help="Força a leitura em blocos só com as colunas usadas.")
+    parser.add_argument('--sem-memoria', action='store_true', help="Não faz a execução extra sob tracemalloc.")
+    parser.add_argument('--pasta-dados', default=PASTA_DADOS)
+    parser.add_argument('--pasta-resultados', default=PASTA_RESULTADOS)
+    parser.add_argument('--comparar', default=None, help="JSON de uma execução anterior (padrão: a mais recente da pasta de resultados).")
+    argumentos = parser.parse_args(argv)
+
+    resultados = executar(argumentos)
+    caminho = salvar_resultados(argumentos.pasta_resultados, metadados_execucao(argumentos), resultados)
+    print(f"\nResultados salvos em {caminho}")
+    caminho_base = argumentos.comparar or resultado_anterior(argumentos.pasta_resultados, caminho)
+    if caminho_base:
+        comparacao = comparar(caminho_base, resultados)
+        if comparacao is not None:
+            print(f"\nComparação com {caminho_base}:")
+            print(comparacao.to_string(index=False, float_format=lambda v: f"{v:.3f}"))
+
+
+if __name__ == '__main__':
+    main()
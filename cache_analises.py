@@ -0,0 +1,117 @@
+import os
+import pickle
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from contextlib import contextmanager
+
+# ------------------------------------------------------------
+# CACHE EM DISCO DAS ANÁLISES GERADAS PELA IA
+# ------------------------------------------------------------
+# Chave: (versão do cache, impressão da base, pergunta normalizada). Guarda a expressão pandas gerada pelo modelo e,
+# quando é serializável, o resultado. Sobrevive a reinícios do processo; o tamanho total é limitado
+# e as entradas menos usadas recentemente são removidas primeiro.
+SEM_RESULTADO = object()
+
+# Entra na chave do cache: mudar a ingestão (tipos, datas, colunas) ou a montagem do prompt invalida
+# as expressões e resultados já guardados. Entradas de versões anteriores são removidas ao abrir o cache.
+VERSAO_CACHE_ANALISES = 1
+
+
+def normalizar_pergunta(pergunta):
+    texto = unicodedata.normalize('NFKC', str(pergunta)).lower()
+    texto = re.sub(r'\s+', ' ', texto).strip()
+    return texto.rstrip('?!. ')
+
+
+def _prefixo_versao():
+    return f"v{VERSAO_CACHE_ANALISES}:"
+
+
+def _chave(impressao, pergunta):
+    return _prefixo_versao() + str(impressao), normalizar_pergunta(pergunta)
+
+
+class CacheAnalises:
+
+    def __init__(self, caminho, limite_bytes):
+        self.caminho = caminho
+        self.limite_bytes = limite_bytes
+        self._trava = threading.Lock()
+        pasta = os.path.dirname(caminho)
+        if pasta:
+            os.makedirs(pasta, exist_ok=True)
+        with self._conectar() as conexao:
+            conexao.execute("""
+                CREATE TABLE IF NOT EXISTS analises (
+                    impressao TEXT NOT NULL,
+                    pergunta TEXT NOT NULL,
+                    expressao TEXT NOT NULL,
+                    resultado BLOB,
+                    tamanho INTEGER NOT NULL,
+                    ultimo_acesso REAL NOT NULL,
+                    PRIMARY KEY (impressao, pergunta)
+                )""")
+            conexao.execute("CREATE INDEX IF NOT EXISTS idx_analises_acesso ON analises (ultimo_acesso)")
+            conexao.execute("DELETE FROM analises WHERE substr(impressao, 1, ?) <> ?", (len(_prefixo_versao()), _prefixo_versao()))
+
+    @contextmanager
+    def _conectar(self):
+        conexao = sqlite3.connect(self.caminho, timeout=30)
+        try:
+            with conexao:
+                yield conexao
+        finally:
+            conexao.close()
+
+    def obter(self, impressao, pergunta):
+        # Retorna (expressao, resultado) ou None; resultado é SEM_RESULTADO quando só a expressão foi guardada.
+        chave = _chave(impressao, pergunta)
+        with self._trava, self._conectar() as conexao:
+            linha = conexao.execute("SELECT expressao, resultado FROM analises WHERE impressao = ? AND pergunta = ?", chave).fetchone()
+            if linha is None:
+                return None
+            conexao.execute("UPDATE analises SET ultimo_acesso = ? WHERE impressao = ? AND pergunta = ?", (time.time(),) + chave)
+        expressao, resultado = linha
+        if resultado is None:
+            return expressao, SEM_RESULTADO
+        try:
+            return expressao, pickle.loads(resultado)
+        except Exception:
+            return expressao, SEM_RESULTADO
+
+    def guardar(self, impressao, pergunta, expressao, resultado=SEM_RESULTADO):
+        serializado = None
+        if resultado is not SEM_RESULTADO:
+            try:
+                serializado = pickle.dumps(resultado, protocol=pickle.HIGHEST_PROTOCOL)
+            except Exception:
+                serializado = None
+        if serializado is not None and len(serializado) > self.limite_bytes:
+            serializado = None
+        tamanho = len(expressao.encode('utf-8')) + (len(serializado) if serializado is not None else 0)
+        with self._trava, self._conectar() as conexao:
+            conexao.execute("INSERT OR REPLACE INTO analises VALUES (?, ?, ?, ?, ?, ?)",
+                            _chave(impressao, pergunta) + (expressao, serializado, tamanho, time.time()))
+            self._remover_excedente(conexao)
+
+    def _remover_excedente(self, conexao):
+        uso = conexao.execute("SELECT COALESCE(SUM(tamanho), 0) FROM analises").fetchone()[0]
+        if uso <= self.limite_bytes:
+            return
+        for impressao, pergunta, tamanho in conexao.execute(
+                "SELECT impressao, pergunta, tamanho FROM analises ORDER BY ultimo_acesso").fetchall():
+            if uso <= self.limite_bytes:
+                break
+            conexao.execute("DELETE FROM analises WHERE impressao = ? AND pergunta = ?", (impressao, pergunta))
+            uso -= tamanho
+
+    def uso_bytes(self):
+        with self._conectar() as conexao:
+            return conexao.execute("SELECT COALESCE(SUM(tamanho), 0) FROM analises").fetchone()[0]
+
+    def __len__(self):
+        with self._conectar() as conexao:
+            return conexao.execute("SELECT COUNT(*) FROM analises").fetchone()[0]
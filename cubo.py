@@ -0,0 +1,35 @@
+import pandas as pd
+
+# ------------------------------------------------------------
+# CUBO DE AGREGAÇÃO DO DASHBOARD DE O.S.
+# ------------------------------------------------------------
+# Contagens por status x tipo de fechamento x cidade x RT x cliente, montadas uma vez por upload.
+# Os gráficos e filtros do dashboard fatiam o cubo (uma linha por combinação existente)
+# em vez de varrer as linhas da base a cada interação.
+PAPEIS_CUBO = ['status', 'tipo_fechamento', 'cidade', 'representante', 'cliente']
+COLUNA_QUANTIDADE = '__qtd__'
+
+
+def construir_cubo(df, esquema):
+    dimensoes = list(dict.fromkeys(esquema[papel] for papel in PAPEIS_CUBO if esquema.get(papel)))
+    if not dimensoes:
+        return pd.DataFrame({COLUNA_QUANTIDADE: [len(df)]})
+    return (df[dimensoes].groupby(dimensoes, observed=True, dropna=False, sort=False)
+            .size().rename(COLUNA_QUANTIDADE).reset_index())
+
+
+def fatiar_cubo(cubo, condicoes):
+    # condicoes: lista de (coluna, valor); todas precisam ser atendidas.
+    mascara = pd.Series(True, index=cubo.index)
+    for coluna, valor in condicoes:
+        mascara &= cubo[coluna] == valor
+    return cubo[mascara]
+
+
+def contagem_top(cubo, dimensao, condicoes=(), n=10):
+    contagens = fatiar_cubo(cubo, condicoes).groupby(dimensao, observed=True)[COLUNA_QUANTIDADE].sum()
+    return contagens[contagens > 0].nlargest(n).rename('count')
+
+
+def opcoes_dimensao(cubo, dimensao):
+    return sorted(cubo[dimensao].dropna().unique())
@@ -0,0 +1,89 @@
+import numpy as np
+import pandas as pd
+
+# ------------------------------------------------------------
+# NORMALIZAÇÃO DE MOEDA E NÚMEROS NO PADRÃO BRASILEIRO
+# ------------------------------------------------------------
+# Papel do esquema de pagamento -> coluna float criada no upload.
+CAMPOS_NUMERICOS_PAGAMENTO = {
+    'valor_deslocamento': 'VALOR_DESLOC_ORIGINAL',
+    'valor_extra': 'VALOR_EXTRA_NUM',
+    'pedagio': 'PEDAGIO_NUM',
+    'deslocamento_km': 'DESLOC_KM_NUM',
+    'valor_km': 'VALOR_KM_NUM',
+    'abrangencia': 'ABRANG_NUM',
+}
+TABELA_NUMERO_BR = str.maketrans({'R': None, '$': None, '.': None, ' ': None, '\xa0': None, ',': '.'})
+
+
+def converter_numero_br(serie):
+    # "R$ 1.234,56" -> 1234.56 em uma passada sobre os valores distintos.
+    # Retorna (valores float com NaN onde não há número, máscara das células que falharam).
+    if pd.api.types.is_numeric_dtype(serie.dtype) and not pd.api.types.is_bool_dtype(serie.dtype):
+        valores = serie.astype(float)
+        return valores, pd.Series(False, index=serie.index)
+    codigos, unicos = pd.factorize(serie, use_na_sentinel=True)
+    unicos = pd.Series(np.asarray(unicos, dtype=object))
+    eh_texto = unicos.map(lambda v: isinstance(v, str)).to_numpy(dtype=bool)
+    convertidos = np.array(pd.to_numeric(unicos.where(~eh_texto), errors='coerce'), dtype=float)
+    texto = unicos[eh_texto].str.translate(TABELA_NUMERO_BR)
+    convertidos[eh_texto] = pd.to_numeric(texto, errors='coerce').to_numpy(dtype=float)
+    falhou = np.isnan(convertidos) & ~(eh_texto & (unicos.str.strip() == '').fillna(False).to_numpy(dtype=bool))
+    valores = np.where(codigos >= 0, convertidos[codigos], np.nan)
+    falhas = np.where(codigos >= 0, falhou[codigos], False)
+    return pd.Series(valores, index=serie.index), pd.Series(falhas, index=serie.index)
+
+
+def normalizar_numeros_pagamento(df, esquema):
+    # Cria as colunas float da base de pagamento uma única vez (no upload) e conta as falhas.
+    novas_colunas, falhas = {}, {}
+    for papel, coluna_destino in CAMPOS_NUMERICOS_PAGAMENTO.items():
+        coluna_origem = esquema.get(papel)
+        if coluna_origem is None:
+            continue
+        valores, falhou = converter_numero_br(df[coluna_origem])
+        novas_colunas[coluna_destino] = valores
+        if falhou.any():
+            falhas[coluna_origem] = {
+                'quantidade': int(falhou.sum()),
+                'exemplos': pd.unique(df.loc[falhou.to_numpy(), coluna_origem].astype(str))[:5].tolist(),
+            }
+    return df.assign(**novas_colunas), falhas
+
+# ------------------------------------------------------------
+# ANÁLISE DE DUPLICIDADE DE DESLOCAMENTO
+# ------------------------------------------------------------
+OBSERVACAO_DUPLICIDADE = "Duplicidade (Custo Zerado)"
+
+
+def formatar_reais(valor):
+    return f"R$ {valor:,.2f}".replace(',', '_').replace('.', ',').replace('_', '.')
+
+
+def detectar_duplicidades(df, group_keys, os_col):
+    # Equivale a groupby(group_keys).filter(lambda x: len(x) > 1), sem lambda por grupo:
+    # linhas com chave incompleta ficam fora (como no groupby com dropna=True) e só a
+    # primeira ordem de cada grupo mantém o VALOR_CALCULADO.
+    chave_completa = df[group_keys].notna().all(axis=1).to_numpy()
+    em_grupo_duplicado = df.duplicated(subset=group_keys, keep=False).to_numpy() & chave_completa
+    duplicados = df[em_grupo_duplicado].copy()
+    if duplicados.empty:
+        return duplicados, pd.DataFrame(columns=group_keys + ['Ordens no Grupo', 'Duplicidades', 'Valor Zerado'])
+
+    duplicados['is_first'] = ~duplicados.duplicated(subset=group_keys, keep='first')
+    duplicados['VALOR_CALCULADO_AJUSTADO'] = np.where(duplicados['is_first'], duplicados['VALOR_CALCULADO'], 0)
+    duplicados['OBSERVACAO'] = np.where(duplicados['is_first'], duplicados['OBSERVACAO'], OBSERVACAO_DUPLICIDADE)
+    df_resultado = duplicados.sort_values(by=group_keys + [os_col])
+
+    totais = pd.DataFrame({
+        'Duplicidades': (~duplicados['is_first']).astype(int),
+        'Valor Zerado': duplicados['VALOR_CALCULADO'] - duplicados['VALOR_CALCULADO_AJUSTADO'],
+    })
+    for chave in group_keys:
+        totais[chave] = duplicados[chave]
+    resumo = (totais.groupby(group_keys, observed=True, sort=False)
+              .agg(**{'Ordens no Grupo': ('Duplicidades', 'size'), 'Duplicidades': ('Duplicidades', 'sum'), 'Valor Zerado': ('Valor Zerado', 'sum')})
+              .reset_index()
+              .sort_values('Valor Zerado', ascending=False, kind='stable')
+              .reset_index(drop=True))
+    return df_resultado, resumo
@@ -0,0 +1,100 @@
+import numpy as np
+import pandas as pd
+
+from esquema import resolver_esquema
+
+# ------------------------------------------------------------
+# NORMALIZAÇÃO DE DATAS NA INGESTÃO
+# ------------------------------------------------------------
+# Cada coluna de data do esquema tem o formato inferido uma vez a partir de uma amostra e é convertida
+# com esse formato explícito (sem inferência por elemento), sobre os valores distintos. A coluna
+# original é substituída pela versão datetime, compartilhada por todas as seções. Valores fora do formato
+# inferido são relidos com os demais candidatos; os que ainda falham são contados e informados no upload.
+PAPEIS_DATA = {
+    'df_dados': ['data_agendamento'],
+    'df_pagamento': ['data_fechamento'],
+    'df_devolucao': ['prazo_instalacao'],
+}
+# Em empate, vence o primeiro: o padrão brasileiro (dia antes do mês) tem prioridade.
+FORMATOS_CANDIDATOS = [
+    '%d/%m/%Y %H:%M:%S', '%d/%m/%Y %H:%M', '%d/%m/%Y', '%d/%m/%y %H:%M', '%d/%m/%y',
+    '%Y-%m-%d %H:%M:%S', '%Y-%m-%dT%H:%M:%S', '%Y-%m-%d %H:%M', '%Y-%m-%d',
+    '%d-%m-%Y %H:%M:%S', '%d-%m-%Y', '%d.%m.%Y', '%Y/%m/%d', '%m/%d/%Y %H:%M:%S', '%m/%d/%Y',
+]
+TAMANHO_AMOSTRA_DATAS = 500
+ACERTO_MINIMO_FORMATO = 0.9
+
+
+def inferir_formato_data(valores):
+    # Retorna o formato que converte a maior fração da amostra (>= ACERTO_MINIMO_FORMATO) ou None.
+    amostra = pd.Series(pd.unique(pd.Series(valores).dropna().astype(str).str.strip()))
+    amostra = amostra[amostra != ''].head(TAMANHO_AMOSTRA_DATAS)
+    if amostra.empty:
+        return None
+    melhor, melhor_acerto = None, 0.0
+    for formato in FORMATOS_CANDIDATOS:
+        acerto = pd.to_datetime(amostra, format=formato, errors='coerce').notna().mean()
+        if acerto > melhor_acerto:
+            melhor, melhor_acerto = formato, acerto
+        if acerto == 1.0:
+            break
+    return melhor if melhor_acerto >= ACERTO_MINIMO_FORMATO else None
+
+
+def _converter_misto(texto):
+    # Cada valor no primeiro formato candidato que o aceita; o que sobrar, por inferência com dia primeiro.
+    # A inferência fica por último porque, com dayfirst, "2024-04-07" vira 4 de julho.
+    datas = pd.Series(pd.NaT, index=texto.index, dtype='datetime64[ns]')
+    for formato in FORMATOS_CANDIDATOS:
+        pendentes = datas.isna()
+        if not pendentes.any():
+            return datas
+        datas[pendentes] = pd.to_datetime(texto[pendentes], format=formato, errors='coerce')
+    pendentes = datas.isna()
+    if pendentes.any():
+        datas[pendentes] = pd.to_datetime(texto[pendentes], dayfirst=True, errors='coerce', format='mixed')
+    return datas
+
+
+def converter_datas(serie, formato):
+    # Retorna (datas, reconvertidas, nao_convertidas). Converte só os valores distintos e espalha pelos
+    # códigos (datas se repetem muito nas exportações). Com formato, os valores que não o seguem (ex.: 5%
+    # com horário) são relidos no modo misto; nao_convertidas conta as linhas que ainda ficaram NaT.
+    codigos, unicos = pd.factorize(serie, use_na_sentinel=True)
+    texto = pd.Series(unicos, dtype=object).astype(str).str.strip()
+    reconvertidas = 0
+    if formato is not None:
+        datas = pd.to_datetime(texto, format=formato, errors='coerce')
+        falhas = datas.isna() & (texto != '')
+        if falhas.any():
+            datas[falhas] = _converter_misto(texto[falhas])
+            reconvertidas = int(np.isin(codigos, np.flatnonzero((falhas & datas.notna()).to_numpy())).sum())
+    else:
+        datas = _converter_misto(texto)
+    nao_convertidas = int(np.isin(codigos, np.flatnonzero((datas.isna() & (texto != '')).to_numpy())).sum())
+    # O código -1 (nulo) cai no NaT acrescentado ao fim.
+    valores = np.append(datas.to_numpy(dtype='datetime64[ns]'), np.datetime64('NaT', 'ns'))[codigos]
+    return pd.Series(valores, index=serie.index), reconvertidas, nao_convertidas
+
+
+def normalizar_datas(df, tipo_base):
+    # Retorna (df com as colunas de data tipadas, {coluna: formato usado}, {coluna: linhas não convertidas}).
+    esquema = resolver_esquema(df.columns, tipo_base)
+    novas, formatos, nao_convertidas = {}, {}, {}
+    for papel in PAPEIS_DATA.get(tipo_base, []):
+        coluna = esquema.get(papel)
+        if coluna is None or pd.api.types.is_datetime64_any_dtype(df[coluna].dtype):
+            continue
+        formato = inferir_formato_data(df[coluna])
+        novas[coluna], reconvertidas, falhas = converter_datas(df[coluna], formato)
+        formatos[coluna] = formato or 'misto (dia primeiro)'
+        if reconvertidas:
+            formatos[coluna] += f" + {reconvertidas} em formato misto"
+        if falhas:
+            nao_convertidas[coluna] = falhas
+    if not novas:
+        return df, formatos, nao_convertidas
+    atributos = dict(df.attrs)
+    df = df.assign(**novas)
+    df.attrs.update(atributos)
+    return df, formatos, nao_convertidas
@@ -0,0 +1,94 @@
+import io
+import re
+import unicodedata
+import zipfile
+
+import numpy as np
+import pandas as pd
+
+# ------------------------------------------------------------
+# ORDENS VENCIDAS DA BASE DE DEVOLUÇÃO
+# ------------------------------------------------------------
+# O prazo de instalação já chega tipado da ingestão (datas.py). O índice de vencidas é montado uma vez por dia
+# (posições agrupadas por cliente), então trocar de cliente é só um fatiamento, e a exportação em
+# lote percorre as vencidas uma única vez, já ordenadas por cliente, gravando cada arquivo no ZIP.
+COLUNA_DIAS_ATRASO = 'Dias em Atraso'
+FAIXAS_ATRASO = [(1, 7, '1 a 7 dias'), (8, 15, '8 a 15 dias'), (16, 30, '16 a 30 dias'),
+                 (31, 60, '31 a 60 dias'), (61, 90, '61 a 90 dias'), (91, None, 'Mais de 90 dias')]
+
+
+def nome_arquivo_cliente(cliente):
+    texto = unicodedata.normalize('NFKD', str(cliente))
+    texto = ''.join(c for c in texto if not unicodedata.combining(c))
+    return re.sub(r'[^a-z0-9]+', '_', texto.lower()).strip('_') or 'sem_nome'
+
+
+def faixa_atraso(dias):
+    rotulos = np.array([rotulo for _, _, rotulo in FAIXAS_ATRASO], dtype=object)
+    limites = np.array([inicio for inicio, _, _ in FAIXAS_ATRASO[1:]])
+    return pd.Categorical(rotulos[np.searchsorted(limites, dias, side='right')], categories=list(rotulos), ordered=True)
+
+
+class IndiceVencidas:
+
+    def __init__(self, df, prazo_col, cliente_col, hoje):
+        self.df = df
+        self.cliente_col = cliente_col
+        self.hoje = hoje
+        # Atraso em dias de calendário: o horário do prazo (e de hoje) não conta, então uma ordem vencida
+        # tem sempre pelo menos 1 dia de atraso e cai numa faixa coerente com os dias mostrados.
+        self._hoje_dia = np.datetime64(hoje).astype('datetime64[D]')
+        prazo = df[prazo_col].to_numpy(dtype='datetime64[ns]').astype('datetime64[D]')
+        vencidas = np.flatnonzero(prazo < self._hoje_dia)
+        clientes = df[cliente_col].iloc[vencidas].astype(object)
+        com_cliente = clientes.notna().to_numpy()
+        self.total = len(vencidas)
+        self.sem_cliente = int((~com_cliente).sum())
+        self._dias_todas = self._dias_de_atraso(prazo[vencidas])
+        # Ordem estável por cliente: cada cliente ocupa um trecho contíguo de self.posicoes.
+        vencidas, clientes = vencidas[com_cliente], clientes[com_cliente].astype(str).to_numpy()
+        ordem = np.argsort(clientes, kind='stable')
+        self.posicoes = vencidas[ordem]
+        self.dias = self._dias_de_atraso(prazo[self.posicoes])
+        nomes, inicios = np.unique(clientes[ordem], return_index=True)
+        fins = np.r_[inicios[1:], len(self.posicoes)]
+        self.trechos = {nome: slice(inicio, fim) for nome, inicio, fim in zip(nomes, inicios, fins)}
+
+    def _dias_de_atraso(self, prazos):
+        return (self._hoje_dia - prazos).astype(int)
+
+    @property
+    def clientes(self):
+        return list(self.trechos)
+
+    def ordens_do_cliente(self, cliente, colunas=None):
+        trecho = self.trechos.get(str(cliente), slice(0, 0))
+        ordens = self.df.iloc[self.posicoes[trecho]]
+        if colunas is not None:
+            ordens = ordens[colunas]
+        return ordens.assign(**{COLUNA_DIAS_ATRASO: self.dias[trecho]})
+
+    def envelhecimento(self, cliente=None):
+        dias = self._dias_todas if cliente is None else self.dias[self.trechos.get(str(cliente), slice(0, 0))]
+        contagem = pd.Series(faixa_atraso(dias)).value_counts(sort=False)
+        return contagem.rename_axis('Atraso').reset_index(name='Ordens')
+
+    def exportar_zip(self, colunas, formato='csv'):
+        # Um arquivo por cliente no mesmo ZIP, escrito direto na entrada do ZIP (sem montar cada arquivo antes).
+        buffer = io.BytesIO()
+        usados = set()
+        with zipfile.ZipFile(buffer, 'w', compression=zipfile.ZIP_DEFLATED) as zf:
+            for cliente, trecho in self.trechos.items():
+                base = nome = f"devolutiva_{nome_arquivo_cliente(cliente)}"
+                sufixo = 2
+                while nome in usados:
+                    nome, sufixo = f"{base}_{sufixo}", sufixo + 1
+                usados.add(nome)
+                ordens = self.df.iloc[self.posicoes[trecho]][colunas].assign(**{COLUNA_DIAS_ATRASO: self.dias[trecho]})
+                with zf.open(f"{nome}.{formato}", 'w') as destino:
+                    if formato == 'xlsx':
+                        ordens.to_excel(destino, index=False, engine='openpyxl')
+                    else:
+                        with io.TextIOWrapper(destino, encoding='utf-8-sig', newline='') as texto:
+                            ordens.to_csv(texto, index=False, sep=';')
+        return buffer.getvalue()
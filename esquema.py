@@ -0,0 +1,89 @@
+import re
+
+# ------------------------------------------------------------
+# RESOLUÇÃO DE ESQUEMA (PAPÉIS SEMÂNTICOS DAS COLUNAS)
+# ------------------------------------------------------------
+# Para cada base, cada papel tem regras em ordem de prioridade; a primeira regra que encontra
+# uma coluna vence. Regras: ('igual', nome), ('contem', trecho) ou ('regex', padrão), sempre sobre
+# o nome normalizado (minúsculas, espaços simples). 'excluir' descarta colunas para aquele papel.
+SEM_ID = r'(^|[^a-z0-9])id([^a-z0-9]|$)'
+PALAVRA_OS = r'(^|[^a-z0-9])o\.?s\.?([^a-z0-9]|$)'
+
+PAPEIS_POR_BASE = {
+    'df_dados': {
+        'os_id': {'regras': [('contem', 'número da o.s'), ('contem', 'numero da o.s'), ('contem', 'numeropedido'),
+                             ('igual', 'os'), ('igual', 'o.s.'), ('regex', PALAVRA_OS)],
+                  'excluir': [r'status', r'cidade', r'data', r'cliente', r'representante']},
+        'status': {'regras': [('igual', 'status'), ('contem', 'status')]},
+        'representante': {'regras': [('contem', 'representante técnico'), ('contem', 'representante')], 'excluir': [SEM_ID]},
+        'cidade': {'regras': [('contem', 'cidade agendamento'), ('contem', 'cidade o.s.')]},
+        'tipo_fechamento': {'regras': [('contem', 'tipo de fechamento')]},
+        'cliente': {'regras': [('igual', 'cliente'), ('contem', 'cliente')], 'excluir': [SEM_ID]},
+        'data_agendamento': {'regras': [('contem', 'data agendamento')]},
+    },
+    'df_mapeamento': {
+        'cidade': {'regras': [('igual', 'nm_cidade_atendimento')]},
+        'representante': {'regras': [('igual', 'nm_representante')]},
+        'lat_atendimento': {'regras': [('igual', 'cd_latitude_atendimento')]},
+        'lon_atendimento': {'regras': [('igual', 'cd_longitude_atendimento')]},
+        'distancia_km': {'regras': [('igual', 'qt_distancia_atendimento_km')]},
+        'lat_representante': {'regras': [('igual', 'cd_latitude_representante')]},
+        'lon_representante': {'regras': [('igual', 'cd_longitude_representante')]},
+    },
+    'df_devolucao': {
+        'prazo_instalacao': {'regras': [('regex', r'prazo ?instala[cç][aã]o')]},
+        'cliente': {'regras': [('regex', r'cliente ?nome')]},
+    },
+    'df_pagamento': {
+        'os_id': {'regras': [('igual', 'os'), ('igual', 'o.s.'), ('contem', 'número da o.s'), ('regex', PALAVRA_OS)],
+                  'excluir': [r'cidade', r'data', r'valor']},
+        'data_fechamento': {'regras': [('contem', 'data de fechamento')]},
+        'cidade_os': {'regras': [('contem', 'cidade o.s.')]},
+        'cidade_rt': {'regras': [('contem', 'cidade rt')]},
+        'representante': {'regras': [('igual', 'representante'), ('contem', 'representante')], 'excluir': [r'nome fantasia']},
+        'tecnico': {'regras': [('igual', 'técnico'), ('contem', 'técnico')]},
+        'valor_deslocamento': {'regras': [('contem', 'valor deslocamento')]},
+        'deslocamento_km': {'regras': [('igual', 'deslocamento')]},
+        'valor_km': {'regras': [('contem', 'valor km rt')]},
+        'abrangencia': {'regras': [('contem', 'abrangência rt')]},
+        'valor_extra': {'regras': [('contem', 'valor extra')]},
+        'pedagio': {'regras': [('contem', 'pedágio')]},
+    },
+}
+
+# Bases exportadas com todas as colunas: a leitura econômica não as poda.
+BASES_SEM_PODA = {'df_devolucao'}
+
+
+def normalizar_nome_coluna(coluna):
+    return re.sub(r'\s+', ' ', str(coluna).strip().lower())
+
+
+def _atende(nome, tipo, valor):
+    if tipo == 'igual':
+        return nome == valor
+    if tipo == 'contem':
+        return valor in nome
+    return re.search(valor, nome) is not None
+
+
+def resolver_esquema(colunas, tipo_base):
+    # Retorna {papel: coluna ou None}; é calculado uma vez por upload e guardado na sessão.
+    papeis = PAPEIS_POR_BASE.get(tipo_base, {})
+    nomes = [(coluna, normalizar_nome_coluna(coluna)) for coluna in colunas]
+    esquema = {}
+    for papel, definicao in papeis.items():
+        candidatos = [(coluna, nome) for coluna, nome in nomes
+                      if not any(re.search(padrao, nome) for padrao in definicao.get('excluir', []))]
+        esquema[papel] = next((coluna for tipo, valor in definicao['regras']
+                               for coluna, nome in candidatos if _atende(nome, tipo, valor)), None)
+    return esquema
+
+
+def colunas_do_esquema(colunas, tipo_base):
+    # Colunas efetivamente usadas pelo app (para a leitura econômica); bases sem papéis ficam inteiras.
+    if tipo_base not in PAPEIS_POR_BASE or tipo_base in BASES_SEM_PODA:
+        return list(colunas)
+    usadas = {coluna for coluna in resolver_esquema(colunas, tipo_base).values() if coluna is not None}
+    return [coluna for coluna in colunas if coluna in usadas]
+
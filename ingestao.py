@@ -0,0 +1,552 @@
+import codecs
+import contextlib
+import csv
+import hashlib
+import os
+import re
+import threading
+from collections import Counter, OrderedDict
+from dataclasses import dataclass, replace
+
+import openpyxl
+import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+from datas import normalizar_datas
+from esquema import colunas_do_esquema, resolver_esquema
+
+# ------------------------------------------------------------
+# DETECÇÃO DO DIALETO CSV
+# ------------------------------------------------------------
+TAMANHO_AMOSTRA_CSV = 64 * 1024
+SEPARADORES_CANDIDATOS = [';', ',', '\t', '|']
+PADRAO_DECIMAL_VIRGULA = re.compile(r'^-?\d+,\d+$')
+PADRAO_DECIMAL_PONTO = re.compile(r'^-?\d+\.\d+$')
+
+
+@dataclass(frozen=True)
+class DialetoCSV:
+    separador: str
+    encoding: str
+    decimal: str
+    linha_cabecalho: int
+
+
+def _detectar_encoding(amostra, amostra_completa):
+    if amostra.startswith(codecs.BOM_UTF8):
+        return 'utf-8-sig'
+    try:
+        amostra.decode('utf-8')
+        return 'utf-8'
+    except UnicodeDecodeError as e:
+        # A amostra pode terminar no meio de um caractere multibyte.
+        if not amostra_completa and e.start >= len(amostra) - 3:
+            return 'utf-8'
+        return 'latin-1'
+
+
+def detectar_dialeto_csv(arquivo, separador_padrao=','):
+    arquivo.seek(0)
+    amostra = arquivo.read(TAMANHO_AMOSTRA_CSV)
+    arquivo.seek(0)
+    amostra_completa = len(amostra) < TAMANHO_AMOSTRA_CSV
+    encoding = _detectar_encoding(amostra, amostra_completa)
+    linhas = amostra.decode(encoding, errors='replace').splitlines()
+    if not amostra_completa and len(linhas) > 1:
+        linhas = linhas[:-1]
+    linhas_uteis = [(i, linha) for i, linha in enumerate(linhas) if linha.strip()]
+    if not linhas_uteis:
+        return DialetoCSV(separador_padrao, encoding, '.', 0)
+
+    # Escolhe o separador cuja contagem de campos é a mais consistente entre as linhas.
+    melhor = None
+    for separador in sorted(SEPARADORES_CANDIDATOS, key=lambda c: c != separador_padrao):
+        registros = list(csv.reader([linha for _, linha in linhas_uteis], delimiter=separador))
+        contagens = [len(campos) for campos in registros]
+        modal, ocorrencias = Counter(contagens).most_common(1)[0]
+        if modal < 2:
+            continue
+        pontuacao = (ocorrencias / len(contagens), modal)
+        if melhor is None or pontuacao > melhor[0]:
+            melhor = (pontuacao, separador, modal, registros)
+    if melhor is None:
+        return DialetoCSV(separador_padrao, encoding, '.', 0)
+    (fracao, _), separador, modal, registros = melhor
+
+    # Cabeçalho: primeira linha com o número de campos predominante (pula preâmbulos de exportação).
+    # Exportações de ERP costumam terminar cada linha de dados com o separador: o último campo vem
+    # vazio e o cabeçalho tem um campo a menos que as linhas de dados.
+    minimo = modal
+    com_separador_final = sum(1 for campos in registros if len(campos) == modal and not campos[-1].strip())
+    if modal > 2 and com_separador_final > fracao * len(registros) / 2:
+        minimo = modal - 1
+    posicao_cabecalho = next(i for i, campos in enumerate(registros) if len(campos) >= minimo)
+    linha_cabecalho = linhas_uteis[posicao_cabecalho][0]
+
+    # Decimal: voto por coluna, só entre os campos numéricos. Basta uma coluna de valores "10,5" para
+    # escolher vírgula; colunas com ponto (coordenadas "-23.5") seguem como texto e são convertidas
+    # com pd.to_numeric onde são usadas.
+    decimal = '.'
+    if separador != ',':
+        votos = {}
+        for campos in registros[posicao_cabecalho + 1:]:
+            for coluna, campo in enumerate(campos):
+                campo = campo.strip()
+                virgula, ponto = bool(PADRAO_DECIMAL_VIRGULA.match(campo)), bool(PADRAO_DECIMAL_PONTO.match(campo))
+                if virgula or ponto:
+                    contagem = votos.setdefault(coluna, [0, 0])
+                    contagem[0] += virgula
+                    contagem[1] += ponto
+        if any(virgulas > pontos for virgulas, pontos in votos.values()):
+            decimal = ','
+    return DialetoCSV(separador, encoding, decimal, linha_cabecalho)
+
+# ------------------------------------------------------------
+# LEITURA ECONÔMICA (EM BLOCOS, SÓ COM AS COLUNAS USADAS)
+# ------------------------------------------------------------
+LIMITE_LEITURA_EM_BLOCOS_BYTES = 100 * 1024 * 1024
+LINHAS_POR_BLOCO = 200_000
+LIMITE_CARDINALIDADE_CATEGORIA = 0.5
+
+def compactar_tipos(df):
+    # Texto repetitivo vira category; inteiros são reduzidos ao menor tipo que os comporta.
+    # Floats ficam em float64 para não perder centavos nem precisão de coordenadas.
+    compactado = {}
+    for col in df.columns:
+        serie = df[col]
+        if pd.api.types.is_integer_dtype(serie.dtype):
+            compactado[col] = pd.to_numeric(serie, downcast='integer')
+        elif (pd.api.types.is_object_dtype(serie.dtype) or pd.api.types.is_string_dtype(serie.dtype)) and len(serie) > 0 \
+                and serie.nunique(dropna=True) <= LIMITE_CARDINALIDADE_CATEGORIA * len(serie):
+            compactado[col] = serie.astype('category')
+        else:
+            compactado[col] = serie
+    return pd.DataFrame(compactado, index=df.index)
+
+
+def compactar_com_relatorio(df):
+    # Compacta e registra em df.attrs['memoria'] o uso de memória antes e depois, em bytes.
+    antes = tamanho_dataframe(df)
+    compacto = compactar_tipos(df)
+    compacto.attrs['memoria'] = {'antes': antes, 'depois': tamanho_dataframe(compacto)}
+    return compacto
+
+
+def concatenar_blocos(blocos):
+    if not blocos:
+        return pd.DataFrame()
+    colunas = {}
+    for col in blocos[0].columns:
+        partes = [bloco[col] for bloco in blocos]
+        if all(isinstance(parte.dtype, pd.CategoricalDtype) for parte in partes):
+            colunas[col] = pd.Series(union_categoricals(partes, ignore_order=True))
+        else:
+            partes = [parte.astype(object) if isinstance(parte.dtype, pd.CategoricalDtype) else parte for parte in partes]
+            colunas[col] = pd.concat(partes, ignore_index=True)
+    return pd.DataFrame(colunas)
+
+
+def _tamanho_arquivo(arquivo):
+    posicao = arquivo.tell()
+    arquivo.seek(0, 2)
+    tamanho = arquivo.tell()
+    arquivo.seek(posicao)
+    return tamanho
+
+
+def ler_csv_em_blocos(arquivo, dialeto, tipo_base=None, ao_progredir=None):
+    opcoes = dict(sep=dialeto.separador, encoding=dialeto.encoding, decimal=dialeto.decimal,
+                  skiprows=dialeto.linha_cabecalho, on_bad_lines='skip', index_col=False)
+    arquivo.seek(0)
+    colunas = list(pd.read_csv(arquivo, nrows=0, **opcoes).columns)
+    arquivo.seek(0)
+    total_bytes = max(_tamanho_arquivo(arquivo), 1)
+    blocos = []
+    memoria_antes = 0
+    for bloco in pd.read_csv(arquivo, usecols=colunas_do_esquema(colunas, tipo_base), chunksize=LINHAS_POR_BLOCO, **opcoes):
+        memoria_antes += tamanho_dataframe(bloco)
+        blocos.append(compactar_tipos(bloco))
+        if ao_progredir:
+            ao_progredir(min(arquivo.tell() / total_bytes, 1.0))
+    df = concatenar_blocos(blocos)
+    df.attrs['memoria'] = {'antes': memoria_antes, 'depois': tamanho_dataframe(df)}
+    return df
+
+# ------------------------------------------------------------
+# LEITURA DE EXCEL (SÓ A ABA ESCOLHIDA, EM MODO SOMENTE LEITURA)
+# ------------------------------------------------------------
+# As abas são listadas sem carregar as planilhas. A aba escolhida é percorrida linha a linha e só as
+# colunas selecionadas são guardadas, sem montar a planilha inteira em memória.
+def _eh_xlsx(arquivo):
+    return arquivo.name.lower().endswith('.xlsx')
+
+
+def _abrir_xlsx(arquivo):
+    arquivo.seek(0)
+    return openpyxl.load_workbook(arquivo, read_only=True, data_only=True, keep_links=False)
+
+
+def _abrir_xls(arquivo):
+    import xlrd  # só necessário para .xls
+    return xlrd.open_workbook(file_contents=arquivo.getvalue(), on_demand=True)
+
+
+def listar_abas(arquivo):
+    if _eh_xlsx(arquivo):
+        livro = _abrir_xlsx(arquivo)
+        try:
+            return list(livro.sheetnames)
+        finally:
+            livro.close()
+    livro = _abrir_xls(arquivo)
+    try:
+        return livro.sheet_names()
+    finally:
+        livro.release_resources()
+
+
+def _linhas_xlsx(arquivo, aba):
+    livro = _abrir_xlsx(arquivo)
+    try:
+        yield from livro[aba].iter_rows(values_only=True)
+    finally:
+        livro.close()
+
+
+def _linhas_xls(arquivo, aba):
+    import xlrd
+    livro = _abrir_xls(arquivo)
+    try:
+        planilha = livro.sheet_by_name(aba)
+        for r in range(planilha.nrows):
+            linha = []
+            for celula in planilha.row(r):
+                if celula.ctype in (xlrd.XL_CELL_EMPTY, xlrd.XL_CELL_BLANK, xlrd.XL_CELL_ERROR):
+                    linha.append(None)
+                elif celula.ctype == xlrd.XL_CELL_DATE:
+                    linha.append(xlrd.xldate_as_datetime(celula.value, livro.datemode))
+                elif celula.ctype == xlrd.XL_CELL_NUMBER and celula.value.is_integer():
+                    linha.append(int(celula.value))
+                elif celula.ctype == xlrd.XL_CELL_BOOLEAN:
+                    linha.append(bool(celula.value))
+                else:
+                    linha.append(celula.value)
+            yield linha
+    finally:
+        livro.release_resources()
+
+
+def _nomes_colunas(cabecalho):
+    # Mesmas regras do pandas: cabeçalho vazio vira "Unnamed: i" e nomes repetidos ganham ".1", ".2"...
+    nomes, vistos = [], Counter()
+    for i, valor in enumerate(cabecalho):
+        nome = f"Unnamed: {i}" if valor is None or str(valor).strip() == '' else valor
+        repeticoes = vistos[nome]
+        vistos[nome] += 1
+        nomes.append(f"{nome}.{repeticoes}" if repeticoes else nome)
+    return nomes
+
+
+def ler_aba_excel(arquivo, aba=None, selecionar=None):
+    # selecionar(nomes) -> nomes a manter; sem ele, todas as colunas. Linhas totalmente vazias são ignoradas.
+    aba = aba or listar_abas(arquivo)[0]
+    linhas = _linhas_xlsx(arquivo, aba) if _eh_xlsx(arquivo) else _linhas_xls(arquivo, aba)
+    cabecalho = next((linha for linha in linhas if any(v is not None for v in linha)), None)
+    if cabecalho is None:
+        return pd.DataFrame()
+    nomes = _nomes_colunas(cabecalho)
+    mantidas = set(selecionar(nomes)) if selecionar else set(nomes)
+    indices = [i for i, nome in enumerate(nomes) if nome in mantidas]
+    valores = {i: [] for i in indices}
+    for linha in linhas:
+        if all(v is None for v in linha):
+            continue
+        tamanho = len(linha)
+        for i in indices:
+            valores[i].append(linha[i] if i < tamanho else None)
+    return pd.DataFrame({nomes[i]: valores[i] for i in indices})
+
+# ------------------------------------------------------------
+# LEITURA DE ARQUIVOS
+# ------------------------------------------------------------
+def usar_leitura_em_blocos(arquivo, em_blocos=None):
+    if em_blocos is not None:
+        return em_blocos
+    return _tamanho_arquivo(arquivo) > LIMITE_LEITURA_EM_BLOCOS_BYTES
+
+
+def carregar_dataframe(arquivo, separador_padrao=',', tipo_base=None, em_blocos=None, ao_progredir=None, aba=None):
+    df = _ler_arquivo(arquivo, separador_padrao=separador_padrao, tipo_base=tipo_base, em_blocos=em_blocos, ao_progredir=ao_progredir, aba=aba)
+    if df is None:
+        return None
+    # Datas do esquema tipadas uma única vez aqui; o frame em cache já sai com elas convertidas.
+    df, formatos, nao_convertidas = normalizar_datas(df, tipo_base)
+    df.attrs['formatos_data'] = formatos
+    df.attrs['datas_nao_convertidas'] = nao_convertidas
+    if formatos and 'memoria' in df.attrs:
+        df.attrs['memoria'] = {**df.attrs['memoria'], 'depois': tamanho_dataframe(df)}
+    return df
+
+
+def _ler_arquivo(arquivo, separador_padrao=',', tipo_base=None, em_blocos=None, ao_progredir=None, aba=None):
+    nome_arquivo = arquivo.name.lower()
+    economico = usar_leitura_em_blocos(arquivo, em_blocos)
+    if nome_arquivo.endswith(('.xlsx', '.xls')):
+        selecionar = (lambda nomes: colunas_do_esquema(nomes, tipo_base)) if economico else None
+        return compactar_com_relatorio(ler_aba_excel(arquivo, aba, selecionar=selecionar))
+    elif nome_arquivo.endswith('.csv'):
+        dialeto = detectar_dialeto_csv(arquivo, separador_padrao=separador_padrao)
+        try:
+            df = _ler_csv(arquivo, dialeto, economico, tipo_base, ao_progredir)
+        except UnicodeDecodeError:
+            # A amostra só tinha ASCII (ou UTF-8 válido), mas o restante do arquivo é latin-1.
+            if dialeto.encoding == 'latin-1':
+                raise
+            dialeto = replace(dialeto, encoding='latin-1')
+            df = _ler_csv(arquivo, dialeto, economico, tipo_base, ao_progredir)
+        df.attrs['dialeto'] = dialeto
+        return df
+    return None
+
+
+def _ler_csv(arquivo, dialeto, economico, tipo_base, ao_progredir):
+    if economico:
+        return ler_csv_em_blocos(arquivo, dialeto, tipo_base=tipo_base, ao_progredir=ao_progredir)
+    arquivo.seek(0)
+    return compactar_com_relatorio(pd.read_csv(arquivo, sep=dialeto.separador, encoding=dialeto.encoding, decimal=dialeto.decimal,
+                                               skiprows=dialeto.linha_cabecalho, on_bad_lines='skip', index_col=False))
+
+# ------------------------------------------------------------
+# CACHE DE INGESTÃO (chaveado pelo conteúdo do arquivo)
+# ------------------------------------------------------------
+def hash_conteudo(arquivo):
+    return hashlib.blake2b(arquivo.getvalue(), digest_size=16).hexdigest()
+
+
+def tamanho_dataframe(df):
+    return int(df.memory_usage(index=True, deep=True).sum())
+
+
+# Entra na chave do cache colunar: mudar o processamento da ingestão invalida o que já está em disco.
+VERSAO_CACHE_COLUNAR = 1
+
+
+class CacheIngestao:
+    # LRU de DataFrames já processados, limitado pela memória ocupada.
+    # Os frames guardados são compartilhados: quem os recebe não deve alterá-los no lugar.
+
+    def __init__(self, limite_bytes):
+        self.limite_bytes = limite_bytes
+        self._itens = OrderedDict()
+        self._uso_bytes = 0
+        self._trava = threading.Lock()
+
+    @property
+    def uso_bytes(self):
+        return self._uso_bytes
+
+    def __len__(self):
+        return len(self._itens)
+
+    def obter(self, chave):
+        with self._trava:
+            item = self._itens.get(chave)
+            if item is None:
+                return None
+            self._itens.move_to_end(chave)
+            return item[0]
+
+    def guardar(self, chave, df):
+        tamanho = tamanho_dataframe(df)
+        with self._trava:
+            if chave in self._itens:
+                self._uso_bytes -= self._itens.pop(chave)[1]
+            if tamanho > self.limite_bytes:
+                return False
+            self._itens[chave] = (df, tamanho)
+            self._uso_bytes += tamanho
+            while self._uso_bytes > self.limite_bytes:
+                _, (_, tamanho_removido) = self._itens.popitem(last=False)
+                self._uso_bytes -= tamanho_removido
+            return True
+
+
+def _colunas_mistas_como_texto(df):
+    import pyarrow as pa
+    convertidas = {}
+    for col in df.columns:
+        serie = df[col]
+        if isinstance(serie.dtype, pd.CategoricalDtype):
+            valores = serie.cat.categories
+        elif serie.dtype == object:
+            valores = serie
+        else:
+            continue
+        try:
+            pa.array(valores, from_pandas=True)
+        except (pa.ArrowInvalid, pa.ArrowTypeError, pa.ArrowNotImplementedError):
+            if isinstance(serie.dtype, pd.CategoricalDtype):
+                convertidas[col] = serie.astype(object).astype('string').astype('category')
+            else:
+                convertidas[col] = serie.astype('string')
+    if not convertidas:
+        return df
+    df = df.copy(deep=False)
+    for col, serie in convertidas.items():
+        df[col] = serie
+    return df
+
+
+class CacheColunar:
+    # Planilhas já convertidas, em Parquet no disco: reabrir a mesma pasta de trabalho não relê o Excel.
+    # Um arquivo por chave; os menos usados recentemente saem quando a pasta passa do limite.
+
+    def __init__(self, pasta, limite_bytes):
+        self.pasta = pasta
+        self.limite_bytes = limite_bytes
+        self._trava = threading.Lock()
+
+    def _caminho(self, chave):
+        nome = hashlib.blake2b(repr((VERSAO_CACHE_COLUNAR, chave)).encode('utf-8'), digest_size=16).hexdigest()
+        return os.path.join(self.pasta, f"{nome}.parquet")
+
+    def _arquivos(self):
+        try:
+            entradas = list(os.scandir(self.pasta))
+        except FileNotFoundError:
+            return []
+        return [(entrada.path, entrada.stat()) for entrada in entradas if entrada.name.endswith('.parquet')]
+
+    @property
+    def uso_bytes(self):
+        return sum(info.st_size for _, info in self._arquivos())
+
+    def __len__(self):
+        return len(self._arquivos())
+
+    def obter(self, chave):
+        caminho = self._caminho(chave)
+        try:
+            df = pd.read_parquet(caminho)
+        except (OSError, ValueError):
+            return None
+        with contextlib.suppress(OSError):
+            os.utime(caminho)
+        return df
+
+    def guardar(self, chave, df):
+        os.makedirs(self.pasta, exist_ok=True)
+        caminho = self._caminho(chave)
+        temporario = f"{caminho}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            try:
+                df.to_parquet(temporario, index=False)
+            except (ValueError, TypeError):
+                # Colunas com tipos misturados (número e texto, comuns em planilhas de ERP) não têm
+                # representação em Parquet: a cópia em disco guarda essas colunas como texto.
+                _colunas_mistas_como_texto(df).to_parquet(temporario, index=False)
+            os.replace(temporario, caminho)
+        except (OSError, ValueError, TypeError):
+            if os.path.exists(temporario):
+                os.remove(temporario)
+            return False
+        with self._trava:
+            arquivos = sorted(self._arquivos(), key=lambda item: item[1].st_mtime)
+            uso = sum(info.st_size for _, info in arquivos)
+            for caminho_antigo, info in arquivos:
+                if uso <= self.limite_bytes:
+                    break
+                with contextlib.suppress(FileNotFoundError):
+                    os.remove(caminho_antigo)
+                uso -= info.st_size
+        return True
+
+
+def carregar_com_cache(cache, arquivo, separador_padrao=',', tipo_base=None, em_blocos=None, ao_progredir=None, aba=None, cache_disco=None):
+    # Retorna (df, origem: 'cache hit' | 'cache em disco' | 'cache miss', hash do conteúdo).
+    impressao = hash_conteudo(arquivo)
+    economico = usar_leitura_em_blocos(arquivo, em_blocos)
+    extensao = arquivo.name.lower().rsplit('.', 1)[-1]
+    chave = (impressao, extensao, separador_padrao, tipo_base, economico, aba)
+    df = cache.obter(chave)
+    if df is not None:
+        return df, 'cache hit', impressao
+    usar_disco = cache_disco is not None and extensao in ('xlsx', 'xls')
+    if usar_disco:
+        df = cache_disco.obter(chave)
+        if df is not None:
+            cache.guardar(chave, df)
+            return df, 'cache em disco', impressao
+    df = carregar_dataframe(arquivo, separador_padrao=separador_padrao, tipo_base=tipo_base, em_blocos=economico, ao_progredir=ao_progredir, aba=aba)
+    if df is not None:
+        cache.guardar(chave, df)
+        if usar_disco:
+            cache_disco.guardar(chave, df)
+    return df, 'cache miss', impressao
+
+# ------------------------------------------------------------
+# VÁRIOS ARQUIVOS NA MESMA BASE
+# ------------------------------------------------------------
+# Cada arquivo é lido (ou vem do cache) separadamente; a base da sessão é a união deles, com a coluna
+# de origem. Uma O.S. presente em mais de um arquivo fica só com as linhas do último arquivo enviado
+# (reexportações do mesmo período substituem as anteriores); repetições dentro de um arquivo são mantidas.
+COLUNA_ARQUIVO_ORIGEM = 'Arquivo de Origem'
+
+
+def impressao_combinada(impressoes):
+    if len(impressoes) == 1:
+        return impressoes[0]
+    return hashlib.blake2b('|'.join(impressoes).encode('utf-8'), digest_size=16).hexdigest()
+
+
+def _coluna_vazia(referencia, indice):
+    # Coluna ausente em um arquivo: nulos com o tipo que ela tem nos outros (datas continuam datas).
+    if isinstance(referencia, pd.CategoricalDtype):
+        return pd.Series(pd.Categorical.from_codes(np.full(len(indice), -1), dtype=referencia), index=indice)
+    if pd.api.types.is_datetime64_any_dtype(referencia):
+        return pd.Series(pd.NaT, index=indice, dtype=referencia)
+    return pd.Series(np.nan, index=indice)
+
+
+def combinar_arquivos(partes, tipo_base=None):
+    # partes: [(nome do arquivo, df)] na ordem de envio. Registra em attrs as linhas substituídas.
+    colunas = list(dict.fromkeys(col for _, df in partes for col in df.columns))
+    # O mesmo nome enviado duas vezes ganha sufixo, para cada arquivo ter seu rótulo de origem.
+    rotulos, vistos = [], Counter()
+    for nome, _ in partes:
+        vistos[nome] += 1
+        rotulos.append(nome if vistos[nome] == 1 else f"{nome} ({vistos[nome]})")
+    tipos = {}
+    for _, df in partes:
+        for col, dtype in df.dtypes.items():
+            tipos.setdefault(col, dtype)
+    blocos = []
+    for posicao, (_, df) in enumerate(partes):
+        faltando = {col: _coluna_vazia(tipos[col], df.index) for col in colunas if col not in df.columns}
+        origem = pd.Categorical.from_codes(np.full(len(df), posicao, dtype=np.int16), categories=rotulos)
+        blocos.append(df.assign(**faltando)[colunas].assign(**{COLUNA_ARQUIVO_ORIGEM: origem}))
+    combinado = blocos[0] if len(blocos) == 1 else compactar_tipos(concatenar_blocos(blocos))
+    # Uma coluna de data que só foi tipada em parte dos arquivos é convertida aqui, uma vez, no conjunto.
+    combinado, formatos_combinado, nao_convertidas_combinado = normalizar_datas(combinado, tipo_base)
+    substituidas = 0
+    os_col = resolver_esquema(colunas, tipo_base).get('os_id')
+    if os_col is not None and len(partes) > 1:
+        # 123, 123.0 e ' 123' são a mesma O.S. (arquivos diferentes podem ter lido a coluna com tipos diferentes).
+        numero_os = combinado[os_col].astype(str).str.strip().str.replace(r'\.0$', '', regex=True).where(combinado[os_col].notna())
+        arquivo = pd.Series(combinado[COLUNA_ARQUIVO_ORIGEM].cat.codes.to_numpy(), index=combinado.index)
+        ultimo_arquivo = arquivo.groupby(numero_os, dropna=True).transform('max')
+        manter = (arquivo == ultimo_arquivo) | numero_os.isna()
+        substituidas = int((~manter).sum())
+        if substituidas:
+            combinado = combinado[manter.to_numpy()].reset_index(drop=True)
+    combinado.attrs = {
+        'memoria': {'antes': sum(df.attrs.get('memoria', {}).get('antes', 0) for _, df in partes), 'depois': tamanho_dataframe(combinado)},
+        'formatos_data': {**{col: formato for _, df in partes for col, formato in df.attrs.get('formatos_data', {}).items()}, **formatos_combinado},
+        'datas_nao_convertidas': dict(sum((Counter(df.attrs.get('datas_nao_convertidas', {})) for _, df in partes),
+                                          Counter(nao_convertidas_combinado))),
+        'linhas_substituidas': substituidas,
+    }
+    if len(partes) == 1 and 'dialeto' in partes[0][1].attrs:
+        combinado.attrs['dialeto'] = partes[0][1].attrs['dialeto']
+    return combinado
@@ -0,0 +1,185 @@
+import hashlib
+import random
+import threading
+import time
+from concurrent.futures import Future
+from dataclasses import dataclass
+
+# ------------------------------------------------------------
+# RESPOSTAS DO GEMINI EM STREAMING
+# ------------------------------------------------------------
+# transmitir_resposta só depende de `modelo.generate_content(prompt, stream=True)` devolver um iterável
+# de pedaços com `.text`; por isso funciona tanto com o GenerativeModel quanto com o modelo falso local
+# dos testes (tests/modelo_falso.py).
+
+
+@dataclass
+class RespostaTransmitida:
+    texto: str
+    primeiro_token_s: float
+    total_s: float
+    cancelada: bool
+
+
+def _texto_do_pedaco(pedaco):
+    # Pedaços sem texto (ex.: bloqueados por segurança) levantam ValueError no SDK do Gemini.
+    try:
+        return pedaco.text or ''
+    except (ValueError, AttributeError):
+        return ''
+
+
+def transmitir_resposta(modelo, prompt, ao_receber=None, cancelado=None, relogio=time.perf_counter):
+    # ao_receber(texto_acumulado) é chamado a cada pedaço; cancelado() interrompe a leitura do stream.
+    # No app o botão de parar age pelo rerun do Streamlit (exceção levantada dentro de ao_receber);
+    # cancelado serve a quem chama fora de um rerun, como os testes.
+    inicio = relogio()
+    texto, primeiro_token_s, cancelada = '', None, False
+    for pedaco in modelo.generate_content(prompt, stream=True):
+        if cancelado is not None and cancelado():
+            cancelada = True
+            break
+        novo = _texto_do_pedaco(pedaco)
+        if not novo:
+            continue
+        if primeiro_token_s is None:
+            primeiro_token_s = relogio() - inicio
+        texto += novo
+        if ao_receber is not None:
+            ao_receber(texto)
+    return RespostaTransmitida(texto, primeiro_token_s, relogio() - inicio, cancelada)
+
+
+def formatar_latencia(primeiro_token_s, total_s):
+    primeiro = f"{primeiro_token_s:.2f} s" if primeiro_token_s is not None else "—"
+    return f"1º token em {primeiro} · total {total_s:.2f} s"
+
+# ------------------------------------------------------------
+# CAMADA COMPARTILHADA DE REQUISIÇÕES AO MODELO
+# ------------------------------------------------------------
+# Uma instância por processo (st.cache_resource), usada por todas as sessões: limita a taxa por chave
+# de API (balde de tokens), a concorrência (semáforo), repete com espera exponencial e jitter quando
+# a cota estoura e junta chamadas idênticas que já estão em andamento em uma só.
+NOMES_ERROS_RETENTAVEIS = {'ResourceExhausted', 'TooManyRequests', 'ServiceUnavailable', 'DeadlineExceeded', 'InternalServerError'}
+
+
+class ErroCotaModelo(Exception):
+    pass
+
+
+def erro_retentavel(erro):
+    if type(erro).__name__ in NOMES_ERROS_RETENTAVEIS:
+        return True
+    codigo = getattr(erro, 'code', None)
+    return codigo in (429, 500, 503) or '429' in str(erro)
+
+
+class BaldeTokens:
+
+    def __init__(self, por_minuto, capacidade=None, relogio=time.monotonic, dormir=time.sleep):
+        self.taxa_por_s = por_minuto / 60.0
+        self.capacidade = float(capacidade if capacidade is not None else max(1, por_minuto // 6))
+        self.relogio = relogio
+        self.dormir = dormir
+        self._tokens = self.capacidade
+        self._atualizado = relogio()
+        self._trava = threading.Lock()
+
+    def adquirir(self):
+        while True:
+            with self._trava:
+                agora = self.relogio()
+                self._tokens = min(self.capacidade, self._tokens + (agora - self._atualizado) * self.taxa_por_s)
+                self._atualizado = agora
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                espera = (1 - self._tokens) / self.taxa_por_s
+            self.dormir(espera)
+
+
+class CamadaRequisicoes:
+
+    def __init__(self, por_minuto=60, max_concorrentes=4, max_tentativas=5, espera_base_s=1.0, espera_max_s=30.0,
+                 relogio=time.monotonic, dormir=time.sleep):
+        self.por_minuto = por_minuto
+        self.max_tentativas = max_tentativas
+        self.espera_base_s = espera_base_s
+        self.espera_max_s = espera_max_s
+        self.relogio = relogio
+        self.dormir = dormir
+        self._semaforo = threading.BoundedSemaphore(max_concorrentes)
+        self._baldes = {}
+        self._em_andamento = {}
+        self._trava = threading.Lock()
+        self.estatisticas = {'chamadas': 0, 'retentativas': 0, 'deduplicadas': 0}
+
+    def _balde(self, chave_api):
+        identificador = hashlib.sha256(str(chave_api).encode('utf-8')).hexdigest()[:16]
+        with self._trava:
+            if identificador not in self._baldes:
+                self._baldes[identificador] = BaldeTokens(self.por_minuto, relogio=self.relogio, dormir=self.dormir)
+            return self._baldes[identificador]
+
+    def _espera(self, tentativa):
+        teto = min(self.espera_max_s, self.espera_base_s * 2 ** tentativa)
+        return teto / 2 + random.uniform(0, teto / 2)
+
+    def _com_retentativas(self, chave_api, funcao, pode_repetir):
+        balde = self._balde(chave_api)
+        for tentativa in range(self.max_tentativas):
+            balde.adquirir()
+            with self._semaforo:
+                try:
+                    with self._trava:
+                        self.estatisticas['chamadas'] += 1
+                    return funcao()
+                except Exception as e:
+                    if not erro_retentavel(e) or not pode_repetir():
+                        raise
+                    if tentativa == self.max_tentativas - 1:
+                        raise ErroCotaModelo(f"Limite de uso do modelo atingido após {self.max_tentativas} tentativas: {e}") from e
+            with self._trava:
+                self.estatisticas['retentativas'] += 1
+            self.dormir(self._espera(tentativa))
+
+    def executar(self, chave_api, funcao, *args, chave_dedup=None, **kwargs):
+        # Com chave_dedup, chamadas iguais simultâneas esperam o resultado da primeira.
+        chamada = lambda: funcao(*args, **kwargs)
+        if chave_dedup is None:
+            return self._com_retentativas(chave_api, chamada, lambda: True)
+        with self._trava:
+            futuro = self._em_andamento.get(chave_dedup)
+            dono = futuro is None
+            if dono:
+                futuro = self._em_andamento[chave_dedup] = Future()
+            else:
+                self.estatisticas['deduplicadas'] += 1
+        if not dono:
+            return futuro.result()
+        try:
+            resultado = self._com_retentativas(chave_api, chamada, lambda: True)
+            futuro.set_result(resultado)
+            return resultado
+        except Exception as e:
+            futuro.set_exception(e)
+            raise
+        except BaseException:
+            # Rerun/parada do Streamlit na sessão dona: as outras sessões recebem um erro comum.
+            futuro.set_exception(RuntimeError("A chamada ao modelo foi interrompida."))
+            raise
+        finally:
+            with self._trava:
+                self._em_andamento.pop(chave_dedup, None)
+
+    def transmitir(self, chave_api, modelo, prompt, ao_receber=None, cancelado=None):
+        # Só repete o stream se a falha ocorrer antes do primeiro pedaço (nada foi exibido ainda).
+        recebido = []
+
+        def receber(texto):
+            recebido.append(True)
+            if ao_receber is not None:
+                ao_receber(texto)
+
+        return self._com_retentativas(chave_api, lambda: transmitir_resposta(modelo, prompt, ao_receber=receber, cancelado=cancelado),
+                                      lambda: not recebido)
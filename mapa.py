@@ -0,0 +1,74 @@
+import numpy as np
+import pandas as pd
+
+from otimizador import coordenadas_validas
+
+# ------------------------------------------------------------
+# PONTOS DO MAPA DE RT (DEDUPLICADOS E AGREGADOS EM GRADE)
+# ------------------------------------------------------------
+# As coordenadas de atendimento viram float uma vez no upload. No mapa, pontos repetidos são unidos
+# e os demais agregados em uma grade cujo passo acompanha o zoom (~1/8 de um tile de 256 px),
+# com o tamanho do marcador proporcional à raiz da quantidade de registros.
+LAT_MAPA = 'LAT_ATENDIMENTO_NUM'
+LON_MAPA = 'LON_ATENDIMENTO_NUM'
+CELULAS_POR_TILE = 8
+ZOOM_MINIMO, ZOOM_MAXIMO = 3, 14
+KM_POR_GRAU = 111.32
+
+
+def preparar_coordenadas_mapa(df, lat_col, lon_col):
+    lat, lon = coordenadas_validas(df[lat_col].to_numpy(), df[lon_col].to_numpy())
+    return df.assign(**{LAT_MAPA: lat, LON_MAPA: lon})
+
+
+def zoom_automatico(lat, lon):
+    # Zoom que enquadra todos os pontos (aproximação pela maior extensão em graus).
+    if len(lat) == 0:
+        return ZOOM_MINIMO
+    extensao = max(np.ptp(lat), np.ptp(lon))
+    if extensao <= 0:
+        return 12
+    return int(np.clip(np.floor(np.log2(360 / extensao)), ZOOM_MINIMO, ZOOM_MAXIMO))
+
+
+def passo_grade_graus(zoom):
+    return 360.0 / (2 ** zoom) / CELULAS_POR_TILE
+
+
+def agregar_pontos(lat, lon, zoom):
+    # Retorna DataFrame (lat, lon, quantidade, size): um ponto por célula, no centróide dos registros.
+    validos = ~(np.isnan(lat) | np.isnan(lon))
+    lat, lon = lat[validos], lon[validos]
+    if len(lat) == 0:
+        return pd.DataFrame(columns=['lat', 'lon', 'quantidade', 'size'])
+    passo = passo_grade_graus(zoom)
+    celulas = np.stack([np.floor(lat / passo), np.floor(lon / passo)], axis=1)
+    _, grupo, quantidade = np.unique(celulas, axis=0, return_inverse=True, return_counts=True)
+    grupo = grupo.ravel()
+    pontos = pd.DataFrame({
+        'lat': np.bincount(grupo, weights=lat) / quantidade,
+        'lon': np.bincount(grupo, weights=lon) / quantidade,
+        'quantidade': quantidade,
+    })
+    # Raio em metros: o ponto mais denso ocupa ~1/3 da célula; os demais crescem com a raiz da quantidade.
+    raio_base_m = passo * KM_POR_GRAU * 1000 / 3
+    pontos['size'] = raio_base_m * (0.4 + 0.6 * np.sqrt(quantidade / quantidade.max()))
+    return pontos
+
+
+def _coordenadas(df):
+    lat, lon = df[LAT_MAPA].to_numpy(dtype=float), df[LON_MAPA].to_numpy(dtype=float)
+    return lat, lon, ~(np.isnan(lat) | np.isnan(lon))
+
+
+def zoom_do_recorte(df):
+    lat, lon, validos = _coordenadas(df)
+    return zoom_automatico(lat[validos], lon[validos])
+
+
+def pontos_do_mapa(df, zoom=None):
+    # df já preparado por preparar_coordenadas_mapa. Retorna (pontos agregados, zoom usado, registros com coordenadas).
+    lat, lon, validos = _coordenadas(df)
+    if zoom is None:
+        zoom = zoom_automatico(lat[validos], lon[validos])
+    return agregar_pontos(lat, lon, zoom), zoom, int(validos.sum())
@@ -0,0 +1,168 @@
+import numpy as np
+import pandas as pd
+from haversine import Unit
+from haversine.haversine import get_avg_earth_radius
+
+# ------------------------------------------------------------
+# MOTOR DE DISTÂNCIAS DO OTIMIZADOR DE PROXIMIDADE
+# ------------------------------------------------------------
+TERMOS_EXCLUIDOS_OTIMIZADOR = ['stellantis', 'ceabs', 'fca chrysler']
+RAIO_TERRA_KM = get_avg_earth_radius(Unit.KILOMETERS)
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    # Mesma fórmula de haversine(..., unit=Unit.KILOMETERS), aplicada em arrays (com broadcasting).
+    lat1, lon1, lat2, lon2 = (np.radians(np.asarray(v, dtype=float)) for v in (lat1, lon1, lat2, lon2))
+    d = np.sin((lat2 - lat1) * 0.5) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) * 0.5) ** 2
+    return 2 * RAIO_TERRA_KM * np.arcsin(np.sqrt(d))
+
+
+def coordenadas_validas(lat, lon):
+    lat = pd.to_numeric(pd.Series(lat), errors='coerce').to_numpy(dtype=float)
+    lon = pd.to_numeric(pd.Series(lon), errors='coerce').to_numpy(dtype=float)
+    invalidas = (np.abs(lat) > 90) | (np.abs(lon) > 180)
+    return np.where(invalidas, np.nan, lat), np.where(invalidas, np.nan, lon)
+
+
+def preparar_representantes(df_map, rep_col, lat_col, lon_col, termos_excluidos=TERMOS_EXCLUIDOS_OTIMIZADOR):
+    # Um registro por representante (primeira ocorrência no mapeamento), já com a máscara de exclusão.
+    nomes = df_map[rep_col].to_numpy().astype(str)
+    _, primeiros = np.unique(nomes, return_index=True)
+    primeiros.sort()
+    lat, lon = coordenadas_validas(df_map[lat_col].to_numpy()[primeiros], df_map[lon_col].to_numpy()[primeiros])
+    nomes = nomes[primeiros]
+    excluido = pd.Series(nomes, dtype=object).str.contains('|'.join(termos_excluidos), case=False, na=False).to_numpy(dtype=bool)
+    return {'nomes': nomes, 'lat': lat, 'lon': lon, 'excluido': excluido}
+
+
+class IndiceRepresentantes:
+    # Índice em grade lat/lon sobre as coordenadas únicas dos representantes.
+    # Responde "k RTs mais próximos dentro de X km" visitando apenas os anéis de células
+    # necessários, em vez de calcular a distância para todo o mapeamento.
+
+    def __init__(self, representantes, passo_graus=1.0):
+        self.representantes = representantes
+        self.passo = float(passo_graus)
+        self.posicao_por_nome = {nome: i for i, nome in enumerate(representantes['nomes'])}
+        lat, lon = representantes['lat'], representantes['lon']
+        candidatos = np.flatnonzero(~representantes['excluido'] & ~np.isnan(lat) & ~np.isnan(lon))
+        self.total_candidatos = len(candidatos)
+        self.celulas = {}
+        if self.total_candidatos == 0:
+            return
+        celula_lat = np.floor(lat[candidatos] / self.passo).astype(int)
+        celula_lon = np.floor(lon[candidatos] / self.passo).astype(int)
+        ordem = np.lexsort((celula_lon, celula_lat))
+        chaves = np.stack([celula_lat[ordem], celula_lon[ordem]], axis=1)
+        inicio_grupos = np.flatnonzero(np.r_[True, (chaves[1:] != chaves[:-1]).any(axis=1)])
+        for posicoes, chave in zip(np.split(candidatos[ordem], inicio_grupos[1:]), chaves[inicio_grupos]):
+            self.celulas[(int(chave[0]), int(chave[1]))] = posicoes
+        self.limites_lat = (int(celula_lat.min()), int(celula_lat.max()))
+        self.limites_lon = (int(celula_lon.min()), int(celula_lon.max()))
+        self.cos_min = np.cos(np.radians(np.abs(lat[candidatos]).max()))
+
+    @classmethod
+    def construir(cls, df_map, rep_col, lat_col, lon_col, passo_graus=1.0):
+        return cls(preparar_representantes(df_map, rep_col, lat_col, lon_col), passo_graus=passo_graus)
+
+    def distancia(self, nome, lat, lon):
+        posicao = self.posicao_por_nome.get(nome)
+        if posicao is None:
+            return None
+        return float(haversine_km(self.representantes['lat'][posicao], self.representantes['lon'][posicao], lat, lon))
+
+    def _anel(self, ci, cj, r):
+        if r == 0:
+            return [(ci, cj)]
+        celulas = [(ci + di, cj + dj) for di in (-r, r) for dj in range(-r, r + 1)]
+        celulas += [(ci + di, cj + dj) for dj in (-r, r) for di in range(-r + 1, r)]
+        return celulas
+
+    def _limite_inferior_km(self, lat, lon, ci, cj, r, cos_min):
+        # Distância mínima possível para qualquer ponto fora do quadrado de anéis já visitado.
+        folga_lat = min(lat - (ci - r) * self.passo, (ci + r + 1) * self.passo - lat)
+        folga_lon = min(lon - (cj - r) * self.passo, (cj + r + 1) * self.passo - lon)
+        limite_lat = RAIO_TERRA_KM * np.radians(folga_lat)
+        limite_lon = 2 * RAIO_TERRA_KM * np.arcsin(min(1.0, cos_min * np.sin(np.radians(folga_lon) * 0.5)))
+        return min(limite_lat, limite_lon)
+
+    def vizinhos(self, lat, lon, k=5, raio_km=None):
+        colunas = ['Posição', 'Representante', 'Distancia (km)']
+        lat, lon = float(lat), float(lon)
+        if self.total_candidatos == 0 or np.isnan(lat) or np.isnan(lon) or k < 1:
+            return pd.DataFrame(columns=colunas)
+        ci, cj = int(np.floor(lat / self.passo)), int(np.floor(lon / self.passo))
+        r_max = max(ci - self.limites_lat[0], self.limites_lat[1] - ci, cj - self.limites_lon[0], self.limites_lon[1] - cj, 0)
+        cos_min = min(self.cos_min, np.cos(np.radians(lat)))
+        posicoes, distancias = [], []
+        for r in range(r_max + 1):
+            encontrados = [self.celulas[c] for c in self._anel(ci, cj, r) if c in self.celulas]
+            if encontrados:
+                novas = np.concatenate(encontrados)
+                posicoes.append(novas)
+                distancias.append(haversine_km(self.representantes['lat'][novas], self.representantes['lon'][novas], lat, lon))
+            limite = self._limite_inferior_km(lat, lon, ci, cj, r, cos_min)
+            if raio_km is not None and limite > raio_km:
+                break
+            if distancias and sum(len(d) for d in distancias) >= k and np.partition(np.concatenate(distancias), k - 1)[k - 1] <= limite:
+                break
+        if not posicoes:
+            return pd.DataFrame(columns=colunas)
+        posicoes, distancias = np.concatenate(posicoes), np.concatenate(distancias)
+        if raio_km is not None:
+            dentro = distancias <= raio_km
+            posicoes, distancias = posicoes[dentro], distancias[dentro]
+        ordem = np.lexsort((posicoes, distancias))[:k]
+        return pd.DataFrame({
+            'Posição': np.arange(1, len(ordem) + 1),
+            'Representante': self.representantes['nomes'][posicoes[ordem]].astype(object),
+            'Distancia (km)': distancias[ordem],
+        })
+
+
+def pontos_atendimento_por_cidade(df_map, city_col, lat_col, lon_col):
+    # Primeira coordenada de atendimento de cada cidade, como no modo por cidade.
+    primeiros = df_map.drop_duplicates(subset=[city_col])
+    lat, lon = coordenadas_validas(primeiros[lat_col].to_numpy(), primeiros[lon_col].to_numpy())
+    return pd.DataFrame({'lat': lat, 'lon': lon}, index=pd.Index(primeiros[city_col].to_numpy(), name=city_col))
+
+
+def _tomar(valores, posicoes, padrao):
+    # valores[posicoes], com `padrao` onde get_indexer não encontrou correspondência (-1).
+    if len(valores) == 0:
+        return np.full(len(posicoes), padrao, dtype=valores.dtype)
+    return np.where(posicoes >= 0, valores[posicoes], padrao)
+
+
+def otimizar_em_lote(df_ordens, indice, pontos_cidade, os_col, cliente_col, data_col, city_col, rep_col, raio_km=None):
+    # Distância do RT agendado, RT sugerido e economia para todas as ordens em uma passada vetorizada.
+    cidades = pd.Index(df_ordens[city_col].dropna().unique())
+    pontos = pontos_cidade.reindex(cidades)
+    sugestoes = [indice.vizinhos(lat, lon, k=1, raio_km=raio_km) for lat, lon in zip(pontos['lat'], pontos['lon'])]
+    pontos['rt_sugerido'] = [s['Representante'].iloc[0] if not s.empty else None for s in sugestoes]
+    pontos['dist_sugerido'] = [s['Distancia (km)'].iloc[0] if not s.empty else np.nan for s in sugestoes]
+
+    posicao_cidade = cidades.get_indexer(df_ordens[city_col])
+    lat_ponto = _tomar(pontos['lat'].to_numpy(dtype=float), posicao_cidade, np.nan)
+    lon_ponto = _tomar(pontos['lon'].to_numpy(dtype=float), posicao_cidade, np.nan)
+    dist_sugerido = _tomar(pontos['dist_sugerido'].to_numpy(dtype=float), posicao_cidade, np.nan)
+    rt_sugerido = _tomar(pontos['rt_sugerido'].to_numpy(dtype=object), posicao_cidade, None)
+
+    nomes = pd.Index(indice.representantes['nomes'].astype(object))
+    posicao_rt = nomes.get_indexer(df_ordens[rep_col].astype(object))
+    lat_rt = _tomar(indice.representantes['lat'], posicao_rt, np.nan)
+    lon_rt = _tomar(indice.representantes['lon'], posicao_rt, np.nan)
+    dist_atual = haversine_km(lat_rt, lon_rt, lat_ponto, lon_ponto)
+
+    resultado = pd.DataFrame({
+        os_col: df_ordens[os_col].to_numpy(),
+        cliente_col: df_ordens[cliente_col].to_numpy(),
+        data_col: df_ordens[data_col].to_numpy(),
+        city_col: df_ordens[city_col].to_numpy(),
+        'RT Agendado': df_ordens[rep_col].to_numpy(),
+        'Distância RT Agendado (km)': dist_atual,
+        'RT Sugerido': rt_sugerido,
+        'Distância RT Sugerido (km)': dist_sugerido,
+        'Economia (km)': np.clip(dist_atual - dist_sugerido, 0, None),
+    })
+    return resultado.sort_values('Economia (km)', ascending=False, na_position='last').reset_index(drop=True)
@@ -0,0 +1,88 @@
+import pandas as pd
+
+# ------------------------------------------------------------
+# PERFIL COMPACTO DA BASE PARA O PROMPT DE ANÁLISE
+# ------------------------------------------------------------
+# Uma linha por coluna com tipo, cardinalidade, nulos e os valores mais frequentes (grafia exata),
+# para o modelo acertar dtypes e valores já na primeira chamada. Calculado uma vez por upload e
+# reduzido até caber no orçamento de tokens (estimado em ~4 caracteres por token).
+ORCAMENTO_TOKENS_PERFIL = 1500
+CARACTERES_POR_TOKEN = 4
+VALORES_TOPO_POR_NIVEL = [8, 5, 3, 0]
+TAMANHO_MAXIMO_VALOR = 40
+LIMITE_CARDINALIDADE_TOPO = 0.5
+
+
+def _tipo_coluna(serie):
+    dtype = serie.dtype
+    if isinstance(dtype, pd.CategoricalDtype):
+        return 'categoria'
+    if pd.api.types.is_bool_dtype(dtype):
+        return 'booleano'
+    if pd.api.types.is_integer_dtype(dtype):
+        return 'inteiro'
+    if pd.api.types.is_float_dtype(dtype):
+        return 'decimal'
+    if pd.api.types.is_datetime64_any_dtype(dtype):
+        return 'data'
+    return 'texto'
+
+
+def _resumir_valor(valor):
+    texto = str(valor)
+    return repr(texto if len(texto) <= TAMANHO_MAXIMO_VALOR else texto[:TAMANHO_MAXIMO_VALOR] + '…')
+
+
+def _estatisticas_colunas(df):
+    colunas = []
+    for col in df.columns:
+        serie = df[col]
+        tipo = _tipo_coluna(serie)
+        distintos = int(serie.nunique(dropna=True))
+        info = {'nome': col, 'tipo': tipo, 'distintos': distintos, 'nulos': float(serie.isna().mean()) if len(serie) else 0.0, 'topo': [], 'faixa': None}
+        if tipo in ('inteiro', 'decimal', 'data') and distintos:
+            info['faixa'] = (serie.min(), serie.max())
+        if tipo in ('texto', 'categoria', 'booleano') and distintos and distintos <= max(LIMITE_CARDINALIDADE_TOPO * len(serie), 1):
+            contagens = serie.value_counts(dropna=True).head(VALORES_TOPO_POR_NIVEL[0])
+            info['topo'] = [(valor, int(qtd)) for valor, qtd in contagens.items() if qtd > 0]
+        elif tipo == 'texto' and distintos:
+            info['topo'] = [(valor, None) for valor in serie.dropna().head(2)]
+        colunas.append(info)
+    return colunas
+
+
+def _linha_coluna(info, valores_topo):
+    partes = [f"- {info['nome']!r}: {info['tipo']}, {info['distintos']} distintos"]
+    if info['nulos']:
+        partes.append(f"{info['nulos']:.0%} nulos")
+    if info['faixa'] is not None:
+        partes.append(f"de {info['faixa'][0]} a {info['faixa'][1]}")
+    topo = info['topo'][:valores_topo]
+    if topo:
+        if topo[0][1] is None:
+            partes.append("ex.: " + ", ".join(_resumir_valor(v) for v, _ in topo))
+        else:
+            partes.append("valores: " + ", ".join(f"{_resumir_valor(v)} ({q})" for v, q in topo))
+    return "; ".join(partes)
+
+
+def perfil_dataset(df, orcamento_tokens=ORCAMENTO_TOKENS_PERFIL):
+    limite_caracteres = orcamento_tokens * CARACTERES_POR_TOKEN
+    cabecalho = f"{len(df)} linhas, {len(df.columns)} colunas. Colunas (nome exato: tipo; valores mais frequentes com a grafia exata):"
+    colunas = _estatisticas_colunas(df)
+    for valores_topo in VALORES_TOPO_POR_NIVEL:
+        linhas = [_linha_coluna(info, valores_topo) for info in colunas]
+        texto = "\n".join([cabecalho] + linhas)
+        if len(texto) <= limite_caracteres:
+            return texto
+    # Nem sem valores coube: corta colunas do fim e avisa quantas ficaram de fora.
+    incluidas = [cabecalho]
+    usados = len(cabecalho)
+    for linha in linhas:
+        if usados + len(linha) + 60 > limite_caracteres:
+            break
+        incluidas.append(linha)
+        usados += len(linha) + 1
+    omitidas = len(linhas) - (len(incluidas) - 1)
+    incluidas.append(f"- (+{omitidas} colunas omitidas)")
+    return "\n".join(incluidas)
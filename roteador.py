@@ -0,0 +1,302 @@
+import logging
+import re
+import threading
+import unicodedata
+from collections import OrderedDict
+from dataclasses import dataclass
+
+import pandas as pd
+
+from custos import formatar_reais
+
+# ------------------------------------------------------------
+# ROTEADOR DE PERGUNTAS FREQUENTES (SEM CHAMAR O MODELO)
+# ------------------------------------------------------------
+# Perguntas de contagem, soma, média e ranking por status, cidade, RT e cliente (com filtros de
+# valor e de período) são respondidas direto das bases, usando os papéis do esquema resolvidos no
+# upload. Quando nenhum modelo de pergunta se aplica, o chat segue para a IA como antes.
+logger = logging.getLogger(__name__)
+
+# Papel do esquema usado para cada dimensão, por base.
+DIMENSOES_POR_BASE = {
+    'df_dados': {'status': 'status', 'cidade': 'cidade', 'representante': 'representante', 'cliente': 'cliente', 'data': 'data_agendamento'},
+    'df_pagamento': {'cidade': 'cidade_os', 'representante': 'representante', 'data': 'data_fechamento'},
+}
+ROTULOS_DIMENSAO = {'status': 'Status', 'cidade': 'Cidade', 'representante': 'RT', 'cliente': 'Cliente'}
+PADROES_DIMENSAO = {
+    'status': r'status',
+    'cidade': r'cidades?',
+    'representante': r'rts?|representantes?',
+    'cliente': r'clientes?',
+}
+# Métricas da base de pagamento (colunas numéricas criadas no upload), em ordem de prioridade, com o
+# papel do esquema de onde cada uma vem.
+METRICAS = [
+    (r'valor extra|extras?', 'VALOR_EXTRA_NUM', 'Valor extra', 'reais', 'valor_extra'),
+    (r'pedagios?', 'PEDAGIO_NUM', 'Pedágio', 'reais', 'pedagio'),
+    (r'valor (de |do )?deslocamento|custos?|valor', 'VALOR_DESLOC_ORIGINAL', 'Valor de deslocamento', 'reais', 'valor_deslocamento'),
+    (r'km|quilometr\w*|distancias?|deslocamentos?', 'DESLOC_KM_NUM', 'Deslocamento', 'km', 'deslocamento_km'),
+]
+PADRAO_MEDIA = re.compile(r'\b(media|medio)\b')
+PADRAO_SOMA = re.compile(r'\b(soma|somatorio|total|totais|somado)\b')
+PADRAO_CONTAGEM = re.compile(r'\b(quant[oa]s|quantidade|numero de|qtd|total|totais|contagem)\b')
+PADRAO_RANKING = re.compile(r'\b(top ?(\d+)|ranking|(com|que|quem) mais|maiores|principais)\b')
+# "Top N" e "ranking" bastam com uma dimensão citada; "maiores"/"principais" precisam de uma entidade da base.
+PADRAO_RANKING_EXPLICITO = re.compile(r'\b(top ?\d+|ranking)\b')
+# Só "o.s." com ponto: o artigo "os" não é entidade.
+PADRAO_ENTIDADE = re.compile(r'\b(ordens?|o\.s\b\.?|agendamentos?|registros?|servicos?|atendimentos?|instalac\w*)')
+PADRAO_DATA = r'(\d{1,2})/(\d{1,2})(?:/(\d{2,4}))?'
+TOP_PADRAO = 10
+TAMANHO_MINIMO_VALOR = 3
+VALORES_EM_CACHE = 32
+
+
+@dataclass
+class RespostaRoteada:
+    texto: str
+    intencao: str
+
+
+def normalizar_texto(texto):
+    texto = unicodedata.normalize('NFKD', str(texto))
+    texto = ''.join(c for c in texto if not unicodedata.combining(c))
+    return re.sub(r'\s+', ' ', texto.lower()).strip()
+
+
+def _radical(palavra):
+    # "agendadas" e "Agendada" -> "agendad"; basta para flexões de número e gênero dos status.
+    if len(palavra) > 3 and palavra.endswith('s'):
+        palavra = palavra[:-1]
+    if len(palavra) > 3 and palavra[-1] in 'ao':
+        palavra = palavra[:-1]
+    return palavra
+
+
+def tabela_markdown(df, formatadores=None):
+    formatadores = formatadores or {}
+    linhas = ['| ' + ' | '.join(str(col) for col in df.columns) + ' |', '|' + '---|' * len(df.columns)]
+    for registro in df.itertuples(index=False):
+        celulas = [formatadores.get(col, str)(valor) for col, valor in zip(df.columns, registro)]
+        linhas.append('| ' + ' | '.join(celulas) + ' |')
+    return '\n'.join(linhas)
+
+
+def _formatar_metrica(valor, unidade):
+    if unidade == 'reais':
+        return formatar_reais(valor)
+    return f"{valor:,.1f} km".replace(',', '_').replace('.', ',').replace('_', '.')
+
+
+def _periodo(pergunta, hoje):
+    # Retorna (inicio, fim) inclusivos ou None. Aceita "entre dd/mm/aaaa e dd/mm/aaaa", "em dd/mm/aaaa",
+    # "hoje", "ontem", "últimos N dias", "este mês" e "mês passado".
+    datas = []
+    for dia, mes, ano in re.findall(PADRAO_DATA, pergunta):
+        ano = int(ano) + 2000 if ano and len(ano) == 2 else int(ano or hoje.year)
+        try:
+            datas.append(pd.Timestamp(year=ano, month=int(mes), day=int(dia)))
+        except ValueError:
+            return None
+    if len(datas) >= 2:
+        return min(datas[:2]), max(datas[:2])
+    if len(datas) == 1:
+        return datas[0], datas[0]
+    if re.search(r'\bhoje\b', pergunta):
+        return hoje, hoje
+    if re.search(r'\bontem\b', pergunta):
+        return hoje - pd.Timedelta(days=1), hoje - pd.Timedelta(days=1)
+    ultimos = re.search(r'\bultimos (\d+) dias\b', pergunta)
+    if ultimos:
+        return hoje - pd.Timedelta(days=int(ultimos.group(1)) - 1), hoje
+    if re.search(r'\b(este|neste|esse|nesse) mes\b', pergunta):
+        return hoje.replace(day=1), hoje
+    if re.search(r'\bmes passado\b', pergunta):
+        fim = hoje.replace(day=1) - pd.Timedelta(days=1)
+        return fim.replace(day=1), fim
+    return None
+
+
+def _cita_coluna(citacao_metrica, esquema):
+    # A métrica ancora a pergunta quando o termo citado nomeia a coluna da planilha carregada:
+    # "média de deslocamento" (coluna "Deslocamento") sim, "média de km" não.
+    termo, papel = citacao_metrica
+    coluna = esquema.get(papel)
+    if coluna is None:
+        return False
+    radicais_coluna = {_radical(p) for p in re.findall(r'[a-z0-9]+', normalizar_texto(coluna))}
+    return all(_radical(p) in radicais_coluna for p in re.findall(r'[a-z0-9]+', termo) if p not in ('de', 'do'))
+
+
+class RoteadorPerguntas:
+    # Compartilhado entre as sessões (st.cache_resource); guarda os valores distintos normalizados
+    # de cada coluna por impressão da base e a taxa de acerto do roteamento.
+
+    def __init__(self):
+        self._valores = OrderedDict()
+        self._datas = OrderedDict()
+        self._trava = threading.Lock()
+        self.estatisticas = {'perguntas': 0, 'atendidas': 0}
+
+    @property
+    def taxa_acerto(self):
+        return self.estatisticas['atendidas'] / self.estatisticas['perguntas'] if self.estatisticas['perguntas'] else 0.0
+
+    def _em_cache(self, cache, chave, calcular):
+        with self._trava:
+            if chave in cache:
+                cache.move_to_end(chave)
+                return cache[chave]
+        valor = calcular()
+        with self._trava:
+            cache[chave] = valor
+            while len(cache) > VALORES_EM_CACHE:
+                cache.popitem(last=False)
+        return valor
+
+    def _valores_normalizados(self, impressao, df, coluna):
+        def calcular():
+            valores = pd.Series(df[coluna].dropna().unique()).astype(str)
+            return [(normalizar_texto(v), v) for v in valores if len(v.strip()) >= TAMANHO_MINIMO_VALOR]
+        return self._em_cache(self._valores, (impressao, coluna), calcular)
+
+    def _datas_coluna(self, impressao, df, coluna):
+        def calcular():
+            # As colunas do esquema já chegam tipadas da ingestão; o parse fica só para colunas fora dele.
+            datas = df[coluna]
+            if not pd.api.types.is_datetime64_any_dtype(datas.dtype):
+                datas = pd.to_datetime(datas, dayfirst=True, errors='coerce')
+            return datas.dt.normalize()
+        return self._em_cache(self._datas, (impressao, coluna), calcular)
+
+    def _filtros(self, pergunta, impressao, df, colunas, ignorar):
+        # Valores citados na pergunta, no máximo um por dimensão (o nome mais longo vence: "Rio Claro" > "Rio").
+        filtros = {}
+        radicais_pergunta = {_radical(p) for p in re.findall(r'[a-z0-9]+', pergunta)}
+        for dimensao in ['status', 'cidade', 'representante', 'cliente']:
+            coluna = colunas.get(dimensao)
+            if coluna is None or dimensao == ignorar:
+                continue
+            melhor = None
+            for normalizado, original in self._valores_normalizados(impressao, df, coluna):
+                if re.search(r'(?<![a-z0-9])' + re.escape(normalizado) + r'(?![a-z0-9])', pergunta):
+                    pontuacao = (2.0, len(normalizado))
+                elif dimensao == 'status':
+                    # Status por radicais: "realizadas" encontra "Serviços realizados".
+                    radicais = {_radical(p) for p in re.findall(r'[a-z0-9]+', normalizado)}
+                    em_comum = {r for r in radicais & radicais_pergunta if len(r) >= 5}
+                    if not em_comum:
+                        continue
+                    pontuacao = (len(radicais & radicais_pergunta) / len(radicais), len(normalizado))
+                else:
+                    continue
+                if melhor is None or pontuacao > melhor[0]:
+                    melhor = (pontuacao, original)
+            if melhor is not None:
+                filtros[dimensao] = melhor[1]
+        return filtros
+
+    def _interpretar(self, pergunta, bases, hoje):
+        metrica, citacao_metrica = None, None
+        for padrao, coluna, rotulo, unidade, papel in METRICAS:
+            encontrada = re.search(r'\b(' + padrao + r')\b', pergunta)
+            if encontrada:
+                metrica, citacao_metrica = (coluna, rotulo, unidade), (encontrada.group(0), papel)
+                break
+        if PADRAO_MEDIA.search(pergunta) and metrica:
+            operacao = 'media'
+        elif PADRAO_SOMA.search(pergunta) and metrica and not PADRAO_ENTIDADE.search(pergunta):
+            operacao = 'soma'
+        elif PADRAO_CONTAGEM.search(pergunta) or PADRAO_RANKING.search(pergunta):
+            operacao = 'contagem'
+        else:
+            return None
+
+        nome_base = 'df_pagamento' if operacao in ('media', 'soma') else 'df_dados'
+        if nome_base not in bases:
+            return None
+        df, esquema, impressao = bases[nome_base]
+        if operacao != 'contagem' and metrica[0] not in df.columns:
+            return None
+        colunas = {dimensao: esquema.get(papel) for dimensao, papel in DIMENSOES_POR_BASE[nome_base].items()}
+
+        agrupar = None
+        por = re.search(r'\bpor (' + '|'.join(f'(?P<{d}>{p})' for d, p in PADROES_DIMENSAO.items()) + r')\b', pergunta)
+        citada = re.search(r'\b(' + '|'.join(f'(?P<{d}>{p})' for d, p in PADROES_DIMENSAO.items()) + r')\b', pergunta)
+        ranking = PADRAO_RANKING.search(pergunta)
+        entidade = PADRAO_ENTIDADE.search(pergunta)
+        # Palavra de métrica sozinha não basta: a pergunta precisa citar uma entidade da base ou uma coluna
+        # ("Explique mais sobre os planetas" e "qual a média de km de um carro?" vão para a IA).
+        if operacao == 'contagem':
+            ancorada = entidade or por or (citada and PADRAO_RANKING_EXPLICITO.search(pergunta))
+        else:
+            ancorada = entidade or por or citada or _cita_coluna(citacao_metrica, esquema)
+        if not ancorada:
+            return None
+        if por:
+            agrupar = next(d for d in PADROES_DIMENSAO if por.group(d))
+        elif ranking and citada:
+            agrupar = next(d for d in PADROES_DIMENSAO if citada.group(d))
+        if agrupar is not None and colunas.get(agrupar) is None:
+            return None
+
+        filtros = self._filtros(pergunta, impressao, df, colunas, ignorar=agrupar)
+        periodo = _periodo(pergunta, hoje)
+        if periodo is not None and colunas.get('data') is None:
+            return None
+        n = int(ranking.group(2)) if ranking and ranking.group(2) else TOP_PADRAO
+        return {'operacao': operacao, 'metrica': metrica, 'base': nome_base, 'df': df, 'impressao': impressao,
+                'colunas': colunas, 'agrupar': agrupar, 'filtros': filtros, 'periodo': periodo, 'n': n}
+
+    def _executar(self, plano):
+        df, colunas = plano['df'], plano['colunas']
+        mascara = pd.Series(True, index=df.index)
+        for dimensao, valor in plano['filtros'].items():
+            mascara &= df[colunas[dimensao]].astype(object) == valor
+        descricao = [f"{ROTULOS_DIMENSAO[d].lower() if d != 'representante' else 'RT'} {v}" for d, v in plano['filtros'].items()]
+        if plano['periodo'] is not None:
+            inicio, fim = plano['periodo']
+            datas = self._datas_coluna(plano['impressao'], df, colunas['data'])
+            mascara &= (datas >= inicio) & (datas <= fim)
+            descricao.append(f"de {inicio:%d/%m/%Y} a {fim:%d/%m/%Y}" if inicio != fim else f"em {inicio:%d/%m/%Y}")
+        recorte = df[mascara.to_numpy()]
+        sufixo = f" ({', '.join(descricao)})" if descricao else ""
+
+        operacao, agrupar = plano['operacao'], plano['agrupar']
+        if operacao == 'contagem':
+            if agrupar is None:
+                return f"Foram encontradas **{len(recorte):,}".replace(',', '.') + f"** ordens{sufixo}."
+            contagens = recorte[colunas[agrupar]].value_counts()
+            contagens = contagens[contagens > 0]
+            tabela = contagens.head(plano['n']).rename_axis(ROTULOS_DIMENSAO[agrupar]).reset_index(name='Ordens')
+            cabecalho = f"Ordens por {ROTULOS_DIMENSAO[agrupar]}{sufixo}: {len(contagens)} grupo(s), top {len(tabela)}:"
+            return cabecalho + "\n\n" + tabela_markdown(tabela)
+
+        coluna, rotulo, unidade = plano['metrica']
+        valores = recorte[coluna]
+        nome_operacao = 'Média' if operacao == 'media' else 'Soma'
+        if agrupar is None:
+            resultado = valores.mean() if operacao == 'media' else valores.sum()
+            if pd.isna(resultado):
+                return f"Não há valores de {rotulo.lower()}{sufixo}."
+            return f"{nome_operacao} de {rotulo.lower()}{sufixo}: **{_formatar_metrica(resultado, unidade)}** em {int(valores.notna().sum())} ordens."
+        agregado = valores.groupby(recorte[colunas[agrupar]], observed=True).agg('mean' if operacao == 'media' else 'sum').dropna()
+        tabela = agregado.nlargest(plano['n']).rename_axis(ROTULOS_DIMENSAO[agrupar]).reset_index(name=f"{nome_operacao} {rotulo}")
+        cabecalho = f"{nome_operacao} de {rotulo.lower()} por {ROTULOS_DIMENSAO[agrupar]}{sufixo}: top {len(tabela)} de {len(agregado)}:"
+        return cabecalho + "\n\n" + tabela_markdown(tabela, {f"{nome_operacao} {rotulo}": lambda v: _formatar_metrica(v, unidade)})
+
+    def responder(self, pergunta, bases, hoje=None):
+        # bases: {nome_base: (df, esquema, impressao)} só com as bases carregadas. Retorna RespostaRoteada ou None.
+        hoje = (hoje or pd.Timestamp.now()).normalize()
+        texto = normalizar_texto(pergunta)
+        plano = self._interpretar(texto, bases, hoje)
+        resposta = None
+        if plano is not None:
+            intencao = plano['operacao'] + (f"_por_{plano['agrupar']}" if plano['agrupar'] else '')
+            resposta = RespostaRoteada(self._executar(plano), intencao)
+        with self._trava:
+            self.estatisticas['perguntas'] += 1
+            self.estatisticas['atendidas'] += resposta is not None
+        logger.info("roteador: %s | intenção=%s | acerto=%.0f%% (%d/%d)", pergunta[:80],
+                    resposta.intencao if resposta else 'modelo', self.taxa_acerto * 100,
+                    self.estatisticas['atendidas'], self.estatisticas['perguntas'])
+        return resposta
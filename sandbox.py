@@ -0,0 +1,317 @@
+import ast
+import atexit
+import builtins
+import itertools
+import multiprocessing
+import os
+import queue
+import shutil
+import tempfile
+import threading
+from collections import OrderedDict
+
+try:
+    import resource
+except ImportError:  # Windows: sem limite de memória por processo
+    resource = None
+
+# ------------------------------------------------------------
+# EXECUÇÃO ISOLADA DO CÓDIGO PANDAS GERADO PELA IA
+# ------------------------------------------------------------
+# A expressão gerada pelo modelo passa por uma lista de operações permitidas (AST): nós, nomes e
+# atributos fora das listas abaixo são recusados. Ela roda em um processo trabalhador, com tempo
+# máximo, limite de memória e diretório de trabalho descartável sem permissão de escrita. A base é publicada uma vez por
+# impressão em um arquivo Arrow IPC que os trabalhadores mapeiam em memória, em vez de receber
+# uma cópia serializada a cada pergunta.
+FUNCOES_EMBUTIDAS_PERMITIDAS = {nome: getattr(builtins, nome)
+                                for nome in ['len', 'sum', 'min', 'max', 'abs', 'round', 'sorted', 'list', 'dict', 'tuple',
+                                             'set', 'str', 'int', 'float', 'bool']}
+NOMES_PERMITIDOS = {'df', 'pd', 'np', 'True', 'False', 'None'} | set(FUNCOES_EMBUTIDAS_PERMITIDAS)
+NOS_PERMITIDOS = (
+    ast.Expression, ast.Name, ast.Load, ast.Attribute, ast.Call, ast.keyword, ast.Subscript, ast.Slice,
+    ast.Constant, ast.List, ast.Tuple, ast.Dict, ast.Set, ast.Compare, ast.BoolOp, ast.BinOp, ast.UnaryOp,
+    ast.IfExp, ast.JoinedStr, ast.FormattedValue,
+    ast.And, ast.Or, ast.Not, ast.Invert, ast.UAdd, ast.USub,
+    ast.Add, ast.Sub, ast.Mult, ast.Div, ast.FloorDiv, ast.Mod, ast.Pow, ast.BitAnd, ast.BitOr, ast.BitXor,
+    ast.Eq, ast.NotEq, ast.Lt, ast.LtE, ast.Gt, ast.GtE, ast.In, ast.NotIn, ast.Is, ast.IsNot,
+)
+# Funções acessíveis como pd.<nome> e np.<nome>. Nada que leia ou escreva arquivos (read_*, ExcelWriter,
+# HDFStore, load, save...), execute texto como código ou altere configuração global.
+ATRIBUTOS_PD_PERMITIDOS = {
+    'DataFrame', 'Series', 'Index', 'Categorical', 'Timestamp', 'Timedelta', 'DateOffset', 'Grouper', 'NaT', 'NA',
+    'offsets', 'to_datetime', 'to_numeric', 'to_timedelta', 'date_range', 'period_range', 'cut', 'qcut', 'concat',
+    'merge', 'crosstab', 'pivot_table', 'isna', 'isnull', 'notna', 'notnull', 'unique',
+}
+ATRIBUTOS_NP_PERMITIDOS = {
+    'nan', 'inf', 'where', 'select', 'round', 'abs', 'sign', 'sum', 'prod', 'mean', 'average', 'median', 'std', 'var',
+    'min', 'max', 'ptp', 'percentile', 'quantile', 'nansum', 'nanmean', 'nanmedian', 'nanmin', 'nanmax', 'nan_to_num',
+    'cumsum', 'cumprod', 'diff', 'unique', 'sort', 'argsort', 'argmax', 'argmin', 'isnan', 'isinf', 'isfinite', 'isin',
+    'count_nonzero', 'bincount', 'histogram', 'digitize', 'clip', 'floor', 'ceil', 'trunc', 'rint', 'log', 'log10',
+    'log1p', 'exp', 'sqrt', 'power', 'maximum', 'minimum', 'add', 'subtract', 'multiply', 'divide', 'mod',
+    'logical_and', 'logical_or', 'logical_not', 'all', 'any', 'array', 'asarray', 'arange', 'linspace', 'zeros', 'ones',
+    'full', 'repeat', 'tile', 'concatenate', 'intersect1d', 'union1d', 'setdiff1d', 'corrcoef', 'busday_count',
+    'int64', 'float64', 'datetime64', 'timedelta64',
+}
+# Atributos e métodos de DataFrame, Series, Index, GroupBy/janelas e dos acessores .str, .dt e .cat.
+ATRIBUTOS_PERMITIDOS = {
+    # estrutura e seleção
+    'shape', 'size', 'ndim', 'columns', 'index', 'dtypes', 'dtype', 'values', 'empty', 'name', 'names', 'T', 'nbytes',
+    'loc', 'iloc', 'at', 'iat', 'head', 'tail', 'sample', 'get', 'keys', 'items', 'iterrows', 'itertuples', 'item',
+    'filter', 'select_dtypes', 'xs', 'squeeze', 'nth', 'first', 'last', 'get_group', 'groups', 'ngroup', 'ngroups',
+    'is_unique', 'is_monotonic_increasing', 'is_monotonic_decreasing', 'hasnans', 'memory_usage',
+    # estatística e agregação
+    'sum', 'mean', 'median', 'min', 'max', 'count', 'nunique', 'std', 'var', 'sem', 'skew', 'kurt', 'prod', 'quantile',
+    'mode', 'describe', 'corr', 'cov', 'abs', 'round', 'clip', 'cumsum', 'cumcount', 'cumprod', 'cummax', 'cummin',
+    'diff', 'pct_change', 'rank', 'idxmax', 'idxmin', 'argmax', 'argmin', 'argsort', 'nlargest', 'nsmallest',
+    'value_counts', 'unique', 'factorize', 'any', 'all', 'agg', 'aggregate', 'transform', 'apply', 'map', 'size',
+    'groupby', 'resample', 'rolling', 'expanding', 'pivot', 'pivot_table', 'melt', 'stack', 'unstack', 'explode',
+    'add', 'sub', 'mul', 'div', 'truediv', 'floordiv', 'mod', 'pow', 'eq', 'ne', 'lt', 'le', 'gt', 'ge', 'dot',
+    # limpeza e remodelagem (sempre sobre cópias)
+    'isna', 'isnull', 'notna', 'notnull', 'isin', 'between', 'where', 'mask', 'fillna', 'dropna', 'drop',
+    'drop_duplicates', 'duplicated', 'replace', 'astype', 'copy', 'rename', 'rename_axis', 'reset_index', 'set_index',
+    'sort_values', 'sort_index', 'reindex', 'droplevel', 'swaplevel', 'shift', 'interpolate', 'merge', 'join',
+    'combine_first', 'assign', 'searchsorted', 'ravel', 'flatten', 'reshape', 'tolist', 'to_list', 'to_numpy',
+    'to_frame', 'to_dict', 'to_period', 'to_timestamp',
+    # acessores .str, .dt e .cat
+    'str', 'dt', 'cat', 'contains', 'startswith', 'endswith', 'lower', 'upper', 'title', 'capitalize', 'strip',
+    'lstrip', 'rstrip', 'split', 'rsplit', 'len', 'slice', 'extract', 'findall', 'match', 'fullmatch', 'zfill', 'pad',
+    'normalize', 'year', 'month', 'day', 'hour', 'minute', 'second', 'weekday', 'dayofweek', 'day_of_week',
+    'dayofyear', 'day_of_year', 'quarter', 'isocalendar', 'week', 'date', 'days', 'seconds', 'total_seconds',
+    'days_in_month', 'is_month_start', 'is_month_end', 'month_name', 'day_name', 'strftime', 'floor', 'ceil',
+    'codes', 'categories',
+    # pd.offsets
+    'Day', 'Week', 'MonthBegin', 'MonthEnd', 'YearBegin', 'YearEnd',
+}
+# Métodos que aceitam o nome de uma função como texto e o resolvem com getattr (ex.: df.agg('to_pickle', caminho)):
+# os textos passados como função precisam ser agregações conhecidas.
+METODOS_COM_FUNCAO_POR_NOME = {'agg', 'aggregate', 'transform', 'apply', 'pivot_table', 'crosstab'}
+ARGUMENTOS_FUNCAO = {'func', 'aggfunc'}
+FUNCOES_POR_NOME_PERMITIDAS = {
+    'sum', 'mean', 'median', 'min', 'max', 'count', 'size', 'nunique', 'std', 'var', 'sem', 'skew', 'prod',
+    'first', 'last', 'any', 'all', 'idxmax', 'idxmin', 'cumsum', 'cumcount', 'cumprod', 'cummax', 'cummin', 'rank',
+    'quantile', 'mode', 'unique', 'abs', 'round', 'describe',
+}
+ARQUIVOS_PUBLICADOS_MAX = 8
+FRAMES_POR_TRABALHADOR = 2
+
+
+class ErroSandbox(Exception):
+    pass
+
+
+class ExpressaoNaoPermitida(ErroSandbox):
+    pass
+
+
+class TempoEsgotado(ErroSandbox):
+    pass
+
+
+class MemoriaExcedida(ErroSandbox):
+    pass
+
+
+def _funcoes_por_nome(no, nomeado=False):
+    # Textos que o pandas trataria como nome de função: 'sum', ['sum', 'mean'], {'col': 'sum'} ou, em
+    # agregação nomeada (total=('col', 'sum')), o segundo item da tupla.
+    if isinstance(no, ast.Constant) and isinstance(no.value, str):
+        return [no.value]
+    if nomeado and isinstance(no, ast.Tuple) and len(no.elts) == 2:
+        return _funcoes_por_nome(no.elts[1])
+    if isinstance(no, (ast.List, ast.Tuple)):
+        return [nome for elemento in no.elts for nome in _funcoes_por_nome(elemento)]
+    if isinstance(no, ast.Dict):
+        return [nome for valor in no.values for nome in _funcoes_por_nome(valor)]
+    return []
+
+
+def _validar_funcoes_por_nome(chamada):
+    metodo = chamada.func.attr if isinstance(chamada.func, ast.Attribute) else None
+    candidatos = []
+    if metodo in METODOS_COM_FUNCAO_POR_NOME:
+        candidatos += [nome for argumento in chamada.args for nome in _funcoes_por_nome(argumento)]
+    for argumento in chamada.keywords:
+        if argumento.arg in ARGUMENTOS_FUNCAO:
+            candidatos += _funcoes_por_nome(argumento.value)
+        elif metodo in ('agg', 'aggregate') and argumento.arg is not None:
+            candidatos += _funcoes_por_nome(argumento.value, nomeado=True)
+    for nome in candidatos:
+        if nome not in FUNCOES_POR_NOME_PERMITIDAS:
+            raise ExpressaoNaoPermitida(f"Função não permitida: {nome!r}")
+
+
+def validar_expressao(expressao):
+    try:
+        arvore = ast.parse(expressao.strip(), mode='eval')
+    except SyntaxError as e:
+        raise ExpressaoNaoPermitida(f"Expressão inválida: {e.msg}") from e
+    for no in ast.walk(arvore):
+        if not isinstance(no, NOS_PERMITIDOS):
+            raise ExpressaoNaoPermitida(f"Operação não permitida: {type(no).__name__}")
+        if isinstance(no, ast.Name) and no.id not in NOMES_PERMITIDOS:
+            raise ExpressaoNaoPermitida(f"Nome não permitido: {no.id}")
+        if isinstance(no, ast.Attribute):
+            dono = no.value.id if isinstance(no.value, ast.Name) else None
+            permitidos = {'pd': ATRIBUTOS_PD_PERMITIDOS, 'np': ATRIBUTOS_NP_PERMITIDOS}.get(dono, ATRIBUTOS_PERMITIDOS)
+            if no.attr not in permitidos:
+                raise ExpressaoNaoPermitida(f"Atributo não permitido: {no.attr}")
+        if isinstance(no, ast.Call):
+            _validar_funcoes_por_nome(no)
+    return compile(arvore, '<analise>', 'eval')
+
+
+def _tabela_arrow(df):
+    import pyarrow as pa
+    try:
+        return pa.Table.from_pandas(df)
+    except (pa.ArrowInvalid, pa.ArrowTypeError, pa.ArrowNotImplementedError):
+        # Colunas object com tipos misturados (ex.: números e textos) viram texto anulável.
+        mistas = {col: 'string' for col in df.columns if df[col].dtype == object}
+        return pa.Table.from_pandas(df.astype(mistas))
+
+
+def _carregar_frame(caminho):
+    import pyarrow as pa
+    # O arquivo é mapeado em memória: colunas numéricas sem nulos são lidas sem cópia.
+    with pa.memory_map(caminho, 'r') as origem:
+        tabela = pa.ipc.open_file(origem).read_all()
+    return tabela.to_pandas(split_blocks=True)
+
+
+def _laco_trabalhador(conexao, limite_memoria_bytes, pasta_base):
+    if resource is not None and limite_memoria_bytes:
+        resource.setrlimit(resource.RLIMIT_AS, (limite_memoria_bytes, limite_memoria_bytes))
+    # Diretório de trabalho próprio e somente leitura: caminhos relativos não apontam para a pasta do app.
+    pasta_trabalho = tempfile.mkdtemp(prefix='trabalhador_', dir=pasta_base)
+    os.chmod(pasta_trabalho, 0o555)
+    os.chdir(pasta_trabalho)
+    import numpy as np
+    import pandas as pd
+    frames = OrderedDict()
+    while True:
+        try:
+            tarefa = conexao.recv()
+        except (EOFError, OSError):
+            return
+        if tarefa is None:
+            return
+        caminho, expressao = tarefa
+        try:
+            if caminho not in frames:
+                frames[caminho] = _carregar_frame(caminho)
+                while len(frames) > FRAMES_POR_TRABALHADOR:
+                    frames.popitem(last=False)
+            frames.move_to_end(caminho)
+            codigo = validar_expressao(expressao)
+            resultado = eval(codigo, {'__builtins__': FUNCOES_EMBUTIDAS_PERMITIDAS, 'df': frames[caminho], 'pd': pd, 'np': np})
+            conexao.send(('ok', resultado))
+        except MemoryError:
+            frames.clear()
+            conexao.send(('memoria', None))
+        except Exception as e:
+            try:
+                conexao.send(('erro', f"{type(e).__name__}: {e}"))
+            except Exception:
+                conexao.send(('erro', "O resultado da análise não pôde ser transferido."))
+
+
+class _Trabalhador:
+
+    def __init__(self, contexto, limite_memoria_bytes, pasta_base):
+        self.conexao, conexao_filho = contexto.Pipe()
+        self.processo = contexto.Process(target=_laco_trabalhador, args=(conexao_filho, limite_memoria_bytes, pasta_base), daemon=True)
+        self.processo.start()
+        conexao_filho.close()
+
+    def encerrar(self):
+        if self.processo.is_alive():
+            self.processo.kill()
+        self.processo.join(timeout=5)
+        self.conexao.close()
+
+
+class SandboxPandas:
+    # Pool de processos (spawn) compartilhado entre as sessões. Um trabalhador que estoura o tempo
+    # ou morre por falta de memória é encerrado e substituído por um novo.
+
+    def __init__(self, trabalhadores=2, tempo_limite_s=20.0, limite_memoria_mb=2048, pasta=None):
+        self.tempo_limite_s = tempo_limite_s
+        self.limite_memoria_bytes = int(limite_memoria_mb * 1024 * 1024) if limite_memoria_mb else None
+        self.pasta = pasta or tempfile.mkdtemp(prefix='mercurio_sandbox_')
+        os.makedirs(self.pasta, exist_ok=True)
+        self._contexto = multiprocessing.get_context('spawn')
+        self._livres = queue.Queue()
+        self._todos = set()
+        self._publicados = OrderedDict()
+        self._sequencia = itertools.count()
+        self._trava = threading.Lock()
+        for _ in range(trabalhadores):
+            self._devolver(self._novo_trabalhador())
+        atexit.register(self.encerrar)
+
+    def _novo_trabalhador(self):
+        trabalhador = _Trabalhador(self._contexto, self.limite_memoria_bytes, self.pasta)
+        with self._trava:
+            self._todos.add(trabalhador)
+        return trabalhador
+
+    def _devolver(self, trabalhador):
+        self._livres.put(trabalhador)
+
+    def _substituir(self, trabalhador):
+        trabalhador.encerrar()
+        with self._trava:
+            self._todos.discard(trabalhador)
+        self._devolver(self._novo_trabalhador())
+
+    def publicar(self, impressao, df):
+        # Escreve a base em Arrow IPC uma única vez por impressão; as mais antigas são apagadas.
+        import pyarrow as pa
+        with self._trava:
+            caminho = self._publicados.get(impressao)
+            if caminho is not None:
+                self._publicados.move_to_end(impressao)
+                return caminho
+            caminho = os.path.join(self.pasta, f"base_{next(self._sequencia)}.arrow")
+            tabela = _tabela_arrow(df)
+            with pa.OSFile(caminho, 'wb') as destino, pa.ipc.new_file(destino, tabela.schema) as escritor:
+                escritor.write_table(tabela)
+            self._publicados[impressao] = caminho
+            while len(self._publicados) > ARQUIVOS_PUBLICADOS_MAX:
+                _, antigo = self._publicados.popitem(last=False)
+                os.remove(antigo)
+            return caminho
+
+    def executar(self, impressao, df, expressao):
+        validar_expressao(expressao)
+        caminho = self.publicar(impressao, df)
+        trabalhador = self._livres.get()
+        try:
+            trabalhador.conexao.send((caminho, expressao))
+            if not trabalhador.conexao.poll(self.tempo_limite_s):
+                self._substituir(trabalhador)
+                trabalhador = None
+                raise TempoEsgotado(f"A análise passou de {self.tempo_limite_s:.0f} s e foi interrompida.")
+            try:
+                status, valor = trabalhador.conexao.recv()
+            except (EOFError, OSError):
+                self._substituir(trabalhador)
+                trabalhador = None
+                raise MemoriaExcedida("O processo da análise foi encerrado (provável falta de memória).")
+        except BaseException:
+            if trabalhador is not None:
+                self._substituir(trabalhador)
+            raise
+        self._devolver(trabalhador)
+        if status == 'ok':
+            return valor
+        if status == 'memoria':
+            raise MemoriaExcedida("A análise ultrapassou o limite de memória.")
+        raise ErroSandbox(valor)
+
+    def encerrar(self):
+        with self._trava:
+            trabalhadores, self._todos = list(self._todos), set()
+        for trabalhador in trabalhadores:
+            trabalhador.encerrar()
+        shutil.rmtree(self.pasta, ignore_errors=True)
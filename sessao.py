@@ -0,0 +1,53 @@
+import pandas as pd
+
+from ingestao import tamanho_dataframe
+
+# ------------------------------------------------------------
+# ARMAZENAMENTO DAS BASES NA SESSÃO (SEM CÓPIAS POR SEÇÃO)
+# ------------------------------------------------------------
+# As bases ficam uma única vez na sessão (e no cache de ingestão). Cada seção recebe uma visão:
+# com copy-on-write, a visão compartilha os dados e só a coluna alterada é copiada, se for alterada.
+BASES_SESSAO = ['df_dados', 'df_mapeamento', 'df_devolucao', 'df_pagamento']
+
+
+def ativar_copy_on_write():
+    # No pandas >= 3 o copy-on-write é sempre ativo e a opção está depreciada.
+    if int(pd.__version__.split('.')[0]) < 3:
+        try:
+            pd.set_option('mode.copy_on_write', True)
+        except (KeyError, pd.errors.OptionError):
+            pass
+
+
+def visao_base(df, colunas=None):
+    # Visão da base para uma seção. Com `colunas`, só o subconjunto estreito que a seção usa;
+    # colunas derivadas criadas na visão não alteram o frame guardado na sessão.
+    if df is None:
+        return None
+    if colunas is not None:
+        return df[list(dict.fromkeys(col for col in colunas if col is not None))]
+    return df.copy(deep=False)
+
+
+def relatorio_memoria_sessao(estado, medidas):
+    # Memória ocupada pelas bases desta sessão. A medição profunda percorre cada coluna de texto, então
+    # roda uma vez por base carregada: `medidas` (guardado na sessão) é chaveado pela impressão da base.
+    impressoes = estado.get('impressoes') or {}
+    atuais = {}
+    linhas = []
+    for df_key in BASES_SESSAO + ['cubo_dashboard']:
+        df = estado.get(df_key)
+        if df is None:
+            continue
+        # O cubo é derivado da Pesquisa de O.S.: muda junto com ela.
+        impressao = impressoes.get('df_dados' if df_key == 'cubo_dashboard' else df_key)
+        chave = (df_key, impressao)
+        if impressao is None or chave not in medidas:
+            medidas[chave] = (len(df), tamanho_dataframe(df) / 1024 ** 2)
+        atuais[chave] = medidas[chave]
+        total_linhas, memoria_mb = medidas[chave]
+        linhas.append({'Base': df_key, 'Linhas': total_linhas, 'Memória (MB)': memoria_mb})
+    # Bases substituídas ou removidas não ficam acumuladas na sessão.
+    for chave in set(medidas) - set(atuais):
+        del medidas[chave]
+    return pd.DataFrame(linhas, columns=['Base', 'Linhas', 'Memória (MB)'])
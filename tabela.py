@@ -0,0 +1,72 @@
+import math
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+# ------------------------------------------------------------
+# TABELA PAGINADA NO SERVIDOR
+# ------------------------------------------------------------
+# Busca, ordenação e escolha de colunas são feitas aqui; só a página visível vai para o navegador.
+# As posições filtradas/ordenadas ficam na sessão e só são recalculadas quando a base, a busca ou a
+# ordenação mudam (trocar de página não refaz nada).
+TAMANHOS_PAGINA = [25, 50, 100, 500]
+
+
+def mascara_busca(df, colunas, busca):
+    # Busca sem diferenciar maiúsculas em qualquer uma das colunas; em category só os rótulos são testados.
+    termo = busca.strip().lower()
+    mascara = np.zeros(len(df), dtype=bool)
+    for col in colunas:
+        serie = df[col]
+        if isinstance(serie.dtype, pd.CategoricalDtype):
+            rotulos = pd.Series(serie.cat.categories.astype(str)).str.lower().str.contains(termo, regex=False).to_numpy()
+            if len(rotulos):
+                codigos = serie.cat.codes.to_numpy()
+                mascara |= (codigos >= 0) & rotulos[np.maximum(codigos, 0)]
+        else:
+            mascara |= serie.astype(str).str.lower().str.contains(termo, regex=False, na=False).to_numpy(dtype=bool)
+    return mascara
+
+
+def posicoes_visiveis(df, colunas_busca, busca, ordenar_por=None, crescente=True):
+    posicoes = np.flatnonzero(mascara_busca(df, colunas_busca, busca)) if busca and busca.strip() else np.arange(len(df))
+    if ordenar_por is not None and len(posicoes):
+        valores = df[ordenar_por].iloc[posicoes].reset_index(drop=True)
+        ordem = valores.sort_values(ascending=crescente, na_position='last', kind='stable').index.to_numpy()
+        posicoes = posicoes[ordem]
+    return posicoes
+
+
+def fatiar_pagina(df, posicoes, colunas, pagina, tamanho_pagina):
+    inicio = (pagina - 1) * tamanho_pagina
+    return df.iloc[posicoes[inicio:inicio + tamanho_pagina]][colunas]
+
+
+def tabela_paginada(df, chave, versao=None, colunas_iniciais=None):
+    # `versao` identifica o conteúdo de df (ex.: impressão do upload + filtros); sem ela usa id/tamanho do frame.
+    if df is None or df.empty:
+        st.info("Nenhuma linha para exibir.")
+        return
+    todas_colunas = list(df.columns)
+    col_busca, col_colunas = st.columns([1, 2])
+    busca = col_busca.text_input("Buscar:", key=f"{chave}_busca", placeholder="Texto em qualquer coluna visível")
+    colunas = col_colunas.multiselect("Colunas:", options=todas_colunas, default=colunas_iniciais or todas_colunas, key=f"{chave}_colunas") or todas_colunas
+    col_ordem, col_sentido, col_tamanho, col_pagina = st.columns([2, 1, 1, 1])
+    ordenar_por = col_ordem.selectbox("Ordenar por:", options=[None] + todas_colunas, format_func=lambda c: "(ordem original)" if c is None else str(c), key=f"{chave}_ordenar")
+    crescente = col_sentido.radio("Sentido:", options=["Crescente", "Decrescente"], key=f"{chave}_sentido", horizontal=True) == "Crescente"
+    tamanho_pagina = col_tamanho.selectbox("Linhas por página:", options=TAMANHOS_PAGINA, index=1, key=f"{chave}_tamanho")
+
+    assinatura = (versao if versao is not None else id(df), len(df), busca.strip().lower(), tuple(colunas), ordenar_por, crescente)
+    guardado = st.session_state.get(f"{chave}_posicoes")
+    if guardado is None or guardado[0] != assinatura:
+        guardado = (assinatura, posicoes_visiveis(df, colunas, busca, ordenar_por, crescente))
+        st.session_state[f"{chave}_posicoes"] = guardado
+    posicoes = guardado[1]
+
+    total_paginas = max(1, math.ceil(len(posicoes) / tamanho_pagina))
+    pagina = col_pagina.number_input(f"Página (de {total_paginas}):", min_value=1, max_value=total_paginas, value=1, step=1, key=f"{chave}_pagina_{hash(assinatura[2:])}_{tamanho_pagina}")
+    st.dataframe(fatiar_pagina(df, posicoes, colunas, pagina, tamanho_pagina), hide_index=True)
+    inicio = (pagina - 1) * tamanho_pagina
+    filtro = f" (filtradas de {len(df)})" if len(posicoes) != len(df) else ""
+    st.caption(f"Linhas {min(inicio + 1, len(posicoes))}–{min(inicio + tamanho_pagina, len(posicoes))} de {len(posicoes)}{filtro}")
@@ -0,0 +1,56 @@
+import threading
+import time
+from dataclasses import dataclass
+
+
+@dataclass
+class PedacoFalso:
+    text: str
+
+
+class ModeloFalso:
+    # Modelo local para testes: devolve os pedaços informados, com um atraso opcional entre eles.
+    # `falhas` são exceções levantadas, em ordem, pelas primeiras chamadas (ex.: simular cota esgotada).
+    # `dormir` permite avançar um relógio falso em vez de esperar de verdade.
+
+    def __init__(self, pedacos, atraso_s=0.0, falhas=(), dormir=time.sleep):
+        self.pedacos = list(pedacos)
+        self.atraso_s = atraso_s
+        self.falhas = list(falhas)
+        self.dormir = dormir
+        self.prompts = []
+        self.entregues = 0
+        self._trava = threading.Lock()
+
+    def generate_content(self, prompt, stream=False):
+        with self._trava:
+            self.prompts.append(prompt)
+            falha = self.falhas.pop(0) if self.falhas else None
+        if self.atraso_s and not stream:
+            self.dormir(self.atraso_s)
+        if falha is not None:
+            raise falha
+        if not stream:
+            return PedacoFalso(''.join(self.pedacos))
+        return self._transmitir()
+
+    def _transmitir(self):
+        for pedaco in self.pedacos:
+            if self.atraso_s:
+                self.dormir(self.atraso_s)
+            self.entregues += 1
+            yield PedacoFalso(pedaco)
+
+
+class RelogioFalso:
+
+    def __init__(self):
+        self.agora = 0.0
+        self.esperas = []
+
+    def __call__(self):
+        return self.agora
+
+    def dormir(self, segundos):
+        self.esperas.append(segundos)
+        self.agora += segundos
@@ -0,0 +1,24 @@
+import cache_analises
+from cache_analises import SEM_RESULTADO, CacheAnalises
+
+
+def test_pergunta_normalizada(tmp_path):
+    cache = CacheAnalises(str(tmp_path / 'analises.sqlite'), limite_bytes=1024 * 1024)
+    cache.guardar('base-1', 'Quantas ordens por cidade?', "df['Cidade'].value_counts()", {'A': 2})
+    assert cache.obter('base-1', '  quantas ordens   POR cidade ') == ("df['Cidade'].value_counts()", {'A': 2})
+    assert cache.obter('base-2', 'Quantas ordens por cidade?') is None
+
+
+def test_mudar_versao_invalida_entradas(tmp_path, monkeypatch):
+    caminho = str(tmp_path / 'analises.sqlite')
+    cache = CacheAnalises(caminho, limite_bytes=1024 * 1024)
+    cache.guardar('base-1', 'total de ordens', 'len(df)')
+    assert cache.obter('base-1', 'total de ordens') == ('len(df)', SEM_RESULTADO)
+
+    monkeypatch.setattr(cache_analises, 'VERSAO_CACHE_ANALISES', cache_analises.VERSAO_CACHE_ANALISES + 1)
+    assert cache.obter('base-1', 'total de ordens') is None
+    # Ao reabrir com a versão nova, as entradas antigas deixam de ocupar espaço.
+    reaberto = CacheAnalises(caminho, limite_bytes=1024 * 1024)
+    assert len(reaberto) == 0
+    reaberto.guardar('base-1', 'total de ordens', 'df.shape[0]')
+    assert reaberto.obter('base-1', 'total de ordens') == ('df.shape[0]', SEM_RESULTADO)
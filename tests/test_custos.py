@@ -0,0 +1,70 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from custos import OBSERVACAO_DUPLICIDADE, detectar_duplicidades
+
+GROUP_KEYS = ['DATA_ANALISE', 'Cidade O.S.', 'Representante', 'Técnico']
+OS_COL = 'OS'
+
+
+def _pipeline_antigo(df):
+    # Implementação anterior do analisador de duplicidade no app.py.
+    df = df.copy()
+    df['is_first'] = ~df.duplicated(subset=GROUP_KEYS, keep='first')
+    grupos = df.groupby(GROUP_KEYS, observed=True).filter(lambda x: len(x) > 1)
+    grupos['VALOR_CALCULADO_AJUSTADO'] = np.where(grupos['is_first'], grupos['VALOR_CALCULADO'], 0)
+    grupos['OBSERVACAO'] = np.where(grupos['is_first'], grupos['OBSERVACAO'], OBSERVACAO_DUPLICIDADE)
+    return grupos.sort_values(by=GROUP_KEYS + [OS_COL])
+
+
+def _pagamentos(linhas=3000, semente=11):
+    rng = np.random.default_rng(semente)
+    datas = pd.Timestamp('2024-01-01') + pd.to_timedelta(rng.integers(0, 20, linhas), unit='D')
+    df = pd.DataFrame({
+        OS_COL: rng.permutation(linhas) + 9_000_000,
+        'DATA_ANALISE': pd.Series(datas).dt.date,
+        'Cidade O.S.': rng.choice(['Cidade A', 'Cidade B', 'Cidade C'], linhas).astype(object),
+        'Representante': rng.choice(['RT 1', 'RT 2', 'RT 3'], linhas).astype(object),
+        'Técnico': rng.choice(['Técnico 1', 'Técnico 2'], linhas).astype(object),
+        'VALOR_CALCULADO': rng.gamma(2.0, 50.0, linhas).round(2),
+        'OBSERVACAO': rng.choice(['', 'Ok', 'Deslocamento extra'], linhas).astype(object),
+    })
+    # Chaves ausentes, como datas de fechamento inválidas e cidades em branco.
+    df.loc[rng.random(linhas) < 0.05, 'DATA_ANALISE'] = None
+    df.loc[rng.random(linhas) < 0.05, 'Cidade O.S.'] = np.nan
+    return df
+
+
+def _comparar(df):
+    esperado = _pipeline_antigo(df)
+    resultado, resumo = detectar_duplicidades(df, GROUP_KEYS, OS_COL)
+    assert resultado.index.tolist() == esperado.index.tolist()
+    assert resultado[OS_COL].tolist() == esperado[OS_COL].tolist()
+    np.testing.assert_array_equal(resultado['VALOR_CALCULADO_AJUSTADO'].to_numpy(), esperado['VALOR_CALCULADO_AJUSTADO'].to_numpy())
+    assert resultado['OBSERVACAO'].tolist() == esperado['OBSERVACAO'].tolist()
+    assert resumo['Ordens no Grupo'].sum() == len(esperado)
+    assert resumo['Duplicidades'].sum() == int((~esperado['is_first']).sum())
+    assert resumo['Valor Zerado'].sum() == pytest.approx((esperado['VALOR_CALCULADO'] - esperado['VALOR_CALCULADO_AJUSTADO']).sum())
+
+
+def test_igual_ao_pipeline_antigo_com_chaves_ausentes():
+    df = _pagamentos()
+    assert df[GROUP_KEYS].isna().any(axis=1).any()
+    _comparar(df)
+
+
+def test_igual_ao_pipeline_antigo_com_chaves_categoricas():
+    df = _pagamentos(semente=12)
+    for chave in ['Cidade O.S.', 'Representante', 'Técnico']:
+        df[chave] = df[chave].astype('category')
+    # Categoria sem nenhuma linha não pode gerar grupo.
+    df['Representante'] = df['Representante'].cat.add_categories(['RT sem ordens'])
+    _comparar(df)
+
+
+def test_sem_duplicidade():
+    df = _pagamentos(linhas=4).assign(**{'Técnico': ['T1', 'T2', 'T3', 'T4']})
+    resultado, resumo = detectar_duplicidades(df, GROUP_KEYS, OS_COL)
+    assert resultado.empty and resumo.empty
+    assert _pipeline_antigo(df).empty
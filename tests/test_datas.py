@@ -0,0 +1,40 @@
+import pandas as pd
+
+from datas import converter_datas, inferir_formato_data, normalizar_datas
+
+
+def _pagamento(datas):
+    return pd.DataFrame({'OS': range(len(datas)), 'Data de Fechamento': datas})
+
+
+def test_valores_fora_do_formato_sao_relidos_no_modo_misto():
+    datas = pd.date_range('2024-01-01', periods=95).strftime('%d/%m/%Y').tolist()
+    datas += ['05/04/2024 10:30', '06/04/2024 08:15:00', '2024-04-07', '08/04/2024 23:59', '09/04/2024 00:01']
+    assert len(datas) == 100
+    df, formatos, nao_convertidas = normalizar_datas(_pagamento(datas), 'df_pagamento')
+    coluna = df['Data de Fechamento']
+    assert coluna.notna().all()
+    assert coluna.iloc[0] == pd.Timestamp('2024-01-01') and coluna.iloc[94] == pd.Timestamp('2024-04-04')
+    assert coluna.iloc[95:].tolist() == [pd.Timestamp('2024-04-05 10:30'), pd.Timestamp('2024-04-06 08:15'), pd.Timestamp('2024-04-07'),
+                                         pd.Timestamp('2024-04-08 23:59'), pd.Timestamp('2024-04-09 00:01')]
+    assert formatos['Data de Fechamento'] == '%d/%m/%Y + 5 em formato misto'
+    assert nao_convertidas == {}
+
+
+def test_conta_valores_que_nao_sao_datas():
+    datas = pd.date_range('2024-01-01', periods=96).strftime('%d/%m/%Y').tolist() + ['sem data', 'sem data', '', None]
+    df, formatos, nao_convertidas = normalizar_datas(_pagamento(datas), 'df_pagamento')
+    assert formatos['Data de Fechamento'] == '%d/%m/%Y'
+    # Vazios e nulos não contam; o texto repetido conta uma vez por linha.
+    assert nao_convertidas == {'Data de Fechamento': 2}
+    assert df['Data de Fechamento'].isna().sum() == 4
+
+
+def test_converter_sem_formato_usa_modo_misto():
+    datas, reconvertidas, nao_convertidas = converter_datas(pd.Series(['05/01/2024', '2024-01-06 10:00', 'x']), None)
+    assert datas.iloc[0] == pd.Timestamp('2024-01-05') and datas.iloc[1] == pd.Timestamp('2024-01-06 10:00')
+    assert (reconvertidas, nao_convertidas) == (0, 1)
+
+
+def test_inferir_formato_prefere_dia_primeiro():
+    assert inferir_formato_data(['01/02/2024', '03/04/2024']) == '%d/%m/%Y'
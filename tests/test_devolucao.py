@@ -0,0 +1,34 @@
+import pandas as pd
+
+from devolucao import COLUNA_DIAS_ATRASO, IndiceVencidas, faixa_atraso
+
+
+def _indice(prazos, hoje):
+    df = pd.DataFrame({
+        'Número da O.S': range(len(prazos)),
+        'Cliente Nome': ['Cliente A'] * len(prazos),
+        'Prazo Instalação': pd.to_datetime(prazos),
+    })
+    return IndiceVencidas(df, 'Prazo Instalação', 'Cliente Nome', hoje)
+
+
+def test_atraso_menor_que_um_dia_conta_como_um_dia():
+    indice = _indice(['2024-03-09 14:00', '2024-03-10 08:00', '2024-03-02 23:59', '2024-03-11 00:00'], pd.Timestamp('2024-03-10'))
+    assert indice.total == 2
+    assert indice.ordens_do_cliente('Cliente A')[COLUNA_DIAS_ATRASO].tolist() == [1, 8]
+    envelhecimento = indice.envelhecimento().set_index('Atraso')['Ordens']
+    assert envelhecimento['1 a 7 dias'] == 1
+    assert envelhecimento['8 a 15 dias'] == 1
+
+
+def test_horario_de_hoje_nao_altera_vencidas():
+    # Prazo no mesmo dia, antes do horário atual: ainda não está vencido.
+    indice = _indice(['2024-03-10 08:00', '2024-03-09 23:00'], pd.Timestamp('2024-03-10 12:00'))
+    assert indice.total == 1
+    assert indice.ordens_do_cliente('Cliente A')[COLUNA_DIAS_ATRASO].tolist() == [1]
+
+
+def test_faixas_nos_limites():
+    faixas = faixa_atraso([1, 7, 8, 15, 16, 30, 31, 60, 61, 90, 91, 400])
+    assert list(faixas) == ['1 a 7 dias', '1 a 7 dias', '8 a 15 dias', '8 a 15 dias', '16 a 30 dias', '16 a 30 dias',
+                            '31 a 60 dias', '31 a 60 dias', '61 a 90 dias', '61 a 90 dias', 'Mais de 90 dias', 'Mais de 90 dias']
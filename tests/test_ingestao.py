@@ -0,0 +1,114 @@
+import io
+
+import openpyxl
+import pandas as pd
+import pytest
+
+from ingestao import (COLUNA_ARQUIVO_ORIGEM, TAMANHO_AMOSTRA_CSV, CacheColunar, CacheIngestao, carregar_com_cache, carregar_dataframe,
+                      combinar_arquivos)
+
+
+class ArquivoEnviado(io.BytesIO):
+
+    def __init__(self, conteudo, nome):
+        super().__init__(conteudo)
+        self.name = nome
+        self.size = len(conteudo)
+
+
+def _csv_latin1_depois_da_amostra():
+    linhas = ["OS;Cidade;Valor"] + [f"{i};Campinas;10,5" for i in range(TAMANHO_AMOSTRA_CSV // 15)]
+    linhas.append("999999;São Paulo;20,0")
+    return ("\n".join(linhas) + "\n").encode('latin-1')
+
+
+@pytest.mark.parametrize('em_blocos', [False, True])
+def test_latin1_depois_da_amostra_ascii(em_blocos):
+    conteudo = _csv_latin1_depois_da_amostra()
+    assert len(conteudo) > TAMANHO_AMOSTRA_CSV
+    df = carregar_dataframe(ArquivoEnviado(conteudo, 'base.csv'), ';', em_blocos=em_blocos)
+    assert df.attrs['dialeto'].encoding == 'latin-1'
+    assert df['Cidade'].astype(str).iloc[-1] == 'São Paulo'
+    assert df['Valor'].iloc[-1] == 20.0
+
+
+def test_utf8_continua_utf8():
+    conteudo = "OS;Cidade\n1;São Paulo\n2;Ribeirão Preto\n".encode('utf-8')
+    df = carregar_dataframe(ArquivoEnviado(conteudo, 'base.csv'), ';', em_blocos=False)
+    assert df.attrs['dialeto'].encoding == 'utf-8'
+    assert df['Cidade'].astype(str).tolist() == ['São Paulo', 'Ribeirão Preto']
+
+
+def test_combinar_mantem_data_tipada_quando_um_arquivo_nao_tem_a_coluna():
+    cabecalho = "Número da O.S;Status;Cidade Agendamento"
+    janeiro = f"{cabecalho};Data Agendamento\n1;Agendada;Campinas;05/01/2024\n2;Agendada;Santos;06/01/2024\n"
+    fevereiro = f"{cabecalho}\n2;Realizada;Santos\n3;Agendada;Sorocaba\n"
+    partes = [(nome, carregar_dataframe(ArquivoEnviado(conteudo.encode('utf-8'), nome), ';', 'df_dados', em_blocos=False))
+              for nome, conteudo in [('jan.csv', janeiro), ('fev.csv', fevereiro)]]
+    combinado = combinar_arquivos(partes, 'df_dados')
+    assert pd.api.types.is_datetime64_any_dtype(combinado['Data Agendamento'].dtype)
+    assert combinado['Número da O.S'].tolist() == [1, 2, 3]
+    assert combinado['Data Agendamento'].iloc[0] == pd.Timestamp('2024-01-05')
+    assert combinado['Data Agendamento'].iloc[1:].isna().all()
+    assert combinado[COLUNA_ARQUIVO_ORIGEM].astype(str).tolist() == ['jan.csv', 'fev.csv', 'fev.csv']
+    assert combinado.attrs['linhas_substituidas'] == 1
+
+
+@pytest.mark.parametrize('em_blocos', [False, True])
+def test_separador_no_fim_das_linhas_de_dados(em_blocos):
+    conteudo = "OS;Status;Cidade\n" + "".join(f"{i};Agendada;Campinas;\n" for i in range(20))
+    df = carregar_dataframe(ArquivoEnviado(conteudo.encode('utf-8'), 'base.csv'), ';', em_blocos=em_blocos)
+    assert df.attrs['dialeto'].linha_cabecalho == 0
+    assert list(df.columns) == ['OS', 'Status', 'Cidade']
+    assert len(df) == 20
+    assert df['OS'].tolist() == list(range(20))
+    assert df['Cidade'].astype(str).eq('Campinas').all()
+
+
+def test_separador_no_fim_com_preambulo():
+    conteudo = "Relatório de ordens\n\nOS;Status;Cidade\n" + "".join(f"{i};Agendada;Santos;\n" for i in range(10))
+    df = carregar_dataframe(ArquivoEnviado(conteudo.encode('utf-8'), 'base.csv'), ';', em_blocos=False)
+    assert df.attrs['dialeto'].linha_cabecalho == 2
+    assert list(df.columns) == ['OS', 'Status', 'Cidade'] and len(df) == 10
+
+
+def test_decimal_virgula_com_coordenadas_em_ponto():
+    conteudo = "OS;Valor;Latitude\n" + "".join(f"{i};10,5;-23.5\n" for i in range(10))
+    df = carregar_dataframe(ArquivoEnviado(conteudo.encode('utf-8'), 'base.csv'), ';', em_blocos=False)
+    assert df.attrs['dialeto'].decimal == ','
+    assert df['Valor'].tolist() == [10.5] * 10
+    assert pd.to_numeric(df['Latitude'].astype(str)).tolist() == [-23.5] * 10
+
+
+def test_cache_colunar_guarda_colunas_com_tipos_misturados(tmp_path):
+    df = pd.DataFrame({
+        'Número da O.S': [1, 'A-2', 3, None],
+        'Status': pd.Categorical(['Agendada', 7, 'Agendada', 'Cancelada']),
+        'Valor': [10.5, 20.0, 0.0, 1.25],
+        'Data': pd.to_datetime(['2024-01-05', '2024-01-06', None, '2024-01-08']),
+    })
+    cache = CacheColunar(str(tmp_path), limite_bytes=10 * 1024 * 1024)
+    assert cache.guardar('chave', df)
+    assert len(cache) == 1
+    lido = cache.obter('chave')
+    assert lido['Número da O.S'].tolist()[:3] == ['1', 'A-2', '3'] and pd.isna(lido['Número da O.S'].iloc[3])
+    assert lido['Status'].astype(str).tolist() == ['Agendada', '7', 'Agendada', 'Cancelada']
+    pd.testing.assert_series_equal(lido['Valor'], df['Valor'])
+    pd.testing.assert_series_equal(lido['Data'], df['Data'], check_dtype=False)
+
+
+def test_planilha_com_tipos_misturados_volta_do_disco(tmp_path):
+    pasta = openpyxl.Workbook()
+    aba = pasta.active
+    aba.append(['Número da O.S', 'Status'])
+    for linha in [[1, 'Agendada'], ['OS-2', 'Cancelada'], [3, 'Agendada']]:
+        aba.append(linha)
+    buffer = io.BytesIO()
+    pasta.save(buffer)
+    disco = CacheColunar(str(tmp_path), limite_bytes=10 * 1024 * 1024)
+    arquivo = ArquivoEnviado(buffer.getvalue(), 'base.xlsx')
+    _, origem, _ = carregar_com_cache(CacheIngestao(10 * 1024 * 1024), arquivo, ';', 'df_dados', em_blocos=False, cache_disco=disco)
+    assert origem == 'cache miss' and len(disco) == 1
+    df, origem, _ = carregar_com_cache(CacheIngestao(10 * 1024 * 1024), arquivo, ';', 'df_dados', em_blocos=False, cache_disco=disco)
+    assert origem == 'cache em disco'
+    assert df['Número da O.S'].astype(str).tolist() == ['1', 'OS-2', '3']
@@ -0,0 +1,199 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from modelo_falso import ModeloFalso, PedacoFalso, RelogioFalso
+
+from llm import BaldeTokens, CamadaRequisicoes, ErroCotaModelo, formatar_latencia, transmitir_resposta
+
+
+def test_pedacos_chegam_em_ordem_e_acumulados():
+    modelo = ModeloFalso(['Olá', ', ', 'mundo', '!'])
+    parciais = []
+    resposta = transmitir_resposta(modelo, 'oi', ao_receber=parciais.append)
+    assert resposta.texto == 'Olá, mundo!'
+    assert parciais == ['Olá', 'Olá, ', 'Olá, mundo', 'Olá, mundo!']
+    assert not resposta.cancelada
+    assert modelo.prompts == ['oi']
+
+
+def test_registra_primeiro_token_e_total():
+    relogio = RelogioFalso()
+    modelo = ModeloFalso(['a', 'b', 'c'], atraso_s=0.5, dormir=relogio.dormir)
+    resposta = transmitir_resposta(modelo, 'oi', relogio=relogio)
+    assert resposta.primeiro_token_s == pytest.approx(0.5)
+    assert resposta.total_s == pytest.approx(1.5)
+    assert formatar_latencia(resposta.primeiro_token_s, resposta.total_s) == "1º token em 0.50 s · total 1.50 s"
+
+
+def test_pedacos_vazios_nao_contam_como_primeiro_token():
+    relogio = RelogioFalso()
+    modelo = ModeloFalso(['', '', 'texto'], atraso_s=1.0, dormir=relogio.dormir)
+    resposta = transmitir_resposta(modelo, 'oi', relogio=relogio)
+    assert resposta.texto == 'texto'
+    assert resposta.primeiro_token_s == pytest.approx(3.0)
+
+
+def test_pedaco_bloqueado_e_ignorado():
+    class PedacoBloqueado:
+        @property
+        def text(self):
+            raise ValueError("bloqueado por segurança")
+
+    class ModeloComBloqueio(ModeloFalso):
+        def _transmitir(self):
+            yield PedacoFalso('antes ')
+            yield PedacoBloqueado()
+            yield PedacoFalso('depois')
+
+    assert transmitir_resposta(ModeloComBloqueio([]), 'oi').texto == 'antes depois'
+
+
+def test_cancelado_interrompe_no_meio():
+    modelo = ModeloFalso(['um ', 'dois ', 'três ', 'quatro'])
+    parciais = []
+    resposta = transmitir_resposta(modelo, 'oi', ao_receber=parciais.append, cancelado=lambda: len(parciais) >= 2)
+    assert resposta.cancelada
+    assert resposta.texto == 'um dois '
+    # O terceiro pedaço foi lido do stream, mas descartado; o quarto nunca foi pedido.
+    assert modelo.entregues == 3
+
+
+def test_sem_texto_nao_tem_primeiro_token():
+    resposta = transmitir_resposta(ModeloFalso([]), 'oi')
+    assert resposta.texto == '' and resposta.primeiro_token_s is None
+    assert formatar_latencia(None, resposta.total_s).startswith("1º token em —")
+
+
+# ------------------------------------------------------------
+# CAMADA DE REQUISIÇÕES
+# ------------------------------------------------------------
+class ResourceExhausted(Exception):
+    pass
+
+
+def _camada(relogio, **opcoes):
+    return CamadaRequisicoes(relogio=relogio, dormir=relogio.dormir, **opcoes)
+
+
+def test_balde_limita_a_taxa():
+    relogio = RelogioFalso()
+    balde = BaldeTokens(por_minuto=60, capacidade=2, relogio=relogio, dormir=relogio.dormir)
+    momentos = []
+    for _ in range(5):
+        balde.adquirir()
+        momentos.append(relogio.agora)
+    # Duas de rajada, depois uma por segundo.
+    assert momentos == pytest.approx([0.0, 0.0, 1.0, 2.0, 3.0])
+
+
+def test_balde_por_chave_de_api():
+    relogio = RelogioFalso()
+    camada = _camada(relogio, por_minuto=6)
+    for chave in ['chave-a', 'chave-b']:
+        camada.executar(chave, lambda: 'ok')
+    assert relogio.esperas == []
+    camada.executar('chave-a', lambda: 'ok')
+    assert sum(relogio.esperas) == pytest.approx(10.0)
+
+
+def test_semaforo_limita_concorrencia():
+    camada = CamadaRequisicoes(por_minuto=6000, max_concorrentes=2)
+    ativos, maximo, trava = [0], [0], threading.Lock()
+
+    def chamada():
+        with trava:
+            ativos[0] += 1
+            maximo[0] = max(maximo[0], ativos[0])
+        time.sleep(0.02)
+        with trava:
+            ativos[0] -= 1
+        return 'ok'
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        resultados = list(executor.map(lambda _: camada.executar('chave', chamada), range(8)))
+    assert resultados == ['ok'] * 8
+    assert maximo[0] == 2
+
+
+def test_espera_exponencial_limitada():
+    camada = CamadaRequisicoes(espera_base_s=1.0, espera_max_s=8.0)
+    for tentativa in range(10):
+        teto = min(8.0, 2 ** tentativa)
+        for _ in range(20):
+            assert teto / 2 <= camada._espera(tentativa) <= teto
+
+
+def test_repete_quando_a_cota_estoura():
+    relogio = RelogioFalso()
+    modelo = ModeloFalso(['resposta'], falhas=[ResourceExhausted('429'), ResourceExhausted('429')])
+    camada = _camada(relogio, por_minuto=6000, espera_base_s=1.0, espera_max_s=30.0)
+    resposta = camada.executar('chave', modelo.generate_content, 'oi')
+    assert resposta.text == 'resposta'
+    assert len(modelo.prompts) == 3
+    assert camada.estatisticas == {'chamadas': 3, 'retentativas': 2, 'deduplicadas': 0}
+    assert 0.5 <= relogio.esperas[0] <= 1.0 and 1.0 <= relogio.esperas[1] <= 2.0
+
+
+def test_erro_depois_da_ultima_tentativa():
+    relogio = RelogioFalso()
+    modelo = ModeloFalso(['nunca'], falhas=[ResourceExhausted('429')] * 10)
+    camada = _camada(relogio, por_minuto=6000, max_tentativas=3, espera_max_s=4.0)
+    with pytest.raises(ErroCotaModelo):
+        camada.executar('chave', modelo.generate_content, 'oi')
+    assert len(modelo.prompts) == 3
+    assert len(relogio.esperas) == 2 and max(relogio.esperas) <= 4.0
+
+
+def test_erro_nao_retentavel_sobe_na_hora():
+    modelo = ModeloFalso(['nunca'], falhas=[KeyError('outro erro')])
+    camada = _camada(RelogioFalso(), por_minuto=6000)
+    with pytest.raises(KeyError):
+        camada.executar('chave', modelo.generate_content, 'oi')
+    assert len(modelo.prompts) == 1
+
+
+def test_chamadas_identicas_em_andamento_sao_deduplicadas():
+    camada = CamadaRequisicoes(por_minuto=6000)
+    liberar = threading.Event()
+    chamadas = []
+
+    def chamada(prompt):
+        chamadas.append(prompt)
+        liberar.wait(5)
+        return f"resposta para {prompt}"
+
+    with ThreadPoolExecutor(max_workers=5) as executor:
+        futuros = [executor.submit(camada.executar, 'chave', chamada, 'oi', chave_dedup=('modelo', 'oi')) for _ in range(5)]
+        limite = time.monotonic() + 5
+        while camada.estatisticas['deduplicadas'] < 4 and time.monotonic() < limite:
+            time.sleep(0.005)
+        liberar.set()
+        resultados = [futuro.result(5) for futuro in futuros]
+    assert resultados == ['resposta para oi'] * 5
+    assert chamadas == ['oi']
+    assert camada.estatisticas['deduplicadas'] == 4
+    # Terminada a chamada, a mesma pergunta volta a ir ao modelo.
+    camada.executar('chave', lambda: 'nova', chave_dedup=('modelo', 'oi'))
+    assert camada.estatisticas['chamadas'] == 2
+
+
+def test_stream_repete_se_falhar_antes_do_primeiro_pedaco():
+    relogio = RelogioFalso()
+    modelo = ModeloFalso(['a', 'b'], falhas=[ResourceExhausted('429')])
+    resposta = _camada(relogio, por_minuto=6000).transmitir('chave', modelo, 'oi')
+    assert resposta.texto == 'ab'
+    assert len(modelo.prompts) == 2
+
+
+def test_stream_nao_repete_depois_do_primeiro_pedaco():
+    class ModeloQueCai(ModeloFalso):
+        def _transmitir(self):
+            yield PedacoFalso('parcial')
+            raise ResourceExhausted('429')
+
+    modelo = ModeloQueCai([])
+    with pytest.raises(ResourceExhausted):
+        _camada(RelogioFalso(), por_minuto=6000).transmitir('chave', modelo, 'oi')
+    assert len(modelo.prompts) == 1
@@ -0,0 +1,68 @@
+import numpy as np
+import pandas as pd
+import pytest
+from haversine import Unit, haversine
+
+from otimizador import IndiceRepresentantes, haversine_km
+
+
+@pytest.fixture
+def mapeamento():
+    rng = np.random.default_rng(7)
+    linhas = 400
+    nomes = np.array([f"RT {i:03d}" for i in rng.integers(0, 150, linhas)], dtype=object)
+    nomes[::37] = 'STELLANTIS Oficina'
+    nomes[5::41] = 'Ceabs Parceiro'
+    nomes[9::53] = 'FCA Chrysler Rede'
+    lat = rng.uniform(-33.0, 4.0, linhas)
+    lon = rng.uniform(-72.0, -35.0, linhas)
+    lat[::60] = 999.0
+    return pd.DataFrame({'nm_representante': nomes, 'lat': lat, 'lon': lon})
+
+
+def _forca_bruta(df, lat, lon, k, raio_km=None):
+    # Referência direta: primeira ocorrência de cada RT, sem os termos excluídos, haversine linha a linha.
+    primeiros = df.drop_duplicates(subset=['nm_representante'], keep='first')
+    candidatos = []
+    for posicao, (nome, lat_rt, lon_rt) in enumerate(primeiros[['nm_representante', 'lat', 'lon']].itertuples(index=False)):
+        if any(termo in nome.lower() for termo in ['stellantis', 'ceabs', 'fca chrysler']) or abs(lat_rt) > 90 or abs(lon_rt) > 180:
+            continue
+        distancia = haversine((lat_rt, lon_rt), (lat, lon), unit=Unit.KILOMETERS)
+        if raio_km is None or distancia <= raio_km:
+            candidatos.append((distancia, posicao, nome))
+    return sorted(candidatos)[:k]
+
+
+def test_haversine_km_igual_ao_haversine_por_linha():
+    rng = np.random.default_rng(1)
+    lat1, lon1 = rng.uniform(-90, 90, 200), rng.uniform(-180, 180, 200)
+    lat2, lon2 = rng.uniform(-90, 90, 200), rng.uniform(-180, 180, 200)
+    esperado = [haversine((a, b), (c, d), unit=Unit.KILOMETERS) for a, b, c, d in zip(lat1, lon1, lat2, lon2)]
+    np.testing.assert_allclose(haversine_km(lat1, lon1, lat2, lon2), esperado, rtol=1e-12, atol=1e-9)
+
+
+@pytest.mark.parametrize('raio_km', [None, 150, 800])
+@pytest.mark.parametrize('k', [1, 5])
+def test_vizinhos_igual_forca_bruta(mapeamento, k, raio_km):
+    indice = IndiceRepresentantes.construir(mapeamento, 'nm_representante', 'lat', 'lon')
+    rng = np.random.default_rng(3)
+    for lat, lon in zip(rng.uniform(-34.0, 5.0, 60), rng.uniform(-74.0, -34.0, 60)):
+        resultado = indice.vizinhos(lat, lon, k=k, raio_km=raio_km)
+        esperado = _forca_bruta(mapeamento, lat, lon, k, raio_km)
+        assert resultado['Representante'].tolist() == [nome for _, _, nome in esperado]
+        np.testing.assert_allclose(resultado['Distancia (km)'].to_numpy(dtype=float), [d for d, _, _ in esperado], rtol=1e-12)
+
+
+def test_exclusoes_e_primeira_ocorrencia():
+    df = pd.DataFrame({
+        'nm_representante': ['RT Norte', 'Stellantis Centro', 'RT Norte', 'CEABS Sul', 'RT Leste'],
+        'lat': [-23.0, -23.5, -10.0, -23.5, -22.0],
+        'lon': [-46.0, -46.5, -40.0, -46.5, -45.0],
+    })
+    indice = IndiceRepresentantes.construir(df, 'nm_representante', 'lat', 'lon')
+    resultado = indice.vizinhos(-23.5, -46.5, k=5)
+    assert resultado['Representante'].tolist() == ['RT Norte', 'RT Leste']
+    # A segunda linha de "RT Norte" (-10, -40) é ignorada: vale a coordenada da primeira ocorrência.
+    esperado = haversine((-23.0, -46.0), (-23.5, -46.5), unit=Unit.KILOMETERS)
+    assert resultado['Distancia (km)'].iloc[0] == pytest.approx(esperado)
+    assert indice.distancia('RT Norte', -23.5, -46.5) == pytest.approx(esperado)
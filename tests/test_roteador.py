@@ -0,0 +1,101 @@
+import pandas as pd
+import pytest
+
+from esquema import resolver_esquema
+from roteador import RoteadorPerguntas
+
+HOJE = pd.Timestamp('2024-03-15')
+
+
+@pytest.fixture
+def bases():
+    dados = pd.DataFrame({
+        'Número da O.S': range(1, 9),
+        'Status': ['Agendada', 'Agendada', 'Serviços realizados', 'Agendada', 'Cancelada', 'Serviços realizados', 'Agendada', 'Agendada'],
+        'Cidade Agendamento': ['Campinas', 'Campinas', 'Santos', 'Sorocaba', 'Campinas', 'Santos', 'Santos', 'Campinas'],
+        'Representante Técnico': ['RT A', 'RT B', 'RT A', 'RT C', 'RT A', 'RT B', 'RT A', 'RT A'],
+        'Cliente': ['Alfa', 'Beta', 'Alfa', 'Alfa', 'Gama', 'Beta', 'Alfa', 'Beta'],
+        'Data Agendamento': pd.to_datetime(['2024-03-15', '2024-03-14', '2024-03-01', '2024-02-10', '2024-03-15', '2024-01-05', '2024-03-10', '2024-03-15']),
+    })
+    pagamento = pd.DataFrame({
+        'OS': range(1, 5),
+        'Cidade O.S.': ['Campinas', 'Santos', 'Campinas', 'Sorocaba'],
+        'Representante': ['RT A', 'RT B', 'RT A', 'RT C'],
+        'Data de Fechamento': pd.to_datetime(['2024-03-01', '2024-03-02', '2024-03-03', '2024-02-01']),
+        'Valor Deslocamento': ['R$ 100,00', 'R$ 50,00', 'R$ 25,00', 'R$ 80,00'],
+        'Deslocamento': ['40', '20', '10', '35'],
+        'Valor Extra': ['R$ 0,00', 'R$ 30,00', 'R$ 0,00', 'R$ 12,00'],
+        'Pedágio': ['R$ 10,00', 'R$ 5,00', 'R$ 2,50', 'R$ 0,00'],
+        'PEDAGIO_NUM': [10.0, 5.0, 2.5, 0.0],
+        'VALOR_EXTRA_NUM': [0.0, 30.0, 0.0, 12.0],
+        'VALOR_DESLOC_ORIGINAL': [100.0, 50.0, 25.0, 80.0],
+        'DESLOC_KM_NUM': [40.0, 20.0, 10.0, 35.0],
+    })
+    return {
+        'df_dados': (dados, resolver_esquema(dados.columns, 'df_dados'), 'dados'),
+        'df_pagamento': (pagamento, resolver_esquema(pagamento.columns, 'df_pagamento'), 'pagamento'),
+    }
+
+
+@pytest.mark.parametrize('pergunta', [
+    "Quais são os benefícios de fazer mais exercícios?",
+    "me conta uma piada sobre os gatos",
+    "Explique mais sobre os planetas",
+    "Quantos planetas existem no sistema solar?",
+    "Quais as principais cidades do Brasil?",
+    "Qual a média de km que um carro faz por litro?",
+    "Quantos dias faltam para o natal?",
+    "Os resultados de hoje foram bons?",
+])
+def test_perguntas_gerais_nao_sao_roteadas(bases, pergunta):
+    assert RoteadorPerguntas().responder(pergunta, bases, hoje=HOJE) is None
+
+
+def test_contagem_de_ordens_com_filtros(bases):
+    resposta = RoteadorPerguntas().responder("Quantas ordens agendadas em Campinas?", bases, hoje=HOJE)
+    assert resposta is not None and resposta.intencao == 'contagem'
+    assert "**3**" in resposta.texto
+
+
+def test_contagem_com_o_s_abreviado(bases):
+    resposta = RoteadorPerguntas().responder("Quantas O.S. do cliente Beta?", bases, hoje=HOJE)
+    assert resposta is not None and "**3**" in resposta.texto
+
+
+def test_ranking_explicito_por_dimensao(bases):
+    resposta = RoteadorPerguntas().responder("top 2 cidades", bases, hoje=HOJE)
+    assert resposta is not None and resposta.intencao == 'contagem_por_cidade'
+    assert resposta.texto.index('Campinas') < resposta.texto.index('Santos')
+
+
+def test_ranking_com_mais_ordens(bases):
+    resposta = RoteadorPerguntas().responder("Quais RTs com mais ordens?", bases, hoje=HOJE)
+    assert resposta is not None and resposta.intencao == 'contagem_por_representante'
+
+
+def test_soma_de_metrica_por_dimensao(bases):
+    resposta = RoteadorPerguntas().responder("soma de pedágio por cidade", bases, hoje=HOJE)
+    assert resposta is not None and resposta.intencao == 'soma_por_cidade'
+    assert "12,50" in resposta.texto
+
+
+def test_periodo_hoje(bases):
+    resposta = RoteadorPerguntas().responder("quantos agendamentos hoje?", bases, hoje=HOJE)
+    assert resposta is not None and "**3**" in resposta.texto
+
+
+def test_media_de_coluna_sem_dimensao(bases):
+    resposta = RoteadorPerguntas().responder("média de deslocamento", bases, hoje=HOJE)
+    assert resposta is not None and resposta.intencao == 'media'
+    assert "26,2 km" in resposta.texto
+
+
+@pytest.mark.parametrize('pergunta', ["total de pedágio", "qual o valor total de pedágio"])
+def test_total_de_coluna_sem_dimensao(bases, pergunta):
+    resposta = RoteadorPerguntas().responder(pergunta, bases, hoje=HOJE)
+    assert resposta is not None and resposta.intencao == 'soma'
+    assert "17,50" in resposta.texto
+
+
+def test_metrica_sem_base_de_pagamento_vai_para_ia(bases):
+    assert RoteadorPerguntas().responder("média de deslocamento", {'df_dados': bases['df_dados']}, hoje=HOJE) is None
@@ -0,0 +1,61 @@
+import pandas as pd
+import pytest
+
+from sandbox import ExpressaoNaoPermitida, SandboxPandas, validar_expressao
+
+
+@pytest.mark.parametrize('expressao', [
+    "df['Status'].value_counts().head(10)",
+    "df.groupby('Cidade')['Valor'].agg(['sum', 'mean']).sort_values('sum', ascending=False)",
+    "df.groupby('Cidade').agg(total=('Valor', 'sum'), ordens=('OS', 'count'))",
+    "df[df['Data'].dt.month == 3]['Valor'].sum()",
+    "df[df['Cidade'].str.contains('camp', case=False, na=False)].shape[0]",
+    "pd.to_datetime(df['Data'], dayfirst=True).dt.year.value_counts().to_dict()",
+    "np.where(df['Valor'] > 10, 'alto', 'baixo')",
+    "pd.pivot_table(df, index='Cidade', values='Valor', aggfunc='sum')",
+    "len(df)",
+    "f\"{df['Valor'].sum():.2f}\"",
+])
+def test_expressoes_de_analise_sao_aceitas(expressao):
+    validar_expressao(expressao)
+
+
+@pytest.mark.parametrize('expressao', [
+    "pd.ExcelWriter('/tmp/x.xlsx')",
+    "pd.ExcelFile('/etc/passwd')",
+    "pd.HDFStore('/tmp/x.h5')",
+    "pd.read_csv('/etc/passwd')",
+    "df.to_numpy().dump('/tmp/x')",
+    "df.to_csv('/tmp/x.csv')",
+    "df.to_string('/tmp/x.txt')",
+    "'{0.__class__.__mro__}'.format(df)",
+    "str.format('{0.__class__}', df)",
+    "'{x}'.format_map(df)",
+    "df.agg('to_pickle', '/tmp/x.pkl')",
+    "df['Valor'].apply('to_pickle', args=('/tmp/x.pkl',))",
+    "df.groupby('Cidade').agg(total=('Valor', 'to_pickle'))",
+    "pd.pivot_table(df, index='Cidade', values='Valor', aggfunc='to_pickle')",
+    "df.eval('Valor * 2')",
+    "df.query('Valor > 1')",
+    "df.pipe(print)",
+    "np.save('/tmp/x.npy', df.to_numpy())",
+    "np.lib.format",
+    "df.__class__",
+    "df.style",
+    "__import__('os')",
+    "(lambda: 1)()",
+    "[x for x in df]",
+])
+def test_expressoes_perigosas_sao_recusadas(expressao):
+    with pytest.raises(ExpressaoNaoPermitida):
+        validar_expressao(expressao)
+
+
+def test_execucao_em_trabalhador(tmp_path):
+    df = pd.DataFrame({'Cidade': ['A', 'B', 'A'], 'Valor': [1.0, 2.0, 3.0]})
+    sandbox = SandboxPandas(trabalhadores=1, tempo_limite_s=60, pasta=str(tmp_path / 'sandbox'))
+    try:
+        resultado = sandbox.executar('teste', df, "df.groupby('Cidade')['Valor'].sum().to_dict()")
+    finally:
+        sandbox.encerrar()
+    assert resultado == {'A': 4.0, 'B': 2.0}
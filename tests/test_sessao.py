@@ -0,0 +1,39 @@
+import pandas as pd
+
+import sessao
+from sessao import relatorio_memoria_sessao
+
+
+def _estado():
+    return {
+        'df_dados': pd.DataFrame({'Status': ['Agendada', 'Cancelada'] * 50, 'OS': range(100)}),
+        'df_mapeamento': None,
+        'df_pagamento': pd.DataFrame({'OS': range(10)}),
+        'cubo_dashboard': pd.DataFrame({'Ordens': [1, 2]}),
+        'impressoes': {'df_dados': 'dados-1', 'df_pagamento': 'pagamento-1'},
+    }
+
+
+def test_mede_cada_base_uma_vez_por_impressao(monkeypatch):
+    chamadas = []
+    original = sessao.tamanho_dataframe
+    monkeypatch.setattr(sessao, 'tamanho_dataframe', lambda df: chamadas.append(len(df)) or original(df))
+    estado, medidas = _estado(), {}
+    primeiro = relatorio_memoria_sessao(estado, medidas)
+    assert primeiro['Base'].tolist() == ['df_dados', 'df_pagamento', 'cubo_dashboard']
+    assert primeiro['Linhas'].tolist() == [100, 10, 2]
+    assert len(chamadas) == 3
+    # Reruns seguintes reaproveitam as medidas.
+    pd.testing.assert_frame_equal(relatorio_memoria_sessao(estado, medidas), primeiro)
+    assert len(chamadas) == 3
+
+
+def test_base_nova_e_medida_e_a_antiga_sai_das_medidas():
+    estado, medidas = _estado(), {}
+    relatorio_memoria_sessao(estado, medidas)
+    estado['df_pagamento'] = pd.DataFrame({'OS': range(25)})
+    estado['impressoes']['df_pagamento'] = 'pagamento-2'
+    relatorio = relatorio_memoria_sessao(estado, medidas)
+    assert relatorio.set_index('Base').loc['df_pagamento', 'Linhas'] == 25
+    assert ('df_pagamento', 'pagamento-1') not in medidas
+    assert ('df_pagamento', 'pagamento-2') in medidas